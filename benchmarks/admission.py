@@ -0,0 +1,69 @@
+# Latency of the "may this user start a task" check done by the catch-all message
+# handler and unzip_cb, with 75 running tasks : legacy count + full find + scan
+# vs the in-process task table
+# Needs mongomock-motor (in-memory Motor stand-in) : pip install mongomock-motor
+# A real MongoDB adds a network round trip per query to the legacy numbers
+# Run from the repo root : python -m benchmarks.admission
+import asyncio
+import os
+import time
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from config import Config  # noqa: E402
+from unzipbot.helpers import database  # noqa: E402
+from unzipbot.helpers.tasks import TaskTable  # noqa: E402
+
+CALLS = 2000
+RUNNING = 75
+
+
+# Previous implementation, kept here for comparison
+async def legacy_may_start(uid):
+    if await database.count_ongoing_tasks() >= Config.MAX_CONCURRENT_TASKS:
+        ogtasks = await database.get_ongoing_tasks()
+
+        return any(uid == task.get("user_id") for task in ogtasks)
+
+    return True
+
+
+async def measure(check, uid):
+    start = time.perf_counter()
+
+    for _ in range(CALLS):
+        await check(uid)
+
+    return (time.perf_counter() - start) / CALLS * 1e6
+
+
+async def main():
+    Config.MAX_CONCURRENT_TASKS = RUNNING
+    database.ongoing_tasks = AsyncMongoMockClient()["bench"]["ongoing_tasks"]
+    table = TaskTable()
+
+    for user_id in range(1, RUNNING + 1):
+        await database.add_ongoing_task(
+            user_id=user_id, start_time=time.time(), task_type="extract"
+        )
+        table.add(user_id=user_id, start_time=time.time(), task_type="extract")
+
+    async def table_may_start(uid):
+        return table.may_start(uid)
+
+    for label, uid in (("running user", RUNNING), ("new user", RUNNING + 1)):
+        assert await legacy_may_start(uid) == table.may_start(uid)
+        legacy = await measure(legacy_may_start, uid)
+        current = await measure(table_may_start, uid)
+        print(
+            f"{label} ({RUNNING} tasks) : legacy {legacy:.1f} µs/update, "
+            f"task table {current:.2f} µs/update (x{legacy / current:.0f})"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+# Seeds N users in a throwaway database, then times check_user() before and after
+# ensure_indexes() — needs a real mongod, as in-memory stand-ins have no indexes
+# Run from the repo root :
+# MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.check_user 200000
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ["MONGODB_DBNAME"] = "unzipbot_bench_check_user"
+
+from unzipbot.helpers import database  # noqa: E402
+
+LOOKUPS = 200
+
+
+class FakeUser:
+    def __init__(self, uid):
+        self.id = uid
+
+
+class FakeMessage:
+    def __init__(self, uid):
+        self.from_user = FakeUser(uid)
+
+    async def continue_propagation(self):
+        pass
+
+
+async def time_check_user(users):
+    start = time.perf_counter()
+
+    for i in range(LOOKUPS):
+        # Bypass the in-process cache, we want to measure MongoDB
+        database.users_cache.clear()
+        database.banned_users_cache.clear()
+        await database.check_user(FakeMessage(uid=(i * 7919) % users))
+
+    return (time.perf_counter() - start) / LOOKUPS * 1000
+
+
+async def main(users):
+    await database.mongodb.drop_database(database.unzip_db.name)
+    batch = 10000
+
+    for start in range(0, users, batch):
+        await database.user_db.insert_many(
+            [{"user_id": uid} for uid in range(start, min(start + batch, users))]
+        )
+
+    await database.b_user_db.insert_many(
+        [{"banned_user_id": -uid} for uid in range(1, users // 100 + 2)]
+    )
+    print(f"Seeded {users} users")
+    print(f"check_user without indexes : {await time_check_user(users):.2f} ms")
+    await database.ensure_indexes()
+    print(f"check_user with indexes    : {await time_check_user(users):.2f} ms")
+    await database.mongodb.drop_database(database.unzip_db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
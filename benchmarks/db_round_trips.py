@@ -0,0 +1,191 @@
+# Counts MongoDB round trips per bot action, legacy find-then-write helpers vs
+# single upserts, and checks that concurrent upload counters don't lose updates
+# Needs mongomock-motor (in-memory Motor stand-in) : pip install mongomock-motor
+# Run from the repo root : python -m benchmarks.db_round_trips
+import asyncio
+import os
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from unzipbot.helpers import database  # noqa: E402
+
+COLLECTIONS = [
+    "b_user_db",
+    "bot_data",
+    "cancel_tasks",
+    "maintenance_mode",
+    "merge_tasks",
+    "mode_db",
+    "referrals",
+    "thumb_db",
+    "uploaded_db",
+    "user_db",
+    "vip_users",
+]
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.round_trips = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            self.round_trips += 1
+
+            return attr(*args, **kwargs)
+
+        return wrapper
+
+
+# Previous implementations, kept here for comparison
+async def legacy_update_uploaded(user_id, upload_count):
+    col = database.uploaded_db
+    is_exist = await col.find_one(filter={"_id": user_id})
+
+    if is_exist:
+        up_count = await col.find_one(filter={"_id": user_id})
+        new_count = up_count.get("uploaded_files") + upload_count
+        await asyncio.sleep(0)  # yield like a real network call would
+        await col.update_one(
+            filter={"_id": user_id}, update={"$set": {"uploaded_files": new_count}}
+        )
+    else:
+        await col.insert_one(document={"_id": user_id, "uploaded_files": upload_count})
+
+
+async def legacy_upsert(col, filter, fields):
+    is_exist = await col.find_one(filter=filter)
+
+    if is_exist:
+        await col.update_one(filter=filter, update={"$set": fields})
+    else:
+        await col.insert_one(document={**filter, **fields})
+
+
+async def legacy_update_thumb(user_id):
+    col = database.thumb_db
+    existing = await col.find_one(filter={"_id": user_id})
+
+    if existing:
+        await col.update_one(
+            filter={"_id": user_id}, update={"$set": {"file_id": existing.get("temp")}}
+        )
+        await col.update_one(filter={"_id": user_id}, update={"$unset": {"temp": ""}})
+
+        if existing.get("url") is not None:
+            await col.update_one(
+                filter={"_id": user_id}, update={"$unset": {"url": ""}}
+            )
+
+
+async def legacy_add_cancel_task(user_id):
+    col = database.cancel_tasks
+
+    if not await col.find_one(filter={"user_id": user_id}):
+        await col.insert_one(document={"user_id": user_id})
+
+
+async def legacy_del(col, filter):
+    if await col.find_one(filter=filter):
+        await col.delete_one(filter=filter)
+
+
+async def legacy_save_thumb():
+    await legacy_upsert(database.thumb_db, {"_id": 1}, {"temp": "x"})
+    await legacy_update_thumb(1)
+
+
+async def legacy_cancel():
+    await legacy_add_cancel_task(1)
+    await legacy_del(database.cancel_tasks, {"user_id": 1})
+
+
+async def save_thumb():
+    await database.update_temp_thumb(user_id=1, thumb_id="x")
+    await database.update_thumb(1)
+
+
+async def cancel():
+    await database.add_cancel_task(1)
+    await database.del_cancel_task(1)
+
+
+LEGACY = {
+    "upload finished": lambda: legacy_update_uploaded(1, 5),
+    "/mode": lambda: legacy_upsert(database.mode_db, {"_id": 1}, {"mode": "doc"}),
+    "/addthumb + save": legacy_save_thumb,
+    "boot": lambda: legacy_upsert(database.bot_data, {"boot": True}, {"time": 1}),
+    "/merge": lambda: legacy_upsert(
+        database.merge_tasks, {"user_id": 1}, {"message_id": 2}
+    ),
+    "cancel download": legacy_cancel,
+    "/maintenance": lambda: legacy_upsert(
+        database.maintenance_mode, {"maintenance": True}, {"val": True}
+    ),
+}
+
+CURRENT = {
+    "upload finished": lambda: database.update_uploaded(user_id=1, upload_count=5),
+    "/mode": lambda: database.set_upload_mode(user_id=1, mode="doc"),
+    "/addthumb + save": save_thumb,
+    "boot": lambda: database.set_boot(1),
+    "/merge": lambda: database.add_merge_task(user_id=1, message_id=2),
+    "cancel download": cancel,
+    "/maintenance": lambda: database.set_maintenance(True),
+}
+
+
+def reset_collections():
+    db = AsyncMongoMockClient()["bench"]
+    counters = {}
+
+    for name in COLLECTIONS:
+        counters[name] = CountingCollection(db[name])
+        setattr(database, name, counters[name])
+
+    return counters
+
+
+async def count_round_trips(action):
+    counters = reset_collections()
+    # Run twice : first call inserts, second call updates an existing document
+    await action()
+    first = sum(c.round_trips for c in counters.values())
+    await action()
+
+    return first, sum(c.round_trips for c in counters.values()) - first
+
+
+async def concurrent_uploads(update, tasks=50):
+    reset_collections()
+    await asyncio.gather(*(update() for _ in range(tasks)))
+
+    return await database.get_uploaded(1)
+
+
+async def main():
+    print(f"{'action':<22}{'legacy':>16}{'upsert':>16}")
+
+    for name, legacy in LEGACY.items():
+        before = await count_round_trips(legacy)
+        after = await count_round_trips(CURRENT[name])
+        print(f"{name:<22}{'%d / %d' % before:>16}{'%d / %d' % after:>16}")
+
+    print("(round trips on first call / on later calls)\n")
+    legacy_total = await concurrent_uploads(lambda: legacy_update_uploaded(1, 1))
+    total = await concurrent_uploads(lambda: database.update_uploaded(1, 1))
+    print(f"50 concurrent +1 uploads : legacy {legacy_total}, $inc {total}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
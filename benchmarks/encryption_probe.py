@@ -0,0 +1,90 @@
+# Time to know if an archive needs a password : full test (what `7z t` does, every
+# entry decompressed and checked) against reading only the headers
+# The fixture size can be raised for multi-GB runs : BENCH_SIZE_MB=4096
+# Run from the repo root : python -m benchmarks.encryption_probe
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from unzipbot.modules.ext_script.ext_helper import probe_encryption, test_with_7z_helper  # noqa: E402
+
+SIZE_MB = int(os.environ.get("BENCH_SIZE_MB", default="1024"))
+FILE_MB = 64
+
+
+def build_archive(workdir):
+    archive = f"{workdir}/bench.zip"
+    # Half random, half zeroes : deflate has some work to do both ways
+    block = os.urandom(512 * 1024) + bytes(512 * 1024)
+
+    with zipfile.ZipFile(
+        archive, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+    ) as z:
+        for i in range(max(SIZE_MB // FILE_MB, 1)):
+            with z.open(f"file_{i:03}.bin", mode="w", force_zip64=True) as f:
+                for _ in range(FILE_MB):
+                    f.write(block)
+
+    return archive
+
+
+def build_encrypted_archive(workdir):
+    archive = f"{workdir}/encrypted.zip"
+    source = f"{workdir}/secret.txt"
+
+    with open(file=source, mode="w") as f:
+        f.write("secret")
+
+    subprocess.run(["zip", "-q", "-j", "-P", "password", archive, source], check=True)
+
+    return archive
+
+
+def full_test(archive):
+    with zipfile.ZipFile(archive) as z:
+        return z.testzip() is None
+
+
+async def timed(label, func):
+    start = time.perf_counter()
+    result = await func()
+    print(f"{label:<28}{time.perf_counter() - start:>10.3f} s   {result}")
+
+
+async def main():
+    workdir = tempfile.mkdtemp()
+
+    try:
+        archive = build_archive(workdir)
+        print(
+            f"{os.path.getsize(archive) / 1024**2:.0f} MB archive, {SIZE_MB} MB of data"
+        )
+
+        if shutil.which("7z"):
+            await timed("7z t", lambda: test_with_7z_helper(archive))
+
+        await timed(
+            "full test (zipfile)", lambda: asyncio.to_thread(full_test, archive)
+        )
+        await timed("header probe", lambda: probe_encryption(archive_path=archive))
+
+        if shutil.which("zip"):
+            encrypted = build_encrypted_archive(workdir)
+            await timed(
+                "header probe, encrypted",
+                lambda: probe_encryption(archive_path=encrypted),
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
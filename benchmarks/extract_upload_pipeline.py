@@ -0,0 +1,84 @@
+# Wall time of extracting a 100 files archive then uploading everything, against
+# handing every extracted file to the uploaders as soon as it is written
+# Telegram is faked : every upload takes UPLOAD_LATENCY
+# Run from the repo root : python -m benchmarks.extract_upload_pipeline
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from types import SimpleNamespace
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from unzipbot.modules.ext_script.archive_engine import extract_entries, open_archive  # noqa: E402
+from unzipbot.modules.ext_script.pipeline import run_pipeline, upload_workers  # noqa: E402
+
+FILES = 100
+FILE_SIZE = 2 * 1024 * 1024
+UPLOAD_LATENCY = 0.05
+
+
+async def fake_upload(path):
+    await asyncio.sleep(UPLOAD_LATENCY)
+    os.remove(path)
+
+
+def build_archive(workdir):
+    archive = f"{workdir}/bench.zip"
+
+    with zipfile.ZipFile(archive, mode="w", compression=zipfile.ZIP_DEFLATED) as z:
+        for i in range(FILES):
+            z.writestr(f"file_{i:03}.bin", os.urandom(FILE_SIZE))
+
+    return archive
+
+
+async def sequential(archive, out):
+    engine = open_archive(archive)
+    paths = [path async for path in extract_entries(engine=engine, path=out)]
+
+    for path in paths:
+        await fake_upload(path)
+
+
+async def pipelined(archive, out, workers):
+    engine = open_archive(archive)
+
+    async def upload(index, path):
+        await fake_upload(path)
+
+    await run_pipeline(
+        source=extract_entries(engine=engine, path=out), handler=upload, workers=workers
+    )
+
+
+async def main():
+    workdir = tempfile.mkdtemp()
+    archive = build_archive(workdir)
+    workers = upload_workers(SimpleNamespace(max_concurrent_transmissions=3))
+
+    try:
+        for label, run in (
+            ("extract then upload", lambda out: sequential(archive, out)),
+            ("pipeline, 1 worker", lambda out: pipelined(archive, out, 1)),
+            (
+                f"pipeline, {workers} workers",
+                lambda out: pipelined(archive, out, workers),
+            ),
+        ):
+            out = f"{workdir}/out"
+            os.makedirs(name=out, exist_ok=True)
+            start = time.perf_counter()
+            await run(out)
+            print(f"{label:<22}{time.perf_counter() - start:>8.2f} s")
+            shutil.rmtree(out)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
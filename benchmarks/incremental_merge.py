@@ -0,0 +1,156 @@
+# Wall time of a /merge task : downloading every part, extracting then uploading,
+# against extracting and uploading the files while the next parts are downloading
+# Telegram is faked : every part takes PART_LATENCY to download, every file
+# UPLOAD_LATENCY to upload
+# Run from the repo root : python -m benchmarks.incremental_merge
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from types import SimpleNamespace
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from unzipbot.modules.ext_script.dl_helper import download_message  # noqa: E402
+from unzipbot.modules.ext_script.ext_helper import merge_files, stream_merge  # noqa: E402
+from unzipbot.modules.ext_script.pipeline import (  # noqa: E402
+    download_workers,
+    run_pipeline,
+    upload_workers,
+)
+
+FILES = 40
+FILE_SIZE = 1024 * 1024 * 2  # 2 MB
+PARTS = 8
+PART_LATENCY = 0.5
+UPLOAD_LATENCY = 0.1
+CLIENT = SimpleNamespace(max_concurrent_transmissions=3)
+
+
+class FakeMessage:
+    def __init__(self, source):
+        # A Telegram message holding one part, downloaded from a local copy
+        self.source = source
+        self.document = SimpleNamespace(
+            file_name=os.path.basename(source), file_size=os.path.getsize(source)
+        )
+
+    async def download(self, file_name, progress=None, progress_args=()):
+        await asyncio.sleep(PART_LATENCY)
+        # Pyrogram writes to a temporary file, renamed once complete
+        shutil.copyfile(src=self.source, dst=f"{file_name}.temp")
+        os.replace(src=f"{file_name}.temp", dst=file_name)
+
+        return file_name
+
+
+async def fake_upload(position, path):
+    await asyncio.sleep(UPLOAD_LATENCY)
+    os.remove(path)
+
+
+async def aiter_list(items):
+    for item in items:
+        yield item
+
+
+def build_parts(workdir):
+    archive = f"{workdir}/bench.zip"
+
+    with zipfile.ZipFile(archive, mode="w", compression=zipfile.ZIP_DEFLATED) as z:
+        for i in range(FILES):
+            z.writestr(f"file_{i:03}.bin", os.urandom(FILE_SIZE))
+
+    os.makedirs(name=f"{workdir}/chat")
+    size = -(-os.path.getsize(archive) // PARTS)
+    parts = []
+
+    with open(file=archive, mode="rb") as f:
+        for i in range(PARTS):
+            path = f"{workdir}/chat/bench.zip.{i + 1:03}"
+
+            with open(file=path, mode="wb") as part:
+                part.write(f.read(size))
+
+            parts.append(FakeMessage(source=path))
+
+    os.remove(archive)
+
+    return parts
+
+
+async def download(path, message):
+    await download_message(message=message, path=f"{path}/{message.document.file_name}")
+
+
+async def sequential(parts, path, out):
+    async def fetch(index, message):
+        await download(path=path, message=message)
+
+    await run_pipeline(
+        source=aiter_list(parts), handler=fetch, workers=download_workers(CLIENT)
+    )
+    volumes = [f"{path}/{message.document.file_name}" for message in parts]
+    await merge_files(
+        iinput=volumes[0], ooutput=out, file_type="volume", volumes=volumes
+    )
+    await run_pipeline(
+        source=aiter_list(sorted(os.listdir(out))),
+        handler=lambda position, name: fake_upload(position, f"{out}/{name}"),
+        workers=upload_workers(CLIENT),
+    )
+
+
+async def pipelined(parts, path, out):
+    async def fetch(volume_ready):
+        async def fetch_part(index, message):
+            await download(path=path, message=message)
+            volume_ready(index)
+
+        await run_pipeline(
+            source=aiter_list(parts),
+            handler=fetch_part,
+            workers=download_workers(CLIENT),
+        )
+
+    await run_pipeline(
+        source=stream_merge(
+            volumes=[f"{path}/{message.document.file_name}" for message in parts],
+            sizes=[message.document.file_size for message in parts],
+            download=fetch,
+            ooutput=out,
+            file_type="volume",
+        ),
+        handler=fake_upload,
+        workers=upload_workers(CLIENT),
+    )
+
+
+async def main():
+    workdir = tempfile.mkdtemp()
+    parts = build_parts(workdir)
+
+    try:
+        for label, run in (
+            ("download, extract, upload", sequential),
+            ("extract while downloading", pipelined),
+        ):
+            path = f"{workdir}/merge"
+            out = f"{workdir}/out"
+            os.makedirs(name=path)
+            os.makedirs(name=out)
+            start = time.perf_counter()
+            await run(parts, path, out)
+            print(f"{label:<28}{time.perf_counter() - start:>8.2f} s")
+            shutil.rmtree(path)
+            shutil.rmtree(out)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+# Micro-benchmark of Messages.get : per-call cost of the legacy implementation
+# (json.load on every call) vs the compiled in-memory catalog
+# Run from the repo root : python -m benchmarks.messages_get
+import json
+import os
+import timeit
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from unzipbot.i18n.messages import Messages  # noqa: E402
+
+CALLS = 20000
+BASE_PATH = "unzipbot/i18n/lang"
+
+
+def legacy_get(file, key, extra_args=[]):
+    with open(file=f"{BASE_PATH}/en.json", mode="r", encoding="utf-8") as f:
+        message = json.load(fp=f)[file][key.lower()]
+
+    if not isinstance(extra_args, list):
+        extra_args = [extra_args]
+
+    return message.format(*extra_args)
+
+
+def main():
+    messages = Messages(base_path=BASE_PATH)
+    cases = [
+        ("unzip_help", "PROCESSING", []),
+        ("unzip_help", "PROGRESS_MSG", ["Downloading", "[⬢⬢⬡⬡]"]),
+    ]
+
+    for file, key, args in cases:
+        assert legacy_get(file, key, args) == messages.get(file, key, extra_args=args)
+        legacy = timeit.timeit(lambda: legacy_get(file, key, args), number=CALLS)
+        catalog = timeit.timeit(
+            lambda: messages.get(file, key, extra_args=args), number=CALLS
+        )
+        print(
+            f"{file}.{key} : legacy {legacy / CALLS * 1e6:.2f} µs/call, "
+            f"catalog {catalog / CALLS * 1e6:.2f} µs/call "
+            f"(x{legacy / catalog:.0f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
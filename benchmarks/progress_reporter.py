@@ -0,0 +1,96 @@
+# Throughput of a simulated transfer loop (1 MB chunks) with progress disabled,
+# with the legacy inline progress edits, and with the background reporter
+# Telegram is faked : every edit takes EDIT_LATENCY, and one in FLOOD_EVERY
+# edits answers with a FloodWait
+# Run from the repo root : python -m benchmarks.progress_reporter
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from pyrogram import enums  # noqa: E402
+from pyrogram.errors import FloodWait  # noqa: E402
+
+from config import Config  # noqa: E402
+from unzipbot.helpers import unzip_help  # noqa: E402
+
+CHUNKS = 1200
+CHUNK_TIME = 0.01  # 100 MB/s link
+EDIT_LATENCY = 0.15
+FLOOD_EVERY = 5
+FLOOD_VALUE = 3
+
+
+class FakeMessage:
+    def __init__(self):
+        self.id = 1
+        self.chat = SimpleNamespace(id=1, type=enums.ChatType.PRIVATE)
+        self.edits = 0
+
+    async def edit(self, text=None, reply_markup=None):
+        await asyncio.sleep(EDIT_LATENCY)
+        self.edits += 1
+
+        if self.edits % FLOOD_EVERY == 0:
+            raise FloodWait(value=FLOOD_VALUE)
+
+
+# Previous implementation, kept here for comparison
+async def legacy_progress(current, total, message, start):
+    diff = time.time() - start
+
+    if round(number=diff % 10.00) == 0 or current == total:
+        text = unzip_help.render_progress(
+            current=current, total=total, start=start, uid=1
+        )
+
+        try:
+            await message.edit(text=text)
+        except FloodWait as f:
+            await asyncio.sleep(f.value)
+            await message.edit(text=text)
+
+
+async def reporter_progress(current, total, message, start):
+    await unzip_help.progress_for_pyrogram(
+        current=current,
+        total=total,
+        ud_type="bench",
+        message=message,
+        start=start,
+        unzip_bot=None,
+    )
+
+
+async def transfer(progress):
+    message = FakeMessage()
+    start = time.time()
+
+    for i in range(1, CHUNKS + 1):
+        await asyncio.sleep(CHUNK_TIME)
+
+        if progress is not None:
+            await progress(current=i, total=CHUNKS, message=message, start=start)
+
+    return CHUNKS / (time.time() - start), message.edits
+
+
+async def main():
+    Config.PROGRESS_INTERVAL = 1
+    unzip_help.messages.lang_fetcher = lambda _: Config.BASE_LANGUAGE
+
+    for label, progress in (
+        ("no progress", None),
+        ("legacy inline edits", legacy_progress),
+        ("background reporter", reporter_progress),
+    ):
+        speed, edits = await transfer(progress)
+        print(f"{label:<22}{speed:>8.1f} MB/s{edits:>6} edits")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+# Downloads a file from a local aiohttp server whose connections are throttled
+# (like most mirrors), over a single stream vs parallel byte ranges
+# The server drops one range connection halfway to exercise the resume path
+# Run from the repo root : python -m benchmarks.range_download
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+os.environ.setdefault("APP_ID", "0")
+os.environ.setdefault("BOT_OWNER", "0")
+os.environ.setdefault("LOGS_CHANNEL", "0")
+
+from aiohttp import ClientSession, web  # noqa: E402
+
+from config import Config  # noqa: E402
+from unzipbot.modules.ext_script.dl_helper import download_ranges  # noqa: E402
+
+SIZE = 1024 * 1024 * 64  # 64 MB
+CONNECTION_SPEED = 1024 * 1024 * 8  # 8 MB/s per connection
+BLOCK = 1024 * 64
+PAYLOAD = os.urandom(SIZE)
+
+
+def make_app():
+    dropped = {"done": False}
+
+    async def handler(request):
+        start, end = 0, SIZE - 1
+        status = 200
+
+        if request.http_range.start is not None:
+            start = request.http_range.start
+            end = (request.http_range.stop or SIZE) - 1
+            status = 206
+
+        resp = web.StreamResponse(status=status)
+        resp.headers["Accept-Ranges"] = "bytes"
+        resp.content_length = end - start + 1
+
+        if status == 206:
+            resp.headers["Content-Range"] = f"bytes {start}-{end}/{SIZE}"
+
+        await resp.prepare(request)
+        position = start
+
+        while position <= end:
+            block = PAYLOAD[position : min(position + BLOCK, end + 1)]
+
+            if status == 206 and not dropped["done"] and position - start > SIZE // 8:
+                dropped["done"] = True
+                request.transport.close()
+
+                return resp
+
+            await resp.write(block)
+            position += len(block)
+            await asyncio.sleep(len(block) / CONNECTION_SPEED)
+
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/file", handler)
+
+    return app
+
+
+async def single_stream(session, url, path):
+    async with session.get(url=url) as resp:
+        with open(path, "wb") as f:
+            async for chunk in resp.content.iter_chunked(Config.CHUNK_SIZE):
+                f.write(chunk)
+
+
+def sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+async def main():
+    runner = web.AppRunner(make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/file"
+    expected = hashlib.sha256(PAYLOAD).hexdigest()
+    Config.DL_RANGE_MIN_SIZE = 1024 * 1024 * 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "file")
+
+        async with ClientSession() as session:
+            start = time.perf_counter()
+            await single_stream(session=session, url=url, path=path)
+            single = time.perf_counter() - start
+            assert sha256(path) == expected
+            print(f"single stream : {single:.2f} s ({SIZE / single / 1e6:.1f} MB/s)")
+
+            for connections in (4, 8):
+                start = time.perf_counter()
+                await download_ranges(
+                    session=session,
+                    url=url,
+                    path=path,
+                    total_size=SIZE,
+                    connections=connections,
+                )
+                ranged = time.perf_counter() - start
+                assert sha256(path) == expected
+                print(
+                    f"{connections} ranges : {ranged:.2f} s "
+                    f"({SIZE / ranged / 1e6:.1f} MB/s, x{single / ranged:.1f})"
+                )
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,33 +6,101 @@ import psutil
 class Config:
     APP_ID = int(os.environ.get("APP_ID"))
     API_HASH = os.environ.get("API_HASH")
+    # Archives already sent, answered again from their Telegram file IDs
+    ARCHIVE_CACHE_SIZE = 1000
+    ARCHIVE_CACHE_TTL = 7 * 24 * 60 * 60  # 7 days (in seconds)
     BASE_LANGUAGE = os.environ.get("BASE_LANGUAGE", default="en")
     BOT_TOKEN = os.environ.get("BOT_TOKEN")
     BOT_THUMB = f"{os.path.dirname(__file__)}/bot_thumb.jpg"
     BOT_OWNER = int(os.environ.get("BOT_OWNER"))
+    # Mirror cancellation requests to MongoDB, only useful with several instances
+    CANCEL_TASKS_MIRROR = False
+    CANCEL_TASKS_SYNC_INTERVAL = 2  # seconds
+    CANCEL_TASKS_TTL = 10 * 60  # 10 minutes (in seconds)
     # Default chunk size (0.005 MB → 1024*6) Increase if you need faster downloads
     CHUNK_SIZE = 1024 * 1024 * 10  # 10 MB
+    # In-process cache of per-user settings read from MongoDB
+    DB_CACHE_SIZE = 50000
+    DB_CACHE_TTL = 10 * 60  # 10 minutes (in seconds)
+    # Parallel range downloads of URLs, for servers that accept them
+    DL_CONNECTIONS = 8
+    DL_RANGE_CHUNK = 1024 * 1024  # 1 MB
+    DL_RANGE_MIN_SIZE = 1024 * 1024 * 16  # 16 MB, smallest range worth a connection
+    DL_READ_TIMEOUT = 60  # seconds without data before a range is resumed
+    DL_RETRIES = 5
     DOWNLOAD_LOCATION = f"{os.path.dirname(__file__)}/Downloaded"
+    # Shared aiohttp connection pool
+    HTTP_DNS_CACHE_TTL = 5 * 60  # 5 minutes (in seconds)
+    HTTP_KEEPALIVE_TIMEOUT = 60  # seconds
+    HTTP_POOL_SIZE = 100
+    HTTP_POOL_SIZE_PER_HOST = 16
+    # Read zip / tar (and libarchive formats if installed) without spawning 7z
+    IN_PROCESS_EXTRACTION = True
     IS_HEROKU = os.environ.get("DYNO", default="").startswith("worker.")
+    # Show the files of an archive from its listing, and only extract what is asked for
+    LIST_BEFORE_EXTRACT = True
     LOCKFILE = "/tmp/unzipbot.lock"
     LOGS_CHANNEL = (
         int(os.environ.get("LOGS_CHANNEL"))
         if os.environ.get("LOGS_CHANNEL").strip("-").isdigit()
         else os.environ.get("LOGS_CHANNEL")
     )
+    # Tasks running at once before new ones are told they'll wait in the scheduler's
+    # lanes (they're still admitted)
     MAX_CONCURRENT_TASKS = 75
     MAX_MESSAGE_LENGTH = 4096
     MAX_CPU_CORES_COUNT = psutil.cpu_count(logical=False)
     MAX_CPU_USAGE = 80
+    # Simultaneous 7z / unrar / zstd processes
+    MAX_EXTRACT_JOBS = MAX_CPU_CORES_COUNT or 1
     # 512 MB by default for Heroku, unlimited otherwise
     MAX_RAM_AMOUNT_KB = 1024 * 512 if IS_HEROKU else -1
     MAX_RAM_USAGE = 80
+    # Simultaneous splits of files bigger than TG_MAX_SIZE (disk bound)
+    MAX_SPLIT_JOBS = 2
     MAX_TASK_DURATION_EXTRACT = 120 * 60  # 2 hours (in seconds)
+    # Extra time after which MongoDB drops a task that was never cleaned up
+    MAX_TASK_DURATION_GRACE = 60 * 60  # 1 hour (in seconds)
     MAX_TASK_DURATION_MERGE = 240 * 60  # 4 hours (in seconds)
+    # Simultaneous downloads and uploads
+    MAX_TRANSFER_JOBS = 20
+    # Parts of a /merge task downloaded at the same time
+    MERGE_DL_WORKERS = 4
+    # Split zips and tarballs of a /merge task are extracted and uploaded while their
+    # parts download, the files that need splitting are offered once it's done
+    MERGE_PIPELINED = False
+    # Threads reading the parts of those merges (one per merge), and how long a read
+    # waits for a part before giving up
+    MERGE_STREAM_THREADS = 4
+    MERGE_STREAM_TIMEOUT = 30 * 60  # 30 minutes (in seconds)
     # Files under that size will not display a progress bar while uploading
     MIN_SIZE_PROGRESS = 1024 * 1024 * 50  # 50 MB
     MONGODB_URL = os.environ.get("MONGODB_URL")
     MONGODB_DBNAME = os.environ.get("MONGODB_DBNAME", default="Unzipper_Bot")
+    # Other instances use the same database, their ongoing tasks must be left alone
+    MONGODB_SHARED = False
+    # Files and folders per page of the file picker
+    PICKER_PAGE_SIZE = 20
+    # Progress messages are edited at most every PROGRESS_INTERVAL seconds, slowing
+    # down to PROGRESS_MAX_INTERVAL when Telegram answers with FloodWait
+    PROGRESS_IDLE_TIMEOUT = 5 * 60  # 5 minutes (in seconds)
+    PROGRESS_INTERVAL = 5  # seconds
+    PROGRESS_MAX_INTERVAL = 60  # seconds
+    # Split files bigger than TG_MAX_SIZE in raw parts (.001, .002, …) read in place,
+    # instead of writing them again as 7z volumes
+    # 7z volumes are uploaded as they're written (the first one once 7z is done),
+    # SPLIT_AHEAD of them at most on disk
+    SPLIT_AHEAD = 2
+    SPLIT_RANGES = True
+    # Delay between two reconciliations of the task table with MongoDB
+    TASKS_SYNC_INTERVAL = 60  # seconds
     TG_MAX_SIZE = 2097152000
     THUMB_LOCATION = f"{os.path.dirname(__file__)}/Thumbnails"
+    # Uploads : files extracted ahead of the uploaders, tries per file, and simultaneous
+    # uploads per task (capped by the client's max_concurrent_transmissions)
+    # UPLOAD_ORDERED keeps the archive order in the chat, files then go one at a time
+    UPLOAD_ORDERED = False
+    UPLOAD_QUEUE_SIZE = 4
+    UPLOAD_RETRIES = 3
+    UPLOAD_WORKERS = 3
     VERSION = os.environ.get("UNZIPBOT_VERSION", default="7.3.0")
@@ -8,7 +8,9 @@ from pyrogram import idle
 from config import Config
 
 from . import LOGGER, unzipbot_client
-from .helpers.database import get_lang
+from .helpers.archive_cache import archive_cache
+from .helpers.database import ensure_indexes, get_lang
+from .helpers.http_client import close_session, create_session, get_http_stats
 from .helpers.start import (
     check_logs,
     dl_thumbs,
@@ -28,6 +30,28 @@ async def async_shutdown_bot():
     tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
     [task.cancel() for task in tasks]
     await asyncio.gather(*tasks, return_exceptions=True)
+    http_stats = get_http_stats()
+    LOGGER.info(
+        msg=messages.get(
+            file="main",
+            key="HTTP_STATS",
+            extra_args=[http_stats["opened"], http_stats["reused"]],
+        )
+    )
+    await close_session()
+    cache_stats = archive_cache.stats()
+    LOGGER.info(
+        msg=messages.get(
+            file="main",
+            key="ARCHIVE_CACHE_STATS",
+            extra_args=[
+                cache_stats["entries"],
+                cache_stats["hits"],
+                cache_stats["misses"],
+                cache_stats["evictions"],
+            ],
+        )
+    )
 
     try:
         await unzipbot_client.send_message(
@@ -84,6 +108,7 @@ async def main():
             lock_f.close()
 
         LOGGER.info(msg=messages.get(file="main", key="STARTING_BOT"))
+        create_session()
         await unzipbot_client.start()
         starttime = time.strftime("%Y/%m/%d - %H:%M:%S")
         await unzipbot_client.send_message(
@@ -97,6 +122,9 @@ async def main():
             LOGGER.info(msg=messages.get(file="main", key="LOG_CHECKED"))
             setup_signal_handlers()
             await remove_expired_tasks(True)
+            # Tasks collections were just emptied, unique indexes can't fail on them
+            LOGGER.info(msg=messages.get(file="main", key="ENSURE_INDEXES"))
+            await ensure_indexes()
             await dl_thumbs()
             await start_cron_jobs()
             os.remove(path=Config.LOCKFILE)
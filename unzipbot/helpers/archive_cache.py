@@ -0,0 +1,137 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class CachedArchive:
+    __slots__ = ("key", "files", "created", "complete")
+
+    def __init__(self, key):
+        """
+        What an archive gave once it was extracted and uploaded
+
+        :param key: Telegram file_unique_id, or "sha256:<hex>" for URL downloads
+        """
+        self.key = key
+        self.files = {}  # path inside the archive → (size, [file_id of each part])
+        self.created = time.monotonic()
+        self.complete = False
+
+    def listing(self):
+        return [(path, size) for path, (size, _) in self.files.items()]
+
+
+class ArchiveCache:
+    def __init__(self, max_entries, ttl):
+        """
+        LRU cache of the archives already sent, so that repeats skip every step
+
+        :param max_entries: Archives kept before the least recently used is dropped
+        :param ttl: Seconds after which an entry is considered stale
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __fresh(self, key):
+        entry = self.entries.get(key)
+
+        if entry is not None and time.monotonic() - entry.created > self.ttl:
+            del self.entries[key]
+            self.evictions += 1
+
+            return None
+
+        return entry
+
+    def get(self, key):
+        """
+        Look up an archive that was fully uploaded before
+
+        :param key: The archive's cache key
+        :return: The CachedArchive, or None (counted as a miss)
+        """
+        entry = self.__fresh(key) if key else None
+
+        if entry is None or not entry.complete:
+            self.misses += 1
+
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return entry
+
+    def record(self, key, path, size, file_ids):
+        entry = self.__fresh(key)
+
+        if entry is None:
+            entry = self.entries[key] = CachedArchive(key=key)
+
+        entry.files[path] = (size, file_ids)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def complete(self, key, count):
+        # Only archives whose every file was sent can answer a repeat by themselves
+        entry = self.entries.get(key)
+
+        if entry is not None and len(entry.files) == count:
+            entry.complete = True
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(number=self.hits * 100 / lookups, ndigits=1)
+            if lookups
+            else 0,
+        }
+
+
+archive_cache = ArchiveCache(
+    max_entries=Config.ARCHIVE_CACHE_SIZE, ttl=Config.ARCHIVE_CACHE_TTL
+)
+
+
+def file_digest(path):
+    """
+    SHA-256 of a downloaded file, the cache key of archives coming from URLs
+
+    :param path: Path to the file
+    :return: "sha256:<hex digest>"
+    """
+    digest = hashlib.sha256()
+
+    with open(file=path, mode="rb") as f:
+        while chunk := f.read(Config.CHUNK_SIZE):
+            digest.update(chunk)
+
+    return f"sha256:{digest.hexdigest()}"
+
+
+def sent_file_id(message):
+    # Whatever send_file used (document, audio, video or photo)
+    media = getattr(message, "document", None) or getattr(message, "audio", None)
+    media = media or getattr(message, "video", None) or getattr(message, "photo", None)
+
+    return media.file_id if media is not None else None
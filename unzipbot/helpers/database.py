@@ -1,11 +1,15 @@
 from asyncio import sleep
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from time import monotonic
 
 import base58check
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from pyrogram.errors import FloodPremiumWait, FloodWait
 
 from config import Config
-from unzipbot import unzipbot_client
+from unzipbot import LOGGER, unzipbot_client
 from unzipbot.i18n.messages import Messages
 
 mongodb = AsyncIOMotorClient(host=Config.MONGODB_URL)
@@ -18,39 +22,122 @@ def get_lang(user_id):
 
 messages = Messages(lang_fetcher=get_lang)
 
+
+# In-process cache for the settings read on every update
+class TTLCache:
+    MISSING = object()
+
+    def __init__(self, name, maxsize=Config.DB_CACHE_SIZE, ttl=Config.DB_CACHE_TTL):
+        """
+        Bounded LRU cache whose entries expire after a fixed time
+
+        :param name: Name of the cache (used in the stats)
+        :param maxsize: Maximum number of entries kept
+        :param ttl: Lifetime of an entry in seconds
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.data.get(key)
+
+        if entry is None or entry[0] < monotonic():
+            self.data.pop(key, None)
+            self.misses += 1
+
+            return self.MISSING
+
+        self.data.move_to_end(key)
+        self.hits += 1
+
+        return entry[1]
+
+    def set(self, key, value):
+        self.data[key] = (monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        # IDs come both as int and str depending on the caller
+        for variant in (key, str(key)):
+            self.data.pop(variant, None)
+
+        if isinstance(key, str) and key.lstrip("-").isdigit():
+            self.data.pop(int(key), None)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
+
+
+upload_mode_cache = TTLCache(name="upload_mode")
+thumb_cache = TTLCache(name="thumb")
+users_cache = TTLCache(name="users")
+banned_users_cache = TTLCache(name="banned_users")
+maintenance_cache = TTLCache(name="maintenance")
+vip_cache = TTLCache(name="vip")
+
+
+def get_cache_stats():
+    return {
+        cache.name: cache.stats()
+        for cache in (
+            upload_mode_cache,
+            thumb_cache,
+            users_cache,
+            banned_users_cache,
+            maintenance_cache,
+            vip_cache,
+        )
+    }
+
+
 # Users Database
 user_db = unzip_db["users_db"]
 
 
 async def add_user(user_id):
     new_user_id = int(user_id)
-    is_exist = await user_db.find_one(filter={"user_id": new_user_id})
+    result = await user_db.update_one(
+        filter={"user_id": new_user_id},
+        update={"$setOnInsert": {"user_id": new_user_id}},
+        upsert=True,
+    )
+    users_cache.set(new_user_id, True)
 
-    if is_exist is not None and is_exist:
+    if result.upserted_id is None:
         return -1
 
-    await user_db.insert_one(document={"user_id": new_user_id})
-
 
 async def del_user(user_id):
     del_user_id = int(user_id)
-    is_exist = await user_db.find_one(filter={"user_id": del_user_id})
-
-    if is_exist is not None and is_exist:
-        await user_db.delete_one(filter={"user_id": del_user_id})
+    result = await user_db.delete_one(filter={"user_id": del_user_id})
+    users_cache.invalidate(del_user_id)
 
-    else:
+    if result.deleted_count == 0:
         return -1
 
 
 async def is_user_in_db(user_id):
     u_id = int(user_id)
-    is_exist = await user_db.find_one(filter={"user_id": u_id})
+    cached = users_cache.get(u_id)
 
-    if is_exist is not None and is_exist:
-        return True
+    if cached is not TTLCache.MISSING:
+        return cached
 
-    return False
+    is_exist = await user_db.find_one(filter={"user_id": u_id})
+    in_db = bool(is_exist is not None and is_exist)
+    users_cache.set(u_id, in_db)
+
+    return in_db
 
 
 async def count_users():
@@ -63,38 +150,65 @@ async def get_users_list():
     return [users_list async for users_list in user_db.find({})]
 
 
+async def iter_user_ids(batch_size=1000):
+    # Paged on _id, a broadcast waiting on FloodWait would outlive an idle cursor
+    last_id = None
+
+    while True:
+        users = await user_db.find(
+            {} if last_id is None else {"_id": {"$gt": last_id}},
+            projection={"_id": 1, "user_id": 1},
+            sort=[("_id", 1)],
+            limit=batch_size,
+        ).to_list(length=batch_size)
+
+        for user in users:
+            yield user["user_id"]
+
+        if len(users) < batch_size:
+            return
+
+        last_id = users[-1]["_id"]
+
+
 # Banned users database
 b_user_db = unzip_db["banned_users_db"]
 
 
 async def add_banned_user(user_id):
     new_user_id = int(user_id)
-    is_exist = await b_user_db.find_one(filter={"banned_user_id": new_user_id})
+    result = await b_user_db.update_one(
+        filter={"banned_user_id": new_user_id},
+        update={"$setOnInsert": {"banned_user_id": new_user_id}},
+        upsert=True,
+    )
+    banned_users_cache.set(new_user_id, True)
 
-    if is_exist is not None and is_exist:
+    if result.upserted_id is None:
         return -1
 
-    await b_user_db.insert_one(document={"banned_user_id": new_user_id})
-
 
 async def del_banned_user(user_id):
     del_user_id = int(user_id)
-    is_exist = await b_user_db.find_one(filter={"banned_user_id": del_user_id})
+    result = await b_user_db.delete_one(filter={"banned_user_id": del_user_id})
+    banned_users_cache.invalidate(del_user_id)
 
-    if is_exist is not None and is_exist:
-        await b_user_db.delete_one(filter={"banned_user_id": del_user_id})
-    else:
+    if result.deleted_count == 0:
         return -1
 
 
 async def is_user_in_bdb(user_id):
     u_id = int(user_id)
-    is_exist = await b_user_db.find_one(filter={"banned_user_id": u_id})
+    cached = banned_users_cache.get(u_id)
 
-    if is_exist is not None and is_exist:
-        return True
+    if cached is not TTLCache.MISSING:
+        return cached
 
-    return False
+    is_exist = await b_user_db.find_one(filter={"banned_user_id": u_id})
+    is_banned = bool(is_exist is not None and is_exist)
+    banned_users_cache.set(u_id, is_banned)
+
+    return is_banned
 
 
 async def count_banned_users():
@@ -107,6 +221,13 @@ async def get_banned_users_list():
     return [banned_users_list async for banned_users_list in b_user_db.find({})]
 
 
+async def iter_banned_user_ids(batch_size=1000):
+    async for user in b_user_db.find(
+        {}, projection={"_id": 0, "banned_user_id": 1}, batch_size=batch_size
+    ):
+        yield user["banned_user_id"]
+
+
 async def check_user(message):
     # Checking if user is banned
     uid = message.from_user.id
@@ -206,14 +327,8 @@ async def check_user(message):
 
 
 async def get_all_users():
-    users = []
-    banned = []
-
-    for i in range(await count_users()):
-        users.append((await get_users_list())[i]["user_id"])
-
-    for j in range(await count_banned_users()):
-        banned.append((await get_banned_users_list())[j]["banned_user_id"])
+    users = [user_id async for user_id in iter_user_ids()]
+    banned = [user_id async for user_id in iter_banned_user_ids()]
 
     return users, banned
 
@@ -223,23 +338,24 @@ mode_db = unzip_db["ulmode_db"]
 
 
 async def set_upload_mode(user_id, mode):
-    is_exist = await mode_db.find_one(filter={"_id": user_id})
-
-    if is_exist is not None and is_exist:
-        await mode_db.update_one(
-            filter={"_id": user_id}, update={"$set": {"mode": mode}}
-        )
-    else:
-        await mode_db.insert_one(document={"_id": user_id, "mode": mode})
+    await mode_db.update_one(
+        filter={"_id": user_id}, update={"$set": {"mode": mode}}, upsert=True
+    )
+    upload_mode_cache.invalidate(user_id)
+    upload_mode_cache.set(user_id, mode)
 
 
 async def get_upload_mode(user_id):
-    umode = await mode_db.find_one(filter={"_id": user_id})
+    cached = upload_mode_cache.get(user_id)
 
-    if umode is not None and umode:
-        return umode.get("mode")
+    if cached is not TTLCache.MISSING:
+        return cached
 
-    return "media"
+    umode = await mode_db.find_one(filter={"_id": user_id})
+    mode = umode.get("mode") if umode is not None and umode else "media"
+    upload_mode_cache.set(user_id, mode)
+
+    return mode
 
 
 # Db for how many files user uploaded
@@ -256,17 +372,11 @@ async def get_uploaded(user_id):
 
 
 async def update_uploaded(user_id, upload_count):
-    is_exist = await uploaded_db.find_one(filter={"_id": user_id})
-
-    if is_exist is not None and is_exist:
-        new_count = await get_uploaded(user_id) + upload_count
-        await uploaded_db.update_one(
-            filter={"_id": user_id}, update={"$set": {"uploaded_files": new_count}}
-        )
-    else:
-        await uploaded_db.insert_one(
-            document={"_id": user_id, "uploaded_files": upload_count}
-        )
+    await uploaded_db.update_one(
+        filter={"_id": user_id},
+        update={"$inc": {"uploaded_files": upload_count}},
+        upsert=True,
+    )
 
 
 # DB for thumbnails
@@ -274,42 +384,35 @@ thumb_db = unzip_db["thumb_db"]
 
 
 async def get_thumb(user_id):
-    existing = await thumb_db.find_one(filter={"_id": user_id})
-
-    if existing is not None and existing:
-        return existing
-
-    return None
+    cached = thumb_cache.get(user_id)
 
+    if cached is not TTLCache.MISSING:
+        return cached
 
-async def update_temp_thumb(user_id, thumb_id):
     existing = await thumb_db.find_one(filter={"_id": user_id})
+    thumb = existing if existing is not None and existing else None
+    thumb_cache.set(user_id, thumb)
 
-    if existing is not None and existing:
-        await thumb_db.update_one(
-            filter={"_id": user_id}, update={"$set": {"temp": thumb_id}}
-        )
-    else:
-        await thumb_db.insert_one(document={"_id": user_id, "temp": thumb_id})
+    return thumb
 
 
-async def update_thumb(user_id):
-    existing = await thumb_db.find_one(filter={"_id": user_id})
+async def update_temp_thumb(user_id, thumb_id):
+    await thumb_db.update_one(
+        filter={"_id": user_id}, update={"$set": {"temp": thumb_id}}, upsert=True
+    )
+    thumb_cache.invalidate(user_id)
 
-    if existing is not None and existing:
-        await thumb_db.update_one(
-            filter={"_id": user_id}, update={"$set": {"file_id": existing.get("temp")}}
-        )
-        await thumb_db.update_one(
-            filter={"_id": user_id}, update={"$unset": {"temp": ""}}
-        )
 
-        if existing.get("url") is not None:
-            await thumb_db.update_one(
-                filter={"_id": user_id}, update={"$unset": {"url": ""}}
-            )
-    else:
-        return
+async def update_thumb(user_id):
+    # Promote the temporary thumbnail server-side, in a single update
+    await thumb_db.update_one(
+        filter={"_id": user_id},
+        update=[
+            {"$set": {"file_id": {"$ifNull": ["$temp", None]}}},
+            {"$project": {"temp": 0, "url": 0}},
+        ],
+    )
+    thumb_cache.invalidate(user_id)
 
 
 async def get_thumb_users():
@@ -326,6 +429,7 @@ async def get_thumb_users():
             and "url" not in thumb_list
         ):
             await thumb_db.delete_one(filter={"_id": thumb_list["_id"]})
+            thumb_cache.invalidate(thumb_list["_id"])
         else:
             thumb_users.append(thumb_list)
 
@@ -340,12 +444,8 @@ async def count_thumb_users():
 
 async def del_thumb_db(user_id):
     del_thumb_id = int(user_id)
-    is_exist = await thumb_db.find_one(filter={"_id": del_thumb_id})
-
-    if is_exist is not None and is_exist:
-        await thumb_db.delete_one(filter={"_id": del_thumb_id})
-    else:
-        return
+    await thumb_db.delete_one(filter={"_id": del_thumb_id})
+    thumb_cache.invalidate(del_thumb_id)
 
 
 # DB for bot data
@@ -362,25 +462,15 @@ async def get_boot():
 
 
 async def set_boot(boottime):
-    is_exist = await bot_data.find_one(filter={"boot": True})
-
-    if is_exist is not None and is_exist:
-        await bot_data.update_one(
-            filter={"boot": True}, update={"$set": {"time": boottime}}
-        )
-    else:
-        await bot_data.insert_one(document={"boot": True, "time": boottime})
+    await bot_data.update_one(
+        filter={"boot": True}, update={"$set": {"time": boottime}}, upsert=True
+    )
 
 
 async def set_old_boot(boottime):
-    is_exist = await bot_data.find_one(filter={"old_boot": True})
-
-    if is_exist is not None and is_exist:
-        await bot_data.update_one(
-            filter={"old_boot": True}, update={"$set": {"time": boottime}}
-        )
-    else:
-        await bot_data.insert_one(document={"old_boot": True, "time": boottime})
+    await bot_data.update_one(
+        filter={"old_boot": True}, update={"$set": {"time": boottime}}, upsert=True
+    )
 
 
 async def get_old_boot():
@@ -393,14 +483,15 @@ async def get_old_boot():
 
 
 async def is_boot_different():
-    different = True
-    is_exist = await bot_data.find_one(filter={"boot": True})
-    is_exist_old = await bot_data.find_one(filter={"old_boot": True})
+    boots = [
+        boot
+        async for boot in bot_data.find({"$or": [{"boot": True}, {"old_boot": True}]})
+    ]
+    times = {
+        "boot" if boot.get("boot") else "old_boot": boot.get("time") for boot in boots
+    }
 
-    if is_exist and is_exist_old and is_exist.get("time") == is_exist_old.get("time"):
-        different = False
-
-    return different
+    return not (len(times) == 2 and times["boot"] == times["old_boot"])
 
 
 # DB for ongoing tasks
@@ -418,18 +509,26 @@ async def count_ongoing_tasks():
 
 
 async def add_ongoing_task(user_id, start_time, task_type):
-    await ongoing_tasks.insert_one(
-        document={"user_id": user_id, "start_time": start_time, "type": task_type}
+    task = {"user_id": user_id, "start_time": start_time, "type": task_type}
+
+    if user_id != Config.BOT_OWNER:
+        max_duration = (
+            Config.MAX_TASK_DURATION_MERGE
+            if task_type == "merge"
+            else Config.MAX_TASK_DURATION_EXTRACT
+        )
+        # Picked up by the TTL index, remove_expired_tasks() should run first
+        task["expire_at"] = datetime.fromtimestamp(
+            start_time + max_duration + Config.MAX_TASK_DURATION_GRACE, tz=timezone.utc
+        )
+
+    await ongoing_tasks.replace_one(
+        filter={"user_id": user_id}, replacement=task, upsert=True
     )
 
 
 async def del_ongoing_task(user_id):
-    is_exist = await ongoing_tasks.find_one(filter={"user_id": user_id})
-
-    if is_exist is not None and is_exist:
-        await ongoing_tasks.delete_one(filter={"user_id": user_id})
-    else:
-        return
+    await ongoing_tasks.delete_one(filter={"user_id": user_id})
 
 
 async def clear_ongoing_tasks():
@@ -451,17 +550,22 @@ async def count_cancel_tasks():
 
 
 async def add_cancel_task(user_id):
-    if not await get_cancel_task(user_id):
-        await cancel_tasks.insert_one(document={"user_id": user_id})
+    # Picked up by the TTL index if no instance acknowledges it
+    await cancel_tasks.update_one(
+        filter={"user_id": user_id},
+        update={
+            "$set": {
+                "expire_at": datetime.now(tz=timezone.utc)
+                + timedelta(seconds=Config.CANCEL_TASKS_TTL)
+            },
+            "$setOnInsert": {"user_id": user_id},
+        },
+        upsert=True,
+    )
 
 
 async def del_cancel_task(user_id):
-    is_exist = await cancel_tasks.find_one(filter={"user_id": user_id})
-
-    if is_exist is not None and is_exist:
-        await cancel_tasks.delete_one(filter={"user_id": user_id})
-    else:
-        return
+    await cancel_tasks.delete_one(filter={"user_id": user_id})
 
 
 async def get_cancel_task(user_id):
@@ -489,23 +593,15 @@ async def count_merge_tasks():
 
 
 async def add_merge_task(user_id, message_id):
-    if not await get_merge_task(user_id):
-        await merge_tasks.insert_one(
-            document={"user_id": user_id, "message_id": message_id}
-        )
-    else:
-        await merge_tasks.update_one(
-            filter={"user_id": user_id}, update={"$set": {"message_id": message_id}}
-        )
+    await merge_tasks.update_one(
+        filter={"user_id": user_id},
+        update={"$set": {"message_id": message_id}},
+        upsert=True,
+    )
 
 
 async def del_merge_task(user_id):
-    is_exist = await merge_tasks.find_one(filter={"user_id": user_id})
-
-    if is_exist is not None and is_exist:
-        await merge_tasks.delete_one(filter={"user_id": user_id})
-    else:
-        return
+    await merge_tasks.delete_one(filter={"user_id": user_id})
 
 
 async def get_merge_task(user_id):
@@ -532,23 +628,23 @@ maintenance_mode = unzip_db["maintenance_mode"]
 
 
 async def get_maintenance():
-    maintenance = await maintenance_mode.find_one(filter={"maintenance": True})
+    cached = maintenance_cache.get("maintenance")
 
-    if maintenance is not None and maintenance:
-        return maintenance.get("val")
+    if cached is not TTLCache.MISSING:
+        return cached
 
-    return False
+    maintenance = await maintenance_mode.find_one(filter={"maintenance": True})
+    val = maintenance.get("val") if maintenance is not None and maintenance else False
+    maintenance_cache.set("maintenance", val)
 
+    return val
 
-async def set_maintenance(val):
-    is_exist = await maintenance_mode.find_one(filter={"maintenance": True})
 
-    if is_exist is not None and is_exist:
-        await maintenance_mode.update_one(
-            filter={"maintenance": True}, update={"$set": {"val": val}}
-        )
-    else:
-        await maintenance_mode.insert_one(document={"maintenance": True, "val": val})
+async def set_maintenance(val):
+    await maintenance_mode.update_one(
+        filter={"maintenance": True}, update={"$set": {"val": val}}, upsert=True
+    )
+    maintenance_cache.set("maintenance", val)
 
 
 # DB for VIP users
@@ -570,32 +666,10 @@ async def add_vip_user(
     referral,
     lifetime,
 ):
-    is_exist = await vip_users.find_one(filter={"_id": uid})
-
-    if is_exist is not None and is_exist:
-        await vip_users.update_one(
-            filter={"_id": uid},
-            update={
-                "$set": {
-                    "subscription": subscription,
-                    "ends": ends,
-                    "used": used,
-                    "billed": billed,
-                    "early": early,
-                    "donator": donator,
-                    "started": started,
-                    "successful": successful,
-                    "gap": gap,
-                    "gifted": gifted,
-                    "referral": referral,
-                    "lifetime": lifetime,
-                }
-            },
-        )
-    else:
-        await vip_users.insert_one(
-            document={
-                "_id": uid,
+    await vip_users.update_one(
+        filter={"_id": uid},
+        update={
+            "$set": {
                 "subscription": subscription,
                 "ends": ends,
                 "used": used,
@@ -609,22 +683,28 @@ async def add_vip_user(
                 "referral": referral,
                 "lifetime": lifetime,
             }
-        )
+        },
+        upsert=True,
+    )
+    vip_cache.invalidate(uid)
 
 
 async def remove_vip_user(uid):
-    is_exist = await vip_users.find_one(filter={"_id": uid})
-
-    if is_exist is not None and is_exist:
-        await vip_users.delete_one(filter={"_id": uid})
-    else:
-        return
+    await vip_users.delete_one(filter={"_id": uid})
+    vip_cache.invalidate(uid)
 
 
 async def is_vip(uid):
+    cached = vip_cache.get(uid)
+
+    if cached is not TTLCache.MISSING:
+        return cached
+
     is_exist = await vip_users.find_one(filter={"_id": uid})
+    vip = bool(is_exist is not None and is_exist)
+    vip_cache.set(uid, vip)
 
-    return bool(is_exist is not None and is_exist)
+    return vip
 
 
 async def get_vip_users():
@@ -651,31 +731,19 @@ referrals = unzip_db["referrals"]
 
 
 async def add_referee(uid, referral_code):
-    is_exist = await referrals.find_one(filter={"_id": uid})
-
-    if is_exist is not None and is_exist:
-        await referrals.update_one(
-            filter={"_id": uid},
-            update={"$set": {"type": "referee", "referral_code": referral_code}},
-        )
-    else:
-        await referrals.insert_one(
-            document={"_id": uid, "type": "referee", "referral_code": referral_code}
-        )
+    await referrals.update_one(
+        filter={"_id": uid},
+        update={"$set": {"type": "referee", "referral_code": referral_code}},
+        upsert=True,
+    )
 
 
 async def add_referrer(uid, referees):
-    is_exist = await referrals.find_one(filter={"_id": uid})
-
-    if is_exist is not None and is_exist:
-        await referrals.update_one(
-            filter={"_id": uid},
-            update={"$set": {"type": "referrer", "referees": referees}},
-        )
-    else:
-        await referrals.insert_one(
-            document={"_id": uid, "type": "referrer", "referees": referees}
-        )
+    await referrals.update_one(
+        filter={"_id": uid},
+        update={"$set": {"type": "referrer", "referees": referees}},
+        upsert=True,
+    )
 
 
 async def get_referee(uid):
@@ -696,6 +764,52 @@ async def get_referrer(uid):
     return None
 
 
+# Indexes, created at startup
+async def ensure_indexes():
+    unique_keys = [
+        (user_db, "user_id"),
+        (b_user_db, "banned_user_id"),
+        (ongoing_tasks, "user_id"),
+        (cancel_tasks, "user_id"),
+        (merge_tasks, "user_id"),
+    ]
+
+    for collection, key in unique_keys:
+        try:
+            await collection.create_index(key, unique=True)
+        except DuplicateKeyError:
+            LOGGER.warning(
+                msg=messages.get(
+                    file="database",
+                    key="INDEX_DUPLICATES",
+                    extra_args=[collection.name, key],
+                )
+            )
+
+            # Still avoids a collection scan until the duplicates are removed
+            await collection.create_index(key)
+        except OperationFailure as e:
+            LOGGER.error(
+                msg=messages.get(
+                    file="database",
+                    key="INDEX_ERROR",
+                    extra_args=[collection.name, key, e],
+                )
+            )
+
+    for collection in (ongoing_tasks, cancel_tasks):
+        try:
+            await collection.create_index("expire_at", expireAfterSeconds=0)
+        except OperationFailure as e:
+            LOGGER.error(
+                msg=messages.get(
+                    file="database",
+                    key="INDEX_ERROR",
+                    extra_args=[collection.name, "expire_at", e],
+                )
+            )
+
+
 def get_referral_code(uid):
     return base58check.b58encode(
         val=base58check.b58encode(val=str(uid).encode(encoding="ascii"))
@@ -0,0 +1,62 @@
+from aiohttp import ClientSession, TCPConnector, TraceConfig
+
+from config import Config
+
+# Application-wide HTTP session, created in main() and closed on shutdown
+__session = None
+__stats = {"opened": 0, "reused": 0}
+
+
+async def __on_connection_create_end(session, context, params):
+    __stats["opened"] += 1
+
+
+async def __on_connection_reuseconn(session, context, params):
+    __stats["reused"] += 1
+
+
+def create_session():
+    """
+    Create the shared aiohttp session, with a pooled keep-alive connector
+
+    :return: The ClientSession every HTTP request of the bot goes through
+    """
+    global __session
+
+    if __session is not None and not __session.closed:
+        return __session
+
+    trace_config = TraceConfig()
+    trace_config.on_connection_create_end.append(__on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(__on_connection_reuseconn)
+    connector = TCPConnector(
+        limit=Config.HTTP_POOL_SIZE,
+        limit_per_host=Config.HTTP_POOL_SIZE_PER_HOST,
+        ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+    )
+    __session = ClientSession(connector=connector, trace_configs=[trace_config])
+
+    return __session
+
+
+def get_session():
+    # Never use it as a context manager, that would close the shared pool
+    if __session is None or __session.closed:
+        return create_session()
+
+    return __session
+
+
+async def close_session():
+    global __session
+
+    if __session is not None and not __session.closed:
+        await __session.close()
+
+    __session = None
+
+
+def get_http_stats():
+    return dict(__stats)
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+from pyrogram.errors import MessageNotModified, RPCError
+
+from config import Config
+from unzipbot import LOGGER
+from unzipbot.i18n.messages import Messages
+
+from .database import get_lang, is_vip
+
+messages = Messages(lang_fetcher=get_lang)
+
+
+class Job:
+    __slots__ = (
+        "user_id",
+        "priority",
+        "seq",
+        "future",
+        "notify",
+        "position",
+        "notifications",
+    )
+
+    def __init__(self, user_id, priority, seq, notify):
+        self.user_id = int(user_id)
+        self.priority = priority
+        self.seq = seq
+        self.future = asyncio.get_running_loop().create_future()
+        self.notify = notify
+        self.position = None
+        self.notifications = set()  # Position updates still being sent
+
+
+class Lane:
+    def __init__(self, name, slots):
+        self.name = name
+        self.slots = slots
+        self.active = 0
+        self.running = {}  # user_id → running jobs
+        self.waiting = []
+
+    def order(self):
+        # VIPs first, then users with the fewest running jobs, then arrival order
+        self.waiting.sort(
+            key=lambda job: (job.priority, self.running.get(job.user_id, 0), job.seq)
+        )
+
+
+class Scheduler:
+    def __init__(self, slots):
+        """
+        Queue heavy jobs in separate lanes, each with its own concurrency budget
+
+        :param slots: Dictionary of lane name → maximum running jobs
+        """
+        self.lanes = {
+            name: Lane(name=name, slots=count) for name, count in slots.items()
+        }
+        self.counter = itertools.count()
+
+    def position(self, lane, user_id):
+        lane = self.lanes[lane]
+        user_id = int(user_id)
+
+        for index, job in enumerate(lane.waiting):
+            if job.user_id == user_id:
+                return index + 1
+
+        return 0
+
+    def stats(self):
+        return {
+            name: (lane.active, lane.slots, len(lane.waiting))
+            for name, lane in self.lanes.items()
+        }
+
+    def __pump(self, lane):
+        lane.order()
+
+        while lane.waiting and lane.active < lane.slots:
+            job = lane.waiting.pop(0)
+            lane.active += 1
+            lane.running[job.user_id] = lane.running.get(job.user_id, 0) + 1
+            job.future.set_result(None)
+
+        for index, job in enumerate(lane.waiting):
+            if job.notify is not None and job.position != index + 1:
+                job.position = index + 1
+                task = asyncio.create_task(self.__notify(job=job, position=index + 1))
+                job.notifications.add(task)
+                task.add_done_callback(job.notifications.discard)
+
+    async def __notify(self, job, position):
+        try:
+            await job.notify(position)
+        except Exception as e:
+            LOGGER.warning(msg=e)
+
+    def __release(self, lane, job):
+        lane.active -= 1
+        lane.running[job.user_id] -= 1
+
+        if lane.running[job.user_id] == 0:
+            del lane.running[job.user_id]
+
+        self.__pump(lane)
+
+    @asynccontextmanager
+    async def slot(self, lane, user_id, priority=False, notify=None):
+        """
+        Wait for a free slot in a lane, and hold it until the block exits
+
+        :param lane: Name of the lane (ex "extract")
+        :param user_id: The user's ID, used for the per-user fair share
+        :param priority: Whether the job goes through the priority lane
+        :param notify: Coroutine function awaited with the queue position
+        """
+        lane = self.lanes[lane]
+        job = Job(
+            user_id=user_id,
+            priority=0 if priority else 1,
+            seq=next(self.counter),
+            notify=notify,
+        )
+        lane.waiting.append(job)
+        self.__pump(lane)
+
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job in lane.waiting:
+                lane.waiting.remove(job)
+                self.__pump(lane)
+            elif job.future.done() and not job.future.cancelled():
+                self.__release(lane, job)
+
+            raise
+
+        try:
+            # A late position update mustn't land over what the job shows next
+            if job.notifications:
+                await asyncio.gather(*job.notifications)
+
+            yield
+        finally:
+            self.__release(lane, job)
+
+
+scheduler = Scheduler(
+    slots={
+        "extract": Config.MAX_EXTRACT_JOBS,
+        "split": Config.MAX_SPLIT_JOBS,
+        "transfer": Config.MAX_TRANSFER_JOBS,
+    }
+)
+
+
+@asynccontextmanager
+async def job_slot(lane, user_id, message=None):
+    """
+    Run a job of a user through the scheduler
+
+    :param lane: "extract" (7z, unrar, zstd), "split" or "transfer"
+    :param user_id: The user's ID
+    :param message: Message edited with the queue position while waiting, then told
+    the job started (the caller's next edit replaces it)
+    """
+    notify = None
+    state = {"queued": False}
+
+    if message is not None:
+
+        async def notify(position):
+            state["queued"] = True
+            await message.edit(
+                text=messages.get(
+                    file="scheduler", key="QUEUED", user_id=user_id, extra_args=position
+                )
+            )
+
+    priority = user_id == Config.BOT_OWNER or await is_vip(user_id)
+
+    async with scheduler.slot(
+        lane=lane, user_id=user_id, priority=priority, notify=notify
+    ):
+        # The message passed in may be outdated, its old text and buttons aren't
+        # brought back
+        if state["queued"]:
+            try:
+                await message.edit(
+                    text=messages.get(file="scheduler", key="STARTED", user_id=user_id)
+                )
+            except MessageNotModified:
+                pass
+            except RPCError as e:
+                LOGGER.warning(msg=e)
+
+        yield
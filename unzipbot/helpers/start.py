@@ -14,11 +14,8 @@ from unzipbot.i18n.messages import Messages
 from unzipbot.modules.callbacks import download
 
 from .database import (
-    clear_cancel_tasks,
     clear_merge_tasks,
-    clear_ongoing_tasks,
     count_ongoing_tasks,
-    del_ongoing_task,
     get_boot,
     get_lang,
     get_old_boot,
@@ -28,6 +25,15 @@ from .database import (
     set_boot,
     set_old_boot,
 )
+from .tasks import (
+    clear_cancellations,
+    clear_tasks,
+    end_task,
+    prune_cancellations,
+    sync_cancel_tasks,
+    sync_ongoing_tasks,
+    task_table,
+)
 
 
 def get_size(doc_f):
@@ -136,7 +142,7 @@ async def set_boot_time():
 
 
 async def warn_users():
-    await clear_cancel_tasks()
+    await clear_cancellations()
     await clear_merge_tasks()
 
     if await count_ongoing_tasks() > 0:
@@ -161,15 +167,16 @@ async def warn_users():
             except:
                 pass  # user deleted chat
 
-        await clear_ongoing_tasks()
+        await clear_tasks()
 
 
 async def remove_expired_tasks(firststart=False):
-    ongoing_tasks = await get_ongoing_tasks()
-    await clear_cancel_tasks()
+    ongoing_tasks = task_table.values()
 
+    # Stale cancellation mirrors expire by themselves (see add_cancel_task)
     if firststart:
-        await clear_ongoing_tasks()
+        await clear_cancellations()
+        await clear_tasks()
 
         try:
             shutil.rmtree(Config.DOWNLOAD_LOCATION)
@@ -190,7 +197,7 @@ async def remove_expired_tasks(firststart=False):
                 if task_type == "extract":
                     if time_gap > Config.MAX_TASK_DURATION_EXTRACT:
                         try:
-                            await del_ongoing_task(user_id)
+                            await end_task(user_id)
                             shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
                         except:
                             pass
@@ -206,7 +213,7 @@ async def remove_expired_tasks(firststart=False):
                 elif task_type == "merge":
                     if time_gap > Config.MAX_TASK_DURATION_MERGE:
                         try:
-                            await del_ongoing_task(user_id)
+                            await end_task(user_id)
                             shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
                         except:
                             pass
@@ -220,6 +227,8 @@ async def remove_expired_tasks(firststart=False):
                             ),
                         )
 
+        prune_cancellations()
+
 
 @aiocron.crontab("*/5 * * * *")
 async def scheduled_remove_expired_tasks():
@@ -227,4 +236,10 @@ async def scheduled_remove_expired_tasks():
 
 
 async def start_cron_jobs():
+    global cancel_sync_task, tasks_sync_task
+
     scheduled_remove_expired_tasks.start()
+    tasks_sync_task = asyncio.create_task(sync_ongoing_tasks())
+
+    if Config.CANCEL_TASKS_MIRROR:
+        cancel_sync_task = asyncio.create_task(sync_cancel_tasks())
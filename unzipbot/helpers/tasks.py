@@ -0,0 +1,193 @@
+import asyncio
+
+from config import Config
+from unzipbot import LOGGER
+
+from .database import (
+    add_cancel_task,
+    add_ongoing_task,
+    clear_cancel_tasks,
+    clear_ongoing_tasks,
+    del_cancel_task,
+    del_ongoing_task,
+    get_cancel_tasks,
+    get_ongoing_tasks,
+)
+
+
+# In-process cancellation flags, checked on every chunk of a transfer
+class CancelRegistry:
+    def __init__(self):
+        self.events = {}
+
+    def event(self, user_id):
+        """
+        Get (or create) the cancellation event of a user
+
+        :param user_id: The user's ID
+        :return: The asyncio.Event set when the user asks to cancel
+        """
+        user_id = int(user_id)
+
+        if user_id not in self.events:
+            self.events[user_id] = asyncio.Event()
+
+        return self.events[user_id]
+
+    def cancel(self, user_id):
+        self.event(user_id).set()
+
+    def is_cancelled(self, user_id):
+        event = self.events.get(int(user_id))
+
+        return event is not None and event.is_set()
+
+    async def wait(self, user_id):
+        await self.event(user_id).wait()
+
+    # Only the flag is reset, a running task may still be waiting on the event
+    def clear(self, user_id):
+        event = self.events.get(int(user_id))
+
+        if event is not None:
+            event.clear()
+
+    def clear_all(self):
+        for event in self.events.values():
+            event.clear()
+
+    def prune(self, keep):
+        """
+        Drop the events of users without a running task
+
+        :param keep: Container of the user IDs whose event is kept
+        """
+        for user_id in list(self.events):
+            if user_id not in keep:
+                del self.events[user_id]
+
+
+cancel_registry = CancelRegistry()
+
+
+async def request_cancel(user_id):
+    cancel_registry.cancel(user_id)
+
+    if Config.CANCEL_TASKS_MIRROR:
+        await add_cancel_task(user_id)
+
+
+async def acknowledge_cancel(user_id):
+    cancel_registry.clear(user_id)
+
+    if Config.CANCEL_TASKS_MIRROR:
+        await del_cancel_task(user_id)
+
+
+async def clear_cancellations():
+    cancel_registry.clear_all()
+    await clear_cancel_tasks()
+
+
+def prune_cancellations():
+    cancel_registry.prune(task_table)
+
+
+# Only needed when several instances share the same database
+async def sync_cancel_tasks():
+    while True:
+        try:
+            for task in await get_cancel_tasks():
+                # Rows of users without a task here belong to another instance
+                if task.get("user_id") in task_table:
+                    cancel_registry.cancel(task.get("user_id"))
+        except Exception as e:
+            LOGGER.error(msg=e)
+
+        await asyncio.sleep(Config.CANCEL_TASKS_SYNC_INTERVAL)
+
+
+# Running tasks of this instance, the ongoing_tasks collection is only a copy of it
+class TaskTable:
+    def __init__(self):
+        self.tasks = {}
+
+    def __contains__(self, user_id):
+        return int(user_id) in self.tasks
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def add(self, user_id, start_time, task_type):
+        self.tasks[int(user_id)] = {
+            "user_id": user_id,
+            "start_time": start_time,
+            "type": task_type,
+        }
+
+    def get(self, user_id):
+        return self.tasks.get(int(user_id))
+
+    def remove(self, user_id):
+        return self.tasks.pop(int(user_id), None)
+
+    def values(self):
+        return list(self.tasks.values())
+
+    def clear(self):
+        self.tasks.clear()
+
+    def may_start(self, user_id):
+        """
+        Check if a user can start (or keep going with) a task
+
+        :param user_id: The user's ID
+        :return: True if the user already has a task or a slot is free
+        """
+        return (
+            int(user_id) in self.tasks or len(self.tasks) < Config.MAX_CONCURRENT_TASKS
+        )
+
+
+task_table = TaskTable()
+
+
+async def start_task(user_id, start_time, task_type):
+    # A cancel left over from an earlier task mustn't stop this one
+    await acknowledge_cancel(user_id)
+    task_table.add(user_id=user_id, start_time=start_time, task_type=task_type)
+    await add_ongoing_task(user_id=user_id, start_time=start_time, task_type=task_type)
+
+
+async def end_task(user_id):
+    task_table.remove(user_id)
+    await del_ongoing_task(user_id)
+
+
+async def clear_tasks():
+    task_table.clear()
+    await clear_ongoing_tasks()
+
+
+async def sync_ongoing_tasks():
+    while True:
+        await asyncio.sleep(Config.TASKS_SYNC_INTERVAL)
+
+        try:
+            stored = {int(task.get("user_id")) for task in await get_ongoing_tasks()}
+
+            for task in task_table.values():
+                if int(task.get("user_id")) not in stored:
+                    await add_ongoing_task(
+                        user_id=task.get("user_id"),
+                        start_time=task.get("start_time"),
+                        task_type=task.get("type"),
+                    )
+
+            # Tasks of other instances can't be told apart when the database is shared
+            if not Config.MONGODB_SHARED:
+                for user_id in stored:
+                    if user_id not in task_table:
+                        await del_ongoing_task(user_id)
+        except Exception as e:
+            LOGGER.error(msg=e)
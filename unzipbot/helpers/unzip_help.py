@@ -1,164 +1,267 @@
+import asyncio
 import math
 import time
 from asyncio import sleep
 
 import psutil
 from pyrogram import enums
-from pyrogram.errors import FloodPremiumWait, FloodWait
+from pyrogram.errors import FloodPremiumWait, FloodWait, MessageNotModified, RPCError
 
 from config import Config
-from unzipbot.helpers.database import del_cancel_task, get_cancel_task, get_lang
+from unzipbot import LOGGER
+from unzipbot.helpers.database import get_lang
+from unzipbot.helpers.tasks import acknowledge_cancel, cancel_registry
 from unzipbot.i18n.buttons import Buttons
 from unzipbot.i18n.messages import Messages
 
 messages = Messages(lang_fetcher=get_lang)
 
 
+# Progress messages currently being updated, keyed by (chat ID, message ID)
+progress_reporters = {}
+
+
+class ProgressReporter:
+    __slots__ = (
+        "message",
+        "uid",
+        "ud_type",
+        "start",
+        "reply_markup",
+        "current",
+        "total",
+        "dirty",
+        "finished",
+        "interval",
+        "last_update",
+        "task",
+    )
+
+    def __init__(self, message, ud_type, start, reply_markup):
+        """
+        Edit a progress message in the background, at most every few seconds
+
+        :param message: The message to edit
+        :param ud_type: Text displayed above the progress bar
+        :param start: Timestamp at which the transfer started
+        :param reply_markup: Buttons attached to the progress message
+        """
+        self.message = message
+        self.uid = message.chat.id
+        self.ud_type = ud_type
+        self.start = start
+        self.reply_markup = reply_markup
+        self.current = 0
+        self.total = 0
+        self.dirty = False
+        self.finished = False
+        self.interval = Config.PROGRESS_INTERVAL
+        self.last_update = time.time()
+        self.task = None
+
+    def update(self, current, total):
+        # Only records the values, the transfer never waits on Telegram
+        self.current = current
+        self.total = total
+        self.dirty = True
+        self.last_update = time.time()
+
+        if total and current >= total:
+            # The caller edits the message right after, a late edit would hide it
+            self.stop()
+        elif self.task is None:
+            self.task = asyncio.create_task(self.__run())
+
+    def stop(self):
+        self.finished = True
+
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+        key = (self.uid, self.message.id)
+
+        if progress_reporters.get(key) is self:
+            del progress_reporters[key]
+
+    async def __run(self):
+        try:
+            while not self.finished:
+                if self.dirty:
+                    self.dirty = False
+                    await self.__edit()
+                elif time.time() - self.last_update > Config.PROGRESS_IDLE_TIMEOUT:
+                    break
+
+                await sleep(self.interval)
+        except Exception as e:
+            LOGGER.error(msg=f"Progress reporter stopped : {e}")
+        finally:
+            self.task = None
+            self.stop()
+
+    async def __edit(self):
+        try:
+            await self.message.edit(
+                text=messages.get(
+                    file="unzip_help",
+                    key="PROGRESS_MSG",
+                    user_id=self.uid,
+                    extra_args=[
+                        self.ud_type,
+                        render_progress(
+                            current=self.current,
+                            total=self.total,
+                            start=self.start,
+                            uid=self.uid,
+                        ),
+                    ],
+                ),
+                reply_markup=self.reply_markup,
+            )
+            self.interval = max(Config.PROGRESS_INTERVAL, self.interval * 0.75)
+        except (FloodWait, FloodPremiumWait) as f:
+            # Retry with the latest values once Telegram lets us, and slow down
+            self.dirty = True
+            self.interval = max(
+                f.value, min(self.interval * 2, Config.PROGRESS_MAX_INTERVAL)
+            )
+        except MessageNotModified:
+            pass
+        except RPCError as e:
+            # Ex the message was deleted, the transfer itself goes on
+            LOGGER.warning(msg=f"Progress update failed : {e}")
+
+
+def get_reporter(message, ud_type, start, reply_markup=None):
+    key = (message.chat.id, message.id)
+    reporter = progress_reporters.get(key)
+
+    if reporter is None or reporter.start != start:
+        if reporter is not None:
+            reporter.stop()
+
+        reporter = ProgressReporter(
+            message=message, ud_type=ud_type, start=start, reply_markup=reply_markup
+        )
+        progress_reporters[key] = reporter
+
+    reporter.ud_type = ud_type
+
+    return reporter
+
+
+def stop_reporter(message):
+    reporter = progress_reporters.get((message.chat.id, message.id))
+
+    if reporter is not None:
+        reporter.stop()
+
+
+def render_progress(current, total, start, uid):
+    if total == 0:
+        return messages.get(file="unzip_help", key="UNKNOWN_SIZE", user_id=uid)
+
+    diff = max(time.time() - start, 0.001)
+    percentage = current * 100 / total
+    speed = current / diff
+    estimated_total_time = (
+        round(number=(total - current) / speed) * 1000 if speed else 0
+    )
+    estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
+    filled = "".join(["⬢" for _ in range(math.floor(percentage / 5))])
+    empty = "".join(["⬡" for _ in range(20 - math.floor(percentage / 5))])
+    progress = f"[{filled}{empty}] \n"
+    progress += (
+        f"{messages.get(file='unzip_help', key='PROCESSING', user_id=uid)} : "
+        f"`{round(number=percentage, ndigits=2)}%`\n"
+    )
+    eta = (
+        estimated_total_time
+        if estimated_total_time != "" or percentage != "100"
+        else "0 s"
+    )
+
+    return (
+        progress
+        + f"`{humanbytes(current)} of {humanbytes(total)}`\n"
+        + f"{messages.get(file='unzip_help', key='SPEED', user_id=uid)} "
+        + f"`{humanbytes(speed)}/s`\n"
+        + f"{messages.get(file='unzip_help', key='ETA', user_id=uid)} "
+        + f"`{eta}`\n"
+    )
+
+
 async def progress_for_pyrogram(current, total, ud_type, message, start, unzip_bot):
     if not message:
         return
 
     uid = message.chat.id
 
-    if message.chat.type == enums.ChatType.PRIVATE and await get_cancel_task(uid):
-        await del_cancel_task(uid)
+    if message.chat.type == enums.ChatType.PRIVATE and cancel_registry.is_cancelled(
+        uid
+    ):
+        stop_reporter(message)
+        await acknowledge_cancel(uid)
         await message.edit(
             text=messages.get(file="unzip_help", key="DL_STOPPED", user_id=uid)
         )
         unzip_bot.stop_transmission()
     else:
-        now = time.time()
-        diff = now - start
-
-        if total == 0:
-            tmp = messages.get(file="unzip_help", key="UNKNOWN_SIZE", user_id=uid)
-
-            try:
-                await message.edit(
-                    text=messages.get(
-                        file="unzip_help",
-                        key="PROGRESS_MSG",
-                        user_id=uid,
-                        extra_args=[ud_type, tmp],
-                    ),
-                    reply_markup=Buttons.I_PREFER_STOP,
-                )
-            except (FloodWait, FloodPremiumWait) as f:
-                await sleep(f.value)
-                await message.edit(
-                    text=messages.get(
-                        file="unzip_help",
-                        key="PROGRESS_MSG",
-                        user_id=uid,
-                        extra_args=[ud_type, tmp],
-                    ),
-                    reply_markup=Buttons.I_PREFER_STOP,
-                )
-            except:
-                pass
-        elif round(number=diff % 10.00) == 0 or current == total:
-            percentage = current * 100 / total
-            speed = current / diff
-            estimated_total_time = round(number=(total - current) / speed) * 1000
-            estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
-            filled = "".join(["⬢" for _ in range(math.floor(percentage / 5))])
-            empty = "".join(["⬡" for _ in range(20 - math.floor(percentage / 5))])
-            progress = f"[{filled}{empty}] \n"
-            progress += (
-                f"{messages.get(file='unzip_help', key='PROCESSING', user_id=uid)} : "
-                f"`{round(number=percentage, ndigits=2)}%`\n"
-            )
-            eta = (
-                estimated_total_time
-                if estimated_total_time != "" or percentage != "100"
-                else "0 s"
-            )
-            tmp = (
-                progress
-                + f"`{humanbytes(current)} of {humanbytes(total)}`\n"
-                + f"{messages.get(file='unzip_help', key='SPEED', user_id=uid)} "
-                + f"`{humanbytes(speed)}/s`\n"
-                + f"{messages.get(file='unzip_help', key='ETA', user_id=uid)} "
-                + f"`{eta}`\n"
-            )
-
-            try:
-                await message.edit(
-                    text=messages.get(
-                        file="unzip_help",
-                        key="PROGRESS_MSG",
-                        user_id=uid,
-                        extra_args=[ud_type, tmp],
-                    ),
-                    reply_markup=Buttons.I_PREFER_STOP,
-                )
-            except (FloodWait, FloodPremiumWait) as f:
-                await sleep(f.value)
-                await message.edit(
-                    text=messages.get(
-                        file="unzip_help",
-                        key="PROGRESS_MSG",
-                        user_id=uid,
-                        extra_args=[ud_type, tmp],
-                    ),
-                    reply_markup=Buttons.I_PREFER_STOP,
-                )
-            except:
-                pass
+        get_reporter(
+            message=message,
+            ud_type=ud_type,
+            start=start,
+            reply_markup=Buttons.I_PREFER_STOP,
+        ).update(current=current, total=total)
+
+
+class UploadProgress:
+    __slots__ = ("message", "unzip_bot", "ud_type", "start", "total", "sent", "running")
+
+    def __init__(self, message, unzip_bot, total, ud_type):
+        """
+        Sum the progress of concurrent uploads into a single progress message
+
+        :param message: The message to edit
+        :param unzip_bot: The client doing the uploads
+        :param total: Size of all the files to upload (0 if unknown)
+        :param ud_type: Text displayed above the progress bar
+        """
+        self.message = message
+        self.unzip_bot = unzip_bot
+        self.ud_type = ud_type
+        self.start = time.time()
+        self.total = total
+        self.sent = 0
+        self.running = {}
+
+    async def update(self, current, total, key):
+        # Cancellation is acknowledged by the caller, once every upload stopped
+        if cancel_registry.is_cancelled(self.message.chat.id):
+            stop_reporter(self.message)
+            self.unzip_bot.stop_transmission()
+
+        if current >= total:
+            self.running.pop(key, None)
+            self.sent += total
+        else:
+            self.running[key] = current
+
+        get_reporter(
+            message=self.message,
+            ud_type=self.ud_type,
+            start=self.start,
+            reply_markup=Buttons.I_PREFER_STOP,
+        ).update(
+            current=self.sent + sum(self.running.values()),
+            total=max(self.total, self.sent + sum(self.running.values())),
+        )
 
 
 async def progress_urls(current, total, ud_type, message, start):
-    now = time.time()
-    diff = now - start
-    uid = message.chat.id
-
-    if round(number=diff % 10.00) == 0 or current == total:
-        percentage = current * 100 / total
-        speed = current / diff
-        estimated_total_time = round(number=(total - current) / speed) * 1000
-        estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
-        filled = "".join(["⬢" for _ in range(math.floor(percentage / 5))])
-        empty = "".join(["⬡" for _ in range(20 - math.floor(percentage / 5))])
-        progress = f"[{filled}{empty}] \n"
-        progress += (
-            f"{messages.get(file='unzip_help', key='PROCESSING', user_id=uid)} : "
-            f"`{round(number=percentage, ndigits=2)}%`\n"
-        )
-        eta = (
-            estimated_total_time
-            if estimated_total_time != "" or percentage != "100"
-            else "0 s"
-        )
-        tmp = (
-            progress
-            + f"`{humanbytes(current)} of {humanbytes(total)}`\n"
-            + f"{messages.get(file='unzip_help', key='SPEED', user_id=uid)} "
-            + f"`{humanbytes(speed)}/s`\n"
-            + f"{messages.get(file='unzip_help', key='ETA', user_id=uid)} "
-            + f"`{eta}`\n"
-        )
-
-        try:
-            await message.edit(
-                messages.get(
-                    file="unzip_help",
-                    key="PROGRESS_MSG",
-                    user_id=uid,
-                    extra_args=[ud_type, tmp],
-                )
-            )
-        except (FloodWait, FloodPremiumWait) as f:
-            await sleep(f.value)
-            await message.edit(
-                messages.get(
-                    file="unzip_help",
-                    key="PROGRESS_MSG",
-                    user_id=uid,
-                    extra_args=[ud_type, tmp],
-                )
-            )
-        except:
-            pass
+    get_reporter(message=message, ud_type=ud_type, start=start).update(
+        current=current, total=total
+    )
 
 
 def humanbytes(size):
@@ -219,6 +322,15 @@ def calculate_memory_limit():
 
 # List of error messages from 7zip
 ERROR_MSGS = ["Error", "Can't open as archive"]
+# 7z / unrar, when even the list of files is encrypted
+ENCRYPTED_HEADERS_MSGS = [
+    "Can not open encrypted archive",
+    "Wrong password",
+    "password is incorrect",
+    "Incorrect password",
+]
+# GNU tar / busybox tar, when the decompressed stream isn't a tarball
+NOT_A_TAR_MSGS = ["does not look like a tar archive", "invalid tar magic"]
 
 # List of common extentions
 extentions_list = {
@@ -292,3 +404,4 @@ tarball_extensions = (
     ".tz",
     ".taz",
 )
+zstd_extensions = (".tar.zst", ".zst", ".tzst")
@@ -1,7 +1,86 @@
 import json
+import os
+import time
+from string import Formatter
 
 from config import Config
 
+# Minimum delay (in seconds) between two mtime checks of the same language file
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Process-wide catalog shared by every Messages instance
+# file_path → (mtime_ns, last_check, {(file, key): Template})
+__catalog = {}
+
+
+class Template:
+    __slots__ = ("text", "static")
+
+    def __init__(self, text):
+        """
+        Pre-parse a message template once so that formatting it is cheap
+
+        :param text: The raw template string, as found in the language file
+        """
+        parsed = list(Formatter().parse(text))
+        self.text = text
+        # Templates without any replacement field never need to be formatted again
+        self.static = (
+            "".join(literal for literal, *_ in parsed)
+            if all(field is None for _, field, _, _ in parsed)
+            else None
+        )
+
+    def format(self, *args):
+        if self.static is not None:
+            return self.static
+
+        return self.text.format(*args)
+
+
+def compile_catalog(data):
+    """
+    Flatten a language file into a (file, key) → Template table
+
+    :param data: The decoded JSON structure of a language file
+    :return: Dictionary of pre-parsed templates
+    """
+    return {
+        (file, key): Template(text)
+        for file, keys in data.items()
+        for key, text in keys.items()
+    }
+
+
+def load_catalog(file_path):
+    """
+    Return the compiled catalog of a language file, (re)loading it if needed
+
+    :param file_path: Path to the JSON language file
+    :return: Dictionary of pre-parsed templates
+    """
+    now = time.monotonic()
+    entry = __catalog.get(file_path)
+
+    if entry is not None and now - entry[1] < RELOAD_CHECK_INTERVAL:
+        return entry[2]
+
+    mtime = os.stat(path=file_path).st_mtime_ns
+
+    if entry is not None and entry[0] == mtime:
+        templates = entry[2]
+    else:
+        with open(file=file_path, mode="r", encoding="utf-8") as f:
+            templates = compile_catalog(json.load(fp=f))
+
+    __catalog[file_path] = (mtime, now, templates)
+
+    return templates
+
+
+def clear_catalog():
+    __catalog.clear()
+
 
 class Messages:
     def __init__(
@@ -23,23 +102,15 @@ class Messages:
 
     def __load_language_file(self, lang):
         """
-        Load the JSON file for the given language
+        Get the compiled catalog for the given language
 
         :param lang: Language code (ex "en")
-        :return: Dictionary of messages
+        :return: Dictionary of pre-parsed templates, keyed by (file, key)
         """
-        file_path = f"{self.base_path}/{lang}.json"
-
         try:
-            with open(file=file_path, mode="r", encoding="utf-8") as f:
-                return json.load(fp=f)
+            return load_catalog(f"{self.base_path}/{lang}.json")
         except FileNotFoundError:
-            with open(
-                file=f"{self.base_path}/{self.default_lang}.json",
-                mode="r",
-                encoding="utf-8",
-            ) as f:
-                return json.load(fp=f)
+            return load_catalog(f"{self.base_path}/{self.default_lang}.json")
 
     def get(self, file, key, user_id=None, extra_args=[]):
         """
@@ -52,12 +123,11 @@ class Messages:
         :return: The formatted message string
         """
         lang = self.lang_fetcher(user_id) if user_id else self.default_lang
-        messages = self.__load_language_file(lang)
+        entry = (file, key.lower())
+        message = self.__load_language_file(lang).get(entry)
 
-        try:
-            message = messages[file][key.lower()]
-        except KeyError:
-            message = self.__load_language_file(self.default_lang)[file][key.lower()]
+        if message is None:
+            message = self.__load_language_file(self.default_lang)[entry]
 
         if not isinstance(extra_args, list):
             extra_args = [extra_args]
@@ -3,6 +3,7 @@ import concurrent.futures
 import os
 import re
 import shutil
+from contextlib import aclosing
 from email.parser import Parser
 from email.policy import default
 from fnmatch import fnmatch
@@ -11,53 +12,91 @@ from urllib.parse import unquote
 
 import unzip_http
 from aiofiles import open as openfile
-from aiohttp import ClientSession, InvalidURL
+from aiohttp import InvalidURL
 from pyrogram import Client
-from pyrogram.errors import ReplyMarkupTooLong
+from pyrogram.errors import MessageNotModified, ReplyMarkupTooLong, RPCError
 from pyrogram.types import CallbackQuery
 
 from config import Config
 from unzipbot import LOGGER, unzipbot_client
+from unzipbot.helpers.archive_cache import archive_cache, file_digest, sent_file_id
 from unzipbot.helpers.database import (
-    add_cancel_task,
-    add_ongoing_task,
-    count_ongoing_tasks,
-    del_cancel_task,
     del_merge_task,
-    del_ongoing_task,
     del_thumb_db,
-    get_cancel_task,
     get_lang,
     get_maintenance,
     get_merge_task_message_id,
-    get_ongoing_tasks,
     set_upload_mode,
     update_thumb,
     update_uploaded,
 )
+from unzipbot.helpers.http_client import get_session
+from unzipbot.helpers.scheduler import job_slot
+from unzipbot.helpers.tasks import (
+    acknowledge_cancel,
+    cancel_registry,
+    end_task,
+    request_cancel,
+    start_task,
+    task_table,
+)
 from unzipbot.helpers.unzip_help import (
     ERROR_MSGS,
     TimeFormatter,
+    UploadProgress,
     extentions_list,
     humanbytes,
     progress_for_pyrogram,
+    stop_reporter,
 )
 from unzipbot.i18n.buttons import Buttons
 from unzipbot.i18n.messages import Messages
 
 from .commands import get_stats, https_url_regex, sufficient_disk_space
+from .ext_script.archive_engine import (
+    ENGINE_ERRORS,
+    ExtractionCancelled,
+    reset_directory,
+)
 from .ext_script.custom_thumbnail import silent_del
+from .ext_script.dl_helper import (
+    DownloadFailed,
+    RangesUnsupported,
+    download_message,
+    download_ranges,
+)
 from .ext_script.ext_helper import (
+    SplitFailed,
     extr_files,
+    extract_entry,
+    extract_remaining,
     get_files,
+    list_archive,
     make_keyboard,
     make_keyboard_empty,
     merge_files,
+    probe_encryption,
     split_files,
+    stream_merge,
+    stream_split_files,
     test_with_7z_helper,
     test_with_unrar_helper,
 )
-from .ext_script.up_helper import answer_query, get_size, send_file, send_url_logs
+from .ext_script.picker import build_index, index_directory, make_picker
+from .ext_script.pipeline import (
+    PipelineCancelled,
+    Turnstile,
+    download_workers,
+    run_pipeline,
+    upload_workers,
+)
+from .ext_script.up_helper import (
+    answer_query,
+    get_size,
+    send_cached_files,
+    send_file,
+    send_url_logs,
+)
 
 split_file_pattern = r"\.z\d+$"
 rar_file_pattern = r"\.(?:r\d+|part\d+\.rar)$"
@@ -91,6 +130,7 @@ def find_lowest_sequence_file(files):
     volume_matches = [
         f for f in files if re.search(pattern=volume_file_pattern, string=f)
     ]
+    zip_matches = [f for f in files if re.search(pattern=split_file_pattern, string=f)]
 
     # Handle RAR pattern cases
     if rar_matches:
@@ -116,6 +156,13 @@ def find_lowest_sequence_file(files):
                 key=lambda x: get_sequence_number(filename=x, pattern=r"\.r\d+$"),
             ), "rar"
 
+    # Spanned zips : .z01, .z02, …, then the .zip
+    if zip_matches:
+        return min(
+            zip_matches,
+            key=lambda x: get_sequence_number(filename=x, pattern=split_file_pattern),
+        ), "zip"
+
     # Handle other cases
     if volume_matches:
         return min(
@@ -126,11 +173,30 @@ def find_lowest_sequence_file(files):
     raise IndexError("No matching files found")
 
 
+# Every volume of the set found by find_lowest_sequence_file, in order
+def sort_volumes(files, file_type):
+    if file_type == "zip":
+        volumes = sorted(
+            [f for f in files if re.search(pattern=split_file_pattern, string=f)],
+            key=lambda x: get_sequence_number(filename=x, pattern=split_file_pattern),
+        )
+
+        return volumes + [f for f in files if f.casefold().endswith(".zip")]
+
+    if file_type == "volume":
+        return sorted(
+            [f for f in files if re.search(pattern=volume_file_pattern, string=f)],
+            key=lambda x: get_sequence_number(filename=x, pattern=volume_file_pattern),
+        )
+
+    # unrar reads the RAR volumes by itself
+    return None
+
+
 async def download(url, path):
     try:
         async with (
-            ClientSession() as session,
-            session.get(url=url, timeout=None, allow_redirects=True) as resp,
+            get_session().get(url=url, timeout=None, allow_redirects=True) as resp,
             openfile(file=path, mode="wb") as file,
         ):
             async for chunk in resp.content.iter_chunked(Config.CHUNK_SIZE):
@@ -141,43 +207,75 @@ async def download(url, path):
         LOGGER.error(msg=messages.get(file="callbacks", key="ERR_DL", extra_args=url))
 
 
-async def download_with_progress(url, path, message, unzip_bot):
-    uid = message.from_user.id
+async def download_with_progress(
+    url, path, message, unzip_bot, total_size=0, accept_ranges=False
+):
+    uid = message.chat.id
+    start_time = time()
+    ud_type = messages.get(file="callbacks", key="DL_URL", user_id=uid, extra_args=url)
+
+    async def progress(current, total):
+        await progress_for_pyrogram(
+            current=current,
+            total=total,
+            ud_type=ud_type,
+            message=message,
+            start=start_time,
+            unzip_bot=unzip_bot,
+        )
 
     try:
-        async with (
-            ClientSession() as session,
-            session.get(url=url, timeout=None, allow_redirects=True) as resp,
-        ):
-            total_size = int(resp.headers.get("Content-Length", default=0))
-            current_size = 0
-            start_time = time()
+        session = get_session()
+        completed = None
+
+        if accept_ranges and total_size >= 2 * Config.DL_RANGE_MIN_SIZE:
+            try:
+                completed = await download_ranges(
+                    session=session,
+                    url=url,
+                    path=path,
+                    total_size=total_size,
+                    progress=progress,
+                    is_cancelled=lambda: cancel_registry.is_cancelled(uid),
+                )
+            except RangesUnsupported as e:
+                LOGGER.warning(
+                    msg=messages.get(
+                        file="dl_helper", key="RANGES_UNSUPPORTED", extra_args=[url, e]
+                    )
+                )
+
+        if completed is None:
+            completed = True
+
+            async with (
+                session.get(url=url, timeout=None, allow_redirects=True) as resp,
+                openfile(file=path, mode="wb") as file,
+            ):
+                total_size = int(resp.headers.get("Content-Length", default=0))
+                current_size = 0
 
-            async with openfile(file=path, mode="wb") as file:
                 async for chunk in resp.content.iter_chunked(Config.CHUNK_SIZE):
-                    if message.from_user is not None and await get_cancel_task(uid):
-                        await message.edit(
-                            text=messages.get(
-                                file="callbacks", key="DL_STOPPED", user_id=uid
-                            )
-                        )
-                        await del_cancel_task(uid)
+                    if cancel_registry.is_cancelled(uid):
+                        completed = False
 
-                        return False
+                        break
 
                     await file.write(chunk)
                     current_size += len(chunk)
-                    await progress_for_pyrogram(
-                        current=current_size,
-                        total=total_size,
-                        ud_type=messages.get(
-                            file="callbacks", key="DL_URL", user_id=uid, extra_args=url
-                        ),
-                        message=message,
-                        start=start_time,
-                        unzip_bot=unzip_bot,
-                    )
+                    await progress(current=current_size, total=total_size)
+
+        stop_reporter(message)
+
+        if not completed:
+            await message.edit(
+                text=messages.get(file="callbacks", key="DL_STOPPED", user_id=uid)
+            )
+            await acknowledge_cancel(uid)
+
+            return False
     except Exception:
+        stop_reporter(message)
         LOGGER.error(msg=messages.get(file="callbacks", key="ERR_DL", extra_args=url))
 
 
@@ -192,28 +290,196 @@ async def async_generator(iterable):
         yield item
 
 
+# Files of the task, indexed from the disk if the task doesn't have them yet
+async def task_index(user_id, path):
+    task = task_table.get(user_id)
+    index = task.get("index") if task is not None else None
+
+    if index is None:
+        index = await asyncio.to_thread(index_directory, path)
+
+        if task is not None:
+            task["index"] = index
+
+    return index
+
+
+async def show_picker(unzip_bot, query, index):
+    # Edit the message into the file picker, or send a new one if that fails
+    buttons = await make_picker(
+        index=index, user_id=query.from_user.id, chat_id=query.message.chat.id
+    )
+    text = messages.get(
+        file="callbacks", key="SELECT_FILES", user_id=query.from_user.id
+    )
+
+    try:
+        await query.message.edit(text=text, reply_markup=buttons)
+    except MessageNotModified:
+        pass
+    except RPCError as e:
+        # A keyboard Telegram rejects fails again here, and reaches the caller
+        LOGGER.warning(msg=f"Can't edit the picker ({e}), sending it again")
+
+        try:
+            await query.message.delete()
+        except RPCError:
+            pass
+
+        await unzip_bot.send_message(
+            chat_id=query.message.chat.id, text=text, reply_markup=buttons
+        )
+
+
+async def answer_from_cache(unzip_bot, query, cache_key, log_msg):
+    """
+    Send again an archive that was already extracted and uploaded
+
+    :param cache_key: Key of the archive in the archive cache
+    :return: True if the task is done, False if it has to go the usual way
+    """
+    user_id = query.from_user.id
+    cached = archive_cache.get(cache_key)
+
+    if cached is None:
+        # Extracting it will fill the cache for the next time
+        task = task_table.get(user_id)
+
+        if task is not None:
+            task["cache_key"] = cache_key
+
+        return False
+
+    LOGGER.info(msg=f"Archive cache hit : {cache_key}")
+    await query.message.edit(
+        text=messages.get(file="callbacks", key="SENDING_ALL_FILES", user_id=user_id)
+    )
+    sent_files = await send_cached_files(
+        unzip_bot=unzip_bot, c_id=user_id, cached=cached
+    )
+
+    if sent_files is None:
+        archive_cache.discard(cache_key)
+
+        return False
+
+    try:
+        await unzip_bot.send_message(
+            chat_id=user_id,
+            text=messages.get(file="callbacks", key="UPLOADED", user_id=user_id),
+            reply_markup=Buttons.RATE_ME,
+        )
+        await query.message.edit(
+            text=messages.get(file="callbacks", key="UPLOADED", user_id=user_id),
+            reply_markup=Buttons.RATE_ME,
+        )
+    except:
+        pass
+
+    await log_msg.reply(
+        messages.get(file="callbacks", key="HOW_MANY_UPLOADED", extra_args=sent_files)
+    )
+    await update_uploaded(user_id=user_id, upload_count=sent_files)
+    await end_task(user_id)
+
+    return True
+
+
+async def upload_while_merging(unzip_bot, query, parts, file_type, download):
+    """
+    Extract a split zip / tar and upload its files while the parts are downloading
+
+    :param parts: Messages of the volumes, in order
+    :param file_type: "volume" or "zip", as found by find_lowest_sequence_file()
+    :param download: Coroutine function downloading a part, awaited with
+    (index, message)
+    :return: Number of files sent, None if nothing could be extracted that way (every
+    part is downloaded by then, for the usual merge)
+    """
+    user_id = query.from_user.id
+    download_path = f"{Config.DOWNLOAD_LOCATION}/{user_id}/merge"
+    ext_files_dir = f"{Config.DOWNLOAD_LOCATION}/{user_id}/extracted"
+    os.makedirs(name=ext_files_dir, exist_ok=True)
+    sent_files = 0
+    log_msg = await unzip_bot.send_message(
+        chat_id=Config.LOGS_CHANNEL,
+        text=messages.get(
+            file="callbacks",
+            key="PROCESS_MERGE",
+            extra_args=[user_id, ".".join(parts[0].document.file_name.split(".")[:-1])],
+        ),
+    )
+
+    async def fetch(volume_ready):
+        async def fetch_part(index, message):
+            await download(index, message)
+            volume_ready(index)
+
+        await run_pipeline(
+            source=async_generator(parts),
+            handler=fetch_part,
+            workers=download_workers(unzip_bot),
+        )
+
+    async def upload(position, file):
+        nonlocal sent_files
+
+        if cancel_registry.is_cancelled(user_id):
+            raise PipelineCancelled
+
+        # Files that need splitting wait for the picker, once everything is there
+        if await get_size(file) > Config.TG_MAX_SIZE:
+            return
+
+        async with job_slot(lane="transfer", user_id=user_id):
+            await send_file(
+                unzip_bot=unzip_bot,
+                c_id=user_id,
+                doc_f=file,
+                query=query,
+                full_path=f"{Config.DOWNLOAD_LOCATION}/{user_id}",
+                log_msg=log_msg,
+                split=False,
+            )
+
+        sent_files += 1
+
+    try:
+        await run_pipeline(
+            source=stream_merge(
+                volumes=[
+                    f"{download_path}/{message.document.file_name}" for message in parts
+                ],
+                sizes=[message.document.file_size for message in parts],
+                download=fetch,
+                ooutput=ext_files_dir,
+                file_type=file_type,
+                user_id=user_id,
+            ),
+            handler=upload,
+            workers=upload_workers(unzip_bot),
+        )
+    except ENGINE_ERRORS as e:
+        if sent_files:
+            raise
+
+        LOGGER.info(msg=f"Can't extract while downloading ({e}), merging")
+        reset_directory(ext_files_dir)
+
+        return None
+
+    await log_msg.reply(
+        messages.get(file="callbacks", key="HOW_MANY_UPLOADED", extra_args=sent_files)
+    )
+
+    return sent_files
+
+
 # Callbacks
 @unzipbot_client.on_callback_query()
 async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
     uid = query.from_user.id
 
-    if uid != Config.BOT_OWNER:  # skipcq: PTC-W0048
-        if await count_ongoing_tasks() >= Config.MAX_CONCURRENT_TASKS:
-            ogtasks = await get_ongoing_tasks()
-
-            if not any(ogtask.get("user_id") == uid for ogtask in ogtasks):
-                await unzip_bot.send_message(
-                    chat_id=uid,
-                    text=messages.get(
-                        file="callbacks",
-                        key="MAX_TASKS",
-                        user_id=uid,
-                        extra_args=Config.MAX_CONCURRENT_TASKS,
-                    ),
-                )
-
-                return
-
     if (
         uid != Config.BOT_OWNER
         and await get_maintenance()
@@ -294,7 +560,9 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         )
 
     elif query.data == "canceldownload":
-        await add_cancel_task(query.from_user.id)
+        # Nothing to cancel, the flag would stop the user's next task instead
+        if query.from_user.id in task_table:
+            await request_cancel(query.from_user.id)
 
     elif query.data == "check_thumb":
         user_id = query.from_user.id
@@ -418,9 +686,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         user_id = query.from_user.id
         m_id = query.message.id
         start_time = time()
-        await add_ongoing_task(
-            user_id=user_id, start_time=start_time, task_type="merge"
-        )
+        await start_task(user_id=user_id, start_time=start_time, task_type="merge")
         s_id = await get_merge_task_message_id(user_id)
         merge_msg = await query.message.edit(
             text=messages.get(file="callbacks", key="PROCESSING_TASK", user_id=uid)
@@ -446,7 +712,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         file="callbacks", key="ERROR_TXT", user_id=uid, extra_args=e
                     ),
                 )
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
                 await del_merge_task(user_id)
 
                 try:
@@ -482,7 +748,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         file="callbacks", key="NO_MERGE_TASK", user_id=uid
                     ),
                 )
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
                 await del_merge_task(user_id)
 
                 try:
@@ -492,31 +758,141 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
                 return
 
-            i = 0
-            async_newarray = async_generator(newarray)
+            # Forwarded to the logs in as few calls as possible (100 messages max)
+            for batch in range(0, length, 100):
+                await unzip_bot.forward_messages(
+                    chat_id=Config.LOGS_CHANNEL,
+                    from_chat_id=user_id,
+                    message_ids=[
+                        message.id for message in newarray[batch : batch + 100]
+                    ],
+                )
 
-            async for message in async_newarray:
-                i += 1
-                fname = message.document.file_name
-                await message.forward(chat_id=Config.LOGS_CHANNEL)
-                location = f"{download_path}/{fname}"
-                s_time = time()
-                await message.download(
-                    file_name=location,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="callbacks",
-                            key="DL_FILES",
-                            user_id=uid,
-                            extra_args=[i, length],
-                        ),
-                        merge_msg,
-                        s_time,
-                        unzip_bot,
-                    ),
+            # The parts are downloaded at once, with a single progress message
+            progress = UploadProgress(
+                message=merge_msg,
+                unzip_bot=unzip_bot,
+                total=sum(message.document.file_size or 0 for message in newarray),
+                ud_type=messages.get(
+                    file="callbacks", key="DL_PARTS", user_id=uid, extra_args=length
+                ),
+            )
+
+            async def download(index, message):
+                async with job_slot(lane="transfer", user_id=user_id):
+                    if not await download_message(
+                        message=message,
+                        path=f"{download_path}/{message.document.file_name}",
+                        progress=progress.update,
+                        progress_args=(index,),
+                        is_cancelled=lambda: cancel_registry.is_cancelled(user_id),
+                    ):
+                        raise PipelineCancelled
+
+            volumes = None
+
+            # Split zips and tarballs are extracted and uploaded while they download
+            if Config.MERGE_PIPELINED:
+                names = [message.document.file_name for message in newarray]
+
+                try:
+                    file, file_type = find_lowest_sequence_file(names)
+                    volumes = sort_volumes(files=names, file_type=file_type)
+                except IndexError:
+                    pass
+
+            try:
+                if volumes and len(set(volumes)) == length:
+                    parts = {
+                        message.document.file_name: message for message in newarray
+                    }
+                    sent_files = await upload_while_merging(
+                        unzip_bot=unzip_bot,
+                        query=query,
+                        parts=[parts[name] for name in volumes],
+                        file_type=file_type,
+                        download=download,
+                    )
+                    i = length
+                else:
+                    sent_files = None
+                    i = await run_pipeline(
+                        source=async_generator(newarray),
+                        handler=download,
+                        workers=download_workers(unzip_bot),
+                    )
+            except (
+                PipelineCancelled,
+                DownloadFailed,
+                ExtractionCancelled,
+                *ENGINE_ERRORS,
+            ) as e:
+                stop_reporter(merge_msg)
+                await end_task(user_id)
+                await del_merge_task(user_id)
+
+                if isinstance(e, (PipelineCancelled, ExtractionCancelled)):
+                    await acknowledge_cancel(user_id)
+                    await merge_msg.edit(
+                        text=messages.get(
+                            file="callbacks", key="DL_STOPPED", user_id=uid
+                        )
+                    )
+                else:
+                    LOGGER.error(msg=e)
+                    await merge_msg.edit(
+                        text=messages.get(
+                            file="callbacks", key="ERROR_TXT", user_id=uid, extra_args=e
+                        )
+                    )
+
+                try:
+                    shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
+                except:
+                    pass
+
+                return
+            finally:
+                stop_reporter(merge_msg)
+
+            if sent_files is not None:
+                await del_merge_task(user_id)
+                await update_uploaded(user_id=user_id, upload_count=sent_files)
+                ext_files_dir = f"{Config.DOWNLOAD_LOCATION}/{user_id}/extracted"
+                shutil.rmtree(download_path, ignore_errors=True)
+
+                # What's left is too big for a single upload, split from the picker
+                index = await task_index(user_id=user_id, path=ext_files_dir)
+
+                if index:
+                    await show_picker(unzip_bot=unzip_bot, query=query, index=index)
+
+                    return
+
+                await end_task(user_id)
+                shutil.rmtree(
+                    f"{Config.DOWNLOAD_LOCATION}/{user_id}", ignore_errors=True
                 )
 
+                try:
+                    await unzip_bot.send_message(
+                        chat_id=user_id,
+                        text=messages.get(
+                            file="callbacks", key="UPLOADED", user_id=uid
+                        ),
+                        reply_markup=Buttons.RATE_ME,
+                    )
+                    await merge_msg.edit(
+                        text=messages.get(
+                            file="callbacks", key="UPLOADED", user_id=uid
+                        ),
+                        reply_markup=Buttons.RATE_ME,
+                    )
+                except RPCError as e:
+                    LOGGER.warning(msg=e)
+
+                return
+
             e_time = time()
             dltime = TimeFormatter(round(number=e_time - rs_time) * 1000)
 
@@ -545,7 +921,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     file="callbacks", key="NO_MERGE_TASK", user_id=uid
                 ),
             )
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
             await del_merge_task(user_id)
 
             try:
@@ -562,6 +938,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         try:
             files = await get_files(download_path)
             file, file_type = find_lowest_sequence_file(files)
+            volumes = sort_volumes(files=files, file_type=file_type)
         except IndexError:
             await answer_query(
                 query=query,
@@ -569,7 +946,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     file="callbacks", key="NO_MERGE_TASK", user_id=uid
                 ),
             )
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
             await del_merge_task(user_id)
 
             try:
@@ -603,20 +980,30 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     file="callbacks", key="PLS_SEND_PASSWORD", user_id=uid
                 ),
             )
-            ext_s_time = time()
-            extractor = await merge_files(
-                iinput=file,
-                ooutput=ext_files_dir,
-                file_type=file_type,
-                password=password.text,
-            )
+            async with job_slot(lane="extract", user_id=user_id, message=query.message):
+                ext_s_time = time()
+                extractor = await merge_files(
+                    iinput=file,
+                    ooutput=ext_files_dir,
+                    file_type=file_type,
+                    password=password.text,
+                    user_id=user_id,
+                    volumes=volumes,
+                )
+
             ext_e_time = time()
         else:
             # Can't test the archive apparently
-            ext_s_time = time()
-            extractor = await merge_files(
-                iinput=file, ooutput=ext_files_dir, file_type=file_type
-            )
+            async with job_slot(lane="extract", user_id=user_id, message=query.message):
+                ext_s_time = time()
+                extractor = await merge_files(
+                    iinput=file,
+                    ooutput=ext_files_dir,
+                    file_type=file_type,
+                    user_id=user_id,
+                    volumes=volumes,
+                )
+
             ext_e_time = time()
 
         # Checks if there is an error happened while extracting the archive
@@ -629,7 +1016,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 )
                 shutil.rmtree(ext_files_dir)
                 shutil.rmtree(download_path)
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
             except:
                 try:
                     await query.message.delete()
@@ -643,14 +1030,14 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     ),
                 )
                 shutil.rmtree(ext_files_dir)
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
 
             return
 
         # Check if user was dumb 😐
-        paths = await get_files(path=ext_files_dir)
+        index = await task_index(user_id=user_id, path=ext_files_dir)
 
-        if not paths:
+        if not index:
             await unzip_bot.send_message(
                 chat_id=query.message.chat.id,
                 text=messages.get(
@@ -666,7 +1053,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             )
             shutil.rmtree(ext_files_dir)
             shutil.rmtree(download_path)
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
 
             return
 
@@ -689,79 +1076,25 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         )
 
         try:
-            i_e_buttons = await make_keyboard(
-                paths=paths,
-                user_id=user_id,
-                chat_id=query.message.chat.id,
-                unziphttp=False,
-            )
-
-            try:
-                await query.message.edit(
-                    text=messages.get(
-                        file="callbacks", key="SELECT_FILES", user_id=uid
-                    ),
-                    reply_markup=i_e_buttons,
-                )
-            except ReplyMarkupTooLong:
-                empty_buttons = await make_keyboard_empty(
-                    user_id=user_id, chat_id=query.message.chat.id, unziphttp=False
-                )
-                await query.message.edit(
-                    text=messages.get(
-                        file="callbacks", key="UNABLE_GATHER_FILES", user_id=uid
-                    ),
-                    reply_markup=empty_buttons,
-                )
+            await show_picker(unzip_bot=unzip_bot, query=query, index=index)
         except:
-            try:
-                await query.message.delete()
-                i_e_buttons = await make_keyboard(
-                    paths=paths,
-                    user_id=user_id,
-                    chat_id=query.message.chat.id,
-                    unziphttp=False,
-                )
-                await unzip_bot.send_message(
-                    chat_id=query.message.chat.id,
-                    text=messages.get(
-                        file="callbacks", key="SELECT_FILES", user_id=uid
-                    ),
-                    reply_markup=i_e_buttons,
-                )
-            except:
-                try:
-                    await query.message.delete()
-                    empty_buttons = await make_keyboard_empty(
-                        user_id=user_id, chat_id=query.message.chat.id, unziphttp=False
-                    )
-                    await unzip_bot.send_message(
-                        chat_id=query.message.chat.id,
-                        text=messages.get(
-                            file="callbacks", key="UNABLE_GATHER_FILES", user_id=uid
-                        ),
-                        reply_markup=empty_buttons,
-                    )
-                except:
-                    await answer_query(
-                        query=query,
-                        message_text=messages.get(
-                            file="callbacks", key="EXT_FAILED_TXT", user_id=uid
-                        ),
-                        unzip_client=unzip_bot,
-                    )
-                    shutil.rmtree(ext_files_dir)
-                    LOGGER.error(msg=messages.get(file="callbacks", key="FATAL_ERROR"))
-                    await del_ongoing_task(user_id)
+            await answer_query(
+                query=query,
+                message_text=messages.get(
+                    file="callbacks", key="EXT_FAILED_TXT", user_id=uid
+                ),
+                unzip_client=unzip_bot,
+            )
+            shutil.rmtree(ext_files_dir)
+            LOGGER.error(msg=messages.get(file="callbacks", key="FATAL_ERROR"))
+            await end_task(user_id)
 
-                    return
+            return
 
     elif query.data.startswith("extract_file"):
         user_id = query.from_user.id
         start_time = time()
-        await add_ongoing_task(
-            user_id=user_id, start_time=start_time, task_type="extract"
-        )
+        await start_task(user_id=user_id, start_time=start_time, task_type="extract")
         download_path = f"{Config.DOWNLOAD_LOCATION}/{user_id}"
         ext_files_dir = f"{download_path}/extracted"
         r_message = query.message.reply_to_message
@@ -787,7 +1120,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
                 # Double check
                 if not re.match(pattern=https_url_regex, string=url):
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     await query.message.edit(
                         text=messages.get(
                             file="callbacks", key="INVALID_URL", user_id=uid
@@ -804,125 +1137,158 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     split_data[1] = "tg_file"
 
                 if split_data[1] == "url":
-                    s = ClientSession()
-
-                    async with s as session:
-                        # Get the file size
-                        unzip_head = await session.head(url=url, allow_redirects=True)
-                        f_size = unzip_head.headers.get("content-length")
-                        u_file_size = f_size if f_size else "undefined"
+                    session = get_session()
+                    # Get the file size
+                    unzip_head = await session.head(url=url, allow_redirects=True)
+                    unzip_head.release()
+                    f_size = unzip_head.headers.get("content-length")
+                    u_file_size = f_size if f_size else "undefined"
+                    accept_ranges = (
+                        unzip_head.headers.get("accept-ranges", "").lower() == "bytes"
+                    )
 
-                        if u_file_size != "undefined" and not sufficient_disk_space(
-                            int(u_file_size)
-                        ):
-                            await del_ongoing_task(user_id)
-                            await query.message.edit(
-                                text=messages.get(
-                                    file="callbacks", key="NO_SPACE", user_id=uid
-                                )
+                    if u_file_size != "undefined" and not sufficient_disk_space(
+                        int(u_file_size)
+                    ):
+                        await end_task(user_id)
+                        await query.message.edit(
+                            text=messages.get(
+                                file="callbacks", key="NO_SPACE", user_id=uid
                             )
+                        )
 
-                            return
+                        return
 
-                        await log_msg.edit(
+                    await log_msg.edit(
+                        text=messages.get(
+                            file="callbacks",
+                            key="LOG_TXT",
+                            extra_args=[user_id, url, u_file_size],
+                        )
+                    )
+                    archive_msg = log_msg
+                    unzip_resp = await session.get(
+                        url=url, timeout=None, allow_redirects=True
+                    )
+                    # Only the headers are needed here, don't hold a pooled connection
+                    unzip_resp.release()
+
+                    if "application/" not in unzip_resp.headers.get("content-type"):
+                        await end_task(user_id)
+                        await query.message.edit(
                             text=messages.get(
-                                file="callbacks",
-                                key="LOG_TXT",
-                                extra_args=[user_id, url, u_file_size],
+                                file="callbacks", key="NOT_AN_ARCHIVE", user_id=uid
                             )
                         )
-                        archive_msg = log_msg
-                        unzip_resp = await session.get(
-                            url=url, timeout=None, allow_redirects=True
+
+                        return
+
+                    content_disposition = unzip_head.headers.get("content-disposition")
+                    rfnamebro = ""
+                    real_filename = ""
+
+                    if content_disposition:
+                        headers = Parser(policy=default).parsestr(
+                            text=f"Content-Disposition: {content_disposition}"
                         )
+                        real_filename = headers.get_filename()
+
+                        if real_filename != "":
+                            rfnamebro = unquote(string=real_filename)
+
+                    if rfnamebro == "":
+                        rfnamebro = unquote(string=url.split(sep="/")[-1])
 
-                        if "application/" not in unzip_resp.headers.get("content-type"):
-                            await del_ongoing_task(user_id)
+                    if unzip_resp.status == 200:
+                        os.makedirs(name=download_path, exist_ok=True)
+                        s_time = time()
+
+                        if real_filename:
+                            archive = os.path.join(download_path, real_filename)
+                            fext = real_filename.split(sep=".")[-1].casefold()
+                        else:
+                            fname = unquote(string=os.path.splitext(url)[1])
+                            fname = fname.split(sep="?")[0]
+                            fext = fname.split(sep=".")[-1].casefold()
+                            archive = f"{download_path}/{fname}"
+
+                        if (
+                            split_data[2] not in ["thumb", "thumbrename"]
+                            and fext not in extentions_list["archive"]
+                        ):
+                            await end_task(user_id)
                             await query.message.edit(
                                 text=messages.get(
-                                    file="callbacks", key="NOT_AN_ARCHIVE", user_id=uid
+                                    file="callbacks",
+                                    key="DEF_NOT_AN_ARCHIVE",
+                                    user_id=uid,
                                 )
                             )
 
+                            try:
+                                shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
+                            except:
+                                pass
+
                             return
 
-                        content_disposition = unzip_head.headers.get(
-                            "content-disposition"
+                        await answer_query(
+                            query=query,
+                            message_text=messages.get(
+                                file="callbacks", key="PROCESSING2", user_id=uid
+                            ),
+                            unzip_client=unzip_bot,
                         )
-                        rfnamebro = ""
-                        real_filename = ""
 
-                        if content_disposition:
-                            headers = Parser(policy=default).parsestr(
-                                text=f"Content-Disposition: {content_disposition}"
-                            )
-                            real_filename = headers.get_filename()
-
-                            if real_filename != "":
-                                rfnamebro = unquote(string=real_filename)
-
-                        if rfnamebro == "":
-                            rfnamebro = unquote(string=url.split(sep="/")[-1])
-
-                        if unzip_resp.status == 200:
-                            os.makedirs(name=download_path, exist_ok=True)
-                            s_time = time()
-
-                            if real_filename:
-                                archive = os.path.join(download_path, real_filename)
-                                fext = real_filename.split(sep=".")[-1].casefold()
-                            else:
-                                fname = unquote(string=os.path.splitext(url)[1])
-                                fname = fname.split(sep="?")[0]
-                                fext = fname.split(sep=".")[-1].casefold()
-                                archive = f"{download_path}/{fname}"
-
-                            if (
-                                split_data[2] not in ["thumb", "thumbrename"]
-                                and fext not in extentions_list["archive"]
-                            ):
-                                await del_ongoing_task(user_id)
-                                await query.message.edit(
-                                    text=messages.get(
-                                        file="callbacks",
-                                        key="DEF_NOT_AN_ARCHIVE",
-                                        user_id=uid,
-                                    )
-                                )
+                        if (
+                            fext == "zip"
+                            and "accept-ranges" in unzip_resp.headers
+                            and "content-length" in unzip_resp.headers
+                        ):
+                            try:
+                                loop = asyncio.get_event_loop()
 
-                                try:
-                                    shutil.rmtree(
-                                        f"{Config.DOWNLOAD_LOCATION}/{user_id}"
+                                with concurrent.futures.ThreadPoolExecutor() as pool:
+                                    rzf, paths = await loop.run_in_executor(
+                                        pool, get_zip_http, url
                                     )
-                                except:
-                                    pass
-
-                                return
-
-                            await answer_query(
-                                query=query,
-                                message_text=messages.get(
-                                    file="callbacks", key="PROCESSING2", user_id=uid
-                                ),
-                                unzip_client=unzip_bot,
-                            )
 
-                            if (
-                                fext == "zip"
-                                and "accept-ranges" in unzip_resp.headers
-                                and "content-length" in unzip_resp.headers
-                            ):
                                 try:
-                                    loop = asyncio.get_event_loop()
+                                    i_e_buttons = await make_keyboard(
+                                        paths=paths,
+                                        user_id=user_id,
+                                        chat_id=query.message.chat.id,
+                                        unziphttp=True,
+                                        rzfile=rzf,
+                                    )
 
-                                    with (
-                                        concurrent.futures.ThreadPoolExecutor() as pool
-                                    ):
-                                        rzf, paths = await loop.run_in_executor(
-                                            pool, get_zip_http, url
+                                    try:
+                                        await query.message.edit(
+                                            text=messages.get(
+                                                file="callbacks",
+                                                key="SELECT_FILES",
+                                                user_id=uid,
+                                            ),
+                                            reply_markup=i_e_buttons,
                                         )
-
+                                    except ReplyMarkupTooLong:
+                                        empty_buttons = await make_keyboard_empty(
+                                            user_id=user_id,
+                                            chat_id=query.message.chat.id,
+                                            unziphttp=True,
+                                            rzfile=rzf,
+                                        )
+                                        await query.message.edit(
+                                            text=messages.get(
+                                                file="callbacks",
+                                                key="UNABLE_GATHER_FILES",
+                                                user_id=uid,
+                                            ),
+                                            reply_markup=empty_buttons,
+                                        )
+                                except:
                                     try:
+                                        await query.message.delete()
                                         i_e_buttons = await make_keyboard(
                                             paths=paths,
                                             user_id=user_id,
@@ -930,36 +1296,19 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                                             unziphttp=True,
                                             rzfile=rzf,
                                         )
-
-                                        try:
-                                            await query.message.edit(
-                                                text=messages.get(
-                                                    file="callbacks",
-                                                    key="SELECT_FILES",
-                                                    user_id=uid,
-                                                ),
-                                                reply_markup=i_e_buttons,
-                                            )
-                                        except ReplyMarkupTooLong:
-                                            empty_buttons = await make_keyboard_empty(
-                                                user_id=user_id,
-                                                chat_id=query.message.chat.id,
-                                                unziphttp=True,
-                                                rzfile=rzf,
-                                            )
-                                            await query.message.edit(
-                                                text=messages.get(
-                                                    file="callbacks",
-                                                    key="UNABLE_GATHER_FILES",
-                                                    user_id=uid,
-                                                ),
-                                                reply_markup=empty_buttons,
-                                            )
+                                        await unzip_bot.send_message(
+                                            chat_id=query.message.chat.id,
+                                            text=messages.get(
+                                                file="callbacks",
+                                                key="SELECT_FILES",
+                                                user_id=uid,
+                                            ),
+                                            reply_markup=i_e_buttons,
+                                        )
                                     except:
                                         try:
                                             await query.message.delete()
-                                            i_e_buttons = await make_keyboard(
-                                                paths=paths,
+                                            empty_buttons = await make_keyboard_empty(
                                                 user_id=user_id,
                                                 chat_id=query.message.chat.id,
                                                 unziphttp=True,
@@ -969,48 +1318,33 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                                                 chat_id=query.message.chat.id,
                                                 text=messages.get(
                                                     file="callbacks",
-                                                    key="SELECT_FILES",
+                                                    key="UNABLE_GATHER_FILES",
                                                     user_id=uid,
                                                 ),
-                                                reply_markup=i_e_buttons,
+                                                reply_markup=empty_buttons,
                                             )
                                         except:
-                                            try:
-                                                await query.message.delete()
-                                                empty_buttons = (
-                                                    await make_keyboard_empty(
-                                                        user_id=user_id,
-                                                        chat_id=query.message.chat.id,
-                                                        unziphttp=True,
-                                                        rzfile=rzf,
-                                                    )
-                                                )
-                                                await unzip_bot.send_message(
-                                                    chat_id=query.message.chat.id,
-                                                    text=messages.get(
-                                                        file="callbacks",
-                                                        key="UNABLE_GATHER_FILES",
-                                                        user_id=uid,
-                                                    ),
-                                                    reply_markup=empty_buttons,
-                                                )
-                                            except:
-                                                pass
-                                except Exception as e:
-                                    LOGGER.error(
-                                        msg=messages.get(
-                                            file="callbacks",
-                                            key="UNZIP_HTTP",
-                                            extra_args=[url, e],
-                                        )
+                                            pass
+                            except Exception as e:
+                                LOGGER.error(
+                                    msg=messages.get(
+                                        file="callbacks",
+                                        key="UNZIP_HTTP",
+                                        extra_args=[url, e],
                                     )
+                                )
 
+                        async with job_slot(
+                            lane="transfer", user_id=user_id, message=query.message
+                        ):
                             try:
                                 dled = await download_with_progress(
                                     url=url,
                                     path=archive,
                                     message=query.message,
                                     unzip_bot=unzip_bot,
+                                    total_size=int(f_size) if f_size else 0,
+                                    accept_ranges=accept_ranges,
                                 )
                             except Exception as e:
                                 dled = False
@@ -1020,35 +1354,46 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                                     )
                                 )
 
-                            if isinstance(dled, bool) and not dled:
-                                return
+                        if isinstance(dled, bool) and not dled:
+                            return
 
-                            e_time = time()
-                            await send_url_logs(
-                                unzip_bot=unzip_bot,
-                                c_id=Config.LOGS_CHANNEL,
-                                doc_f=archive,
-                                source=url,
-                                message=query.message,
-                            )
-                        else:
-                            await del_ongoing_task(user_id)
-                            await query.message.edit(
-                                text=messages.get(
-                                    file="callbacks", key="CANT_DL_URL", user_id=uid
-                                )
-                            )
+                        e_time = time()
+                        await send_url_logs(
+                            unzip_bot=unzip_bot,
+                            c_id=Config.LOGS_CHANNEL,
+                            doc_f=archive,
+                            source=url,
+                            message=query.message,
+                        )
 
-                            try:
-                                shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
-                            except:
-                                pass
+                        # Same bytes behind another URL are still the same archive
+                        if split_data[2] == "no_pass" and await answer_from_cache(
+                            unzip_bot=unzip_bot,
+                            query=query,
+                            cache_key=await asyncio.to_thread(file_digest, archive),
+                            log_msg=log_msg,
+                        ):
+                            shutil.rmtree(download_path, ignore_errors=True)
 
                             return
+                    else:
+                        await end_task(user_id)
+                        await query.message.edit(
+                            text=messages.get(
+                                file="callbacks", key="CANT_DL_URL", user_id=uid
+                            )
+                        )
+
+                        try:
+                            shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
+                        except:
+                            pass
+
+                        return
 
             elif split_data[1] == "tg_file":
                 if r_message.document is None:
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     await query.message.edit(
                         text=messages.get(
                             file="callbacks", key="GIVE_ARCHIVE", user_id=uid
@@ -1079,27 +1424,19 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         fnmatch(name=fext, pat=extentions_list["split"][0])
                         or fext in extentions_list["split"]
                         or bool(re.search(pattern=rar_file_pattern, string=fname))
+                        or bool(re.search(pattern=split_file_pattern, string=fname))
                     ):
+                        await end_task(user_id)
                         await query.message.edit(
                             text=messages.get(
-                                file="callbacks", key="ITS_SPLITTED", user_id=uid
-                            )
-                        )
-
-                        return
-
-                    if bool(re.search(pattern=split_file_pattern, string=fname)):
-                        await del_ongoing_task(user_id)
-                        await query.message.edit(
-                            text=messages.get(
-                                file="callbacks", key="SPL_RZ", user_id=uid
+                                file="callbacks", key="ITS_SPLIT", user_id=uid
                             )
                         )
 
                         return
 
                     if fext not in extentions_list["archive"]:
-                        await del_ongoing_task(user_id)
+                        await end_task(user_id)
                         await query.message.edit(
                             text=messages.get(
                                 file="callbacks", key="DEF_NOT_AN_ARCHIVE", user_id=uid
@@ -1108,23 +1445,35 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
                         return
 
+                if split_data[2] == "no_pass" and await answer_from_cache(
+                    unzip_bot=unzip_bot,
+                    query=query,
+                    cache_key=r_message.document.file_unique_id,
+                    log_msg=log_msg,
+                ):
+                    return
+
                 os.makedirs(name=download_path, exist_ok=True)
                 s_time = time()
                 location = f"{download_path}/{fname}"
                 LOGGER.info("location: %s", location)
-                archive = await r_message.download(
-                    file_name=location,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(file="callbacks", key="TRY_DL", user_id=uid),
-                        query.message,
-                        s_time,
-                        unzip_bot,
-                    ),
-                )
+
+                async with job_slot(
+                    lane="transfer", user_id=user_id, message=query.message
+                ):
+                    archive = await r_message.download(
+                        file_name=location,
+                        progress=progress_for_pyrogram,
+                        progress_args=(
+                            messages.get(file="callbacks", key="TRY_DL", user_id=uid),
+                            query.message,
+                            s_time,
+                            unzip_bot,
+                        ),
+                    )
                 e_time = time()
             else:
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
                 await answer_query(
                     query=query,
                     message_text=messages.get(
@@ -1159,7 +1508,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 try:
                     shutil.move(src=location, dst=renamed)
                 except OSError as e:
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     LOGGER.error(msg=e)
 
                     return
@@ -1168,17 +1517,20 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 fsize = await get_size(renamed)
 
                 if fsize <= Config.TG_MAX_SIZE:
-                    await send_file(
-                        unzip_bot=unzip_bot,
-                        c_id=user_id,
-                        doc_f=renamed,
-                        query=query,
-                        full_path=renamed,
-                        log_msg=log_msg,
-                        split=False,
-                    )
+                    async with job_slot(
+                        lane="transfer", user_id=user_id, message=query.message
+                    ):
+                        await send_file(
+                            unzip_bot=unzip_bot,
+                            c_id=user_id,
+                            doc_f=renamed,
+                            query=query,
+                            full_path=renamed,
+                            log_msg=log_msg,
+                            split=False,
+                        )
                     await query.message.delete()
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
 
                     return shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
 
@@ -1193,9 +1545,16 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 splitdir = f"{Config.DOWNLOAD_LOCATION}/split/{user_id}"
                 os.makedirs(name=splitdir, exist_ok=True)
                 ooutput = f"{splitdir}/{newfname}"
-                splitfiles = await split_files(
-                    iinput=renamed, ooutput=ooutput, size=Config.TG_MAX_SIZE
-                )
+
+                async with job_slot(
+                    lane="split", user_id=user_id, message=query.message
+                ):
+                    splitfiles = await split_files(
+                        iinput=renamed,
+                        ooutput=ooutput,
+                        size=Config.TG_MAX_SIZE,
+                        user_id=user_id,
+                    )
 
                 if not splitfiles:
                     try:
@@ -1203,7 +1562,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     except:
                         pass
 
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     await query.message.edit(
                         text=messages.get(
                             file="callbacks", key="ERR_SPLIT", user_id=uid
@@ -1222,17 +1581,20 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 )
                 async_splitfiles = async_generator(splitfiles)
 
-                async for file in async_splitfiles:
-                    sent_files += 1
-                    await send_file(
-                        unzip_bot=unzip_bot,
-                        c_id=user_id,
-                        doc_f=file,
-                        query=query,
-                        full_path=splitdir,
-                        log_msg=log_msg,
-                        split=True,
-                    )
+                async with job_slot(
+                    lane="transfer", user_id=user_id, message=query.message
+                ):
+                    async for file in async_splitfiles:
+                        sent_files += 1
+                        await send_file(
+                            unzip_bot=unzip_bot,
+                            c_id=user_id,
+                            doc_f=file,
+                            query=query,
+                            full_path=splitdir,
+                            log_msg=log_msg,
+                            split=True,
+                        )
 
                 try:
                     shutil.rmtree(splitdir)
@@ -1240,7 +1602,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 except:
                     pass
 
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
 
                 try:
                     await unzip_bot.send_message(
@@ -1277,6 +1639,8 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 unzip_client=unzip_bot,
             )
 
+            entries = None
+
             # Attempt to fetch password protected archives
             if split_data[2] == "with_pass":
                 password = await unzip_bot.ask(
@@ -1285,10 +1649,17 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         file="callbacks", key="PLS_SEND_PASSWORD", user_id=uid
                     ),
                 )
-                ext_s_time = time()
-                extractor = await extr_files(
-                    path=ext_files_dir, archive_path=archive, password=password.text
-                )
+                async with job_slot(
+                    lane="extract", user_id=user_id, message=query.message
+                ):
+                    ext_s_time = time()
+                    extractor = await extr_files(
+                        path=ext_files_dir,
+                        archive_path=archive,
+                        password=password.text,
+                        user_id=user_id,
+                    )
+
                 ext_e_time = time()
                 await archive_msg.reply(
                     messages.get(
@@ -1296,39 +1667,62 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     )
                 )
             else:
-                ext_s_time = time()
+                async with job_slot(
+                    lane="extract", user_id=user_id, message=query.message
+                ):
+                    ext_s_time = time()
 
-                if fext == "rar":
-                    tested = await test_with_unrar_helper(archive)
-                else:
-                    tested = await test_with_7z_helper(archive)
-
-                ext_t_time = time()
-                testtime = TimeFormatter(round(number=ext_t_time - ext_s_time) * 1000)
+                    encrypted = await probe_encryption(
+                        archive_path=archive, file_type=fext
+                    )
 
-                if testtime == "":
-                    testtime = "1s"
+                    # Only test the whole archive when its headers can't tell
+                    if encrypted is not None:
+                        tested = not encrypted
+                    elif fext == "rar":
+                        tested = await test_with_unrar_helper(archive)
+                    else:
+                        tested = await test_with_7z_helper(archive)
+
+                    ext_t_time = time()
+                    testtime = TimeFormatter(
+                        round(number=ext_t_time - ext_s_time) * 1000
+                    )
 
-                await answer_query(
-                    query=query,
-                    message_text=messages.get(
-                        file="callbacks",
-                        key="AFTER_OK_TEST_TXT",
-                        user_id=uid,
-                        extra_args=testtime,
-                    ),
-                    unzip_client=unzip_bot,
-                )
+                    if testtime == "":
+                        testtime = "1s"
 
-                if tested:
-                    extractor = await extr_files(
-                        path=ext_files_dir, archive_path=archive
+                    await answer_query(
+                        query=query,
+                        message_text=messages.get(
+                            file="callbacks",
+                            key="AFTER_OK_TEST_TXT",
+                            user_id=uid,
+                            extra_args=testtime,
+                        ),
+                        unzip_client=unzip_bot,
                     )
-                    ext_e_time = time()
-                else:
-                    LOGGER.info(msg="Error on test")
-                    extractor = "Error"
-                    ext_e_time = time()
+
+                    if tested:
+                        if Config.LIST_BEFORE_EXTRACT:
+                            entries = await list_archive(archive)
+
+                        if entries:
+                            # Files are extracted when they're asked for (ext_f / ext_a)
+                            task_table.get(user_id)["archive"] = archive
+                            extractor = f"{len(entries)} files listed"
+                        else:
+                            extractor = await extr_files(
+                                path=ext_files_dir,
+                                archive_path=archive,
+                                user_id=user_id,
+                            )
+
+                        ext_e_time = time()
+                    else:
+                        LOGGER.info(msg="Error on test")
+                        extractor = "Error"
+                        ext_e_time = time()
 
             # Checks if there is an error happened while extracting the archive
             if any(err in extractor for err in ERROR_MSGS):
@@ -1339,7 +1733,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         )
                     )
                     shutil.rmtree(ext_files_dir)
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     await log_msg.reply(
                         text=messages.get(file="callbacks", key="EXT_FAILED_TXT")
                     )
@@ -1358,7 +1752,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         ),
                     )
                     shutil.rmtree(ext_files_dir)
-                    await del_ongoing_task(user_id)
+                    await end_task(user_id)
                     await archive_msg.reply(
                         messages.get(file="callbacks", key="EXT_FAILED_TXT")
                     )
@@ -1366,9 +1760,14 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     return
 
             # Check if user was dumb 😐
-            paths = await get_files(path=ext_files_dir)
+            if entries:
+                index = build_index(
+                    [(entry.name, entry.size) for entry in entries], refs=entries
+                )
+            else:
+                index = await task_index(user_id=user_id, path=ext_files_dir)
 
-            if not paths:
+            if not index:
                 await archive_msg.reply(
                     messages.get(file="callbacks", key="PASSWORD_PROTECTED")
                 )
@@ -1386,10 +1785,19 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     unzip_client=unzip_bot,
                 )
                 shutil.rmtree(ext_files_dir)
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
 
                 return
 
+            task = task_table.get(user_id)
+
+            if task is not None:
+                task["index"] = index
+
+                # The cache entry is only complete once all of them were sent
+                if task.get("cache_key"):
+                    task["cache_files"] = len(index)
+
             # Upload extracted files
             extrtime = TimeFormatter(round(number=ext_e_time - ext_s_time) * 1000)
 
@@ -1405,84 +1813,26 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             )
 
             try:
-                i_e_buttons = await make_keyboard(
-                    paths=paths,
-                    user_id=user_id,
-                    chat_id=query.message.chat.id,
-                    unziphttp=False,
-                )
-
-                try:
-                    await query.message.edit(
-                        text=messages.get(
-                            file="callbacks", key="SELECT_FILES", user_id=uid
-                        ),
-                        reply_markup=i_e_buttons,
-                    )
-                except ReplyMarkupTooLong:
-                    empty_buttons = await make_keyboard_empty(
-                        user_id=user_id, chat_id=query.message.chat.id, unziphttp=False
-                    )
-                    await query.message.edit(
-                        text=messages.get(
-                            file="callbacks", key="UNABLE_GATHER_FILES", user_id=uid
-                        ),
-                        reply_markup=empty_buttons,
-                    )
+                await show_picker(unzip_bot=unzip_bot, query=query, index=index)
             except:
-                try:
-                    await query.message.delete()
-                    i_e_buttons = await make_keyboard(
-                        paths=paths,
-                        user_id=user_id,
-                        chat_id=query.message.chat.id,
-                        unziphttp=False,
-                    )
-                    await unzip_bot.send_message(
-                        chat_id=query.message.chat.id,
-                        text=messages.get(
-                            file="callbacks", key="SELECT_FILES", user_id=uid
-                        ),
-                        reply_markup=i_e_buttons,
-                    )
-                except:
-                    try:
-                        await query.message.delete()
-                        empty_buttons = await make_keyboard_empty(
-                            user_id=user_id,
-                            chat_id=query.message.chat.id,
-                            unziphttp=False,
-                        )
-                        await unzip_bot.send_message(
-                            chat_id=query.message.chat.id,
-                            text=messages.get(
-                                file="callbacks", key="UNABLE_GATHER_FILES", user_id=uid
-                            ),
-                            reply_markup=empty_buttons,
-                        )
-                    except:
-                        await answer_query(
-                            query=query,
-                            message_text=messages.get(
-                                file="callbacks", key="EXT_FAILED_TXT", user_id=uid
-                            ),
-                            unzip_client=unzip_bot,
-                        )
-                        await archive_msg.reply(
-                            messages.get(
-                                file="callbacks", key="EXT_FAILED_TXT", user_id=uid
-                            )
-                        )
-                        shutil.rmtree(ext_files_dir)
-                        LOGGER.error(
-                            msg=messages.get(file="callbacks", key="FATAL_ERROR")
-                        )
-                        await del_ongoing_task(user_id)
+                await answer_query(
+                    query=query,
+                    message_text=messages.get(
+                        file="callbacks", key="EXT_FAILED_TXT", user_id=uid
+                    ),
+                    unzip_client=unzip_bot,
+                )
+                await archive_msg.reply(
+                    messages.get(file="callbacks", key="EXT_FAILED_TXT", user_id=uid)
+                )
+                shutil.rmtree(ext_files_dir)
+                LOGGER.error(msg=messages.get(file="callbacks", key="FATAL_ERROR"))
+                await end_task(user_id)
 
-                        return
+                return
 
         except Exception as e:
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
 
             try:
                 try:
@@ -1503,12 +1853,6 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     messages.get(file="callbacks", key="ERROR_TXT", extra_args=e)
                 )
                 shutil.rmtree(ext_files_dir)
-
-                try:
-                    await ClientSession().close()
-                except:
-                    pass
-
                 LOGGER.error(msg=e)
             except Exception as err:
                 LOGGER.error(msg=err)
@@ -1525,16 +1869,19 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         except:
             urled = False
 
+        task = task_table.get(user_id) or {}
+        index = None
+
         if urled:
             paths = spl_data[5].namelist()
         else:
-            paths = await get_files(path=file_path)
+            index = await task_index(user_id=user_id, path=file_path)
 
-        if not paths and not urled:
+        if not urled and not index:
             if os.path.isdir(f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}"):
                 shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}")
 
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
             await query.message.edit(
                 text=messages.get(file="callbacks", key="NO_FILE_LEFT", user_id=uid),
                 reply_markup=Buttons.RATE_ME,
@@ -1542,7 +1889,18 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
             return
 
-        LOGGER.info(msg="ext_f paths : " + str(paths))
+        entry = index.get(spl_data[3]) if index is not None else None
+
+        if index is not None and entry is None:
+            # Button of a file that was already sent (double tap, older message)
+            await query.answer(
+                text=messages.get(
+                    file="callbacks", key="FILE_ALREADY_SENT", user_id=uid
+                )
+            )
+            await show_picker(unzip_bot=unzip_bot, query=query, index=index)
+
+            return
 
         try:
             await query.message.edit(
@@ -1557,22 +1915,51 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
         if urled:
             file = spl_data[5].open(paths[int(spl_data[3])])
+        elif entry.ref is not None:
+            # Only the chosen file leaves the archive
+            async with job_slot(lane="extract", user_id=user_id, message=query.message):
+                file = await extract_entry(
+                    path=file_path,
+                    archive_path=task["archive"],
+                    entry=entry.ref,
+                    user_id=user_id,
+                )
+
+            if file is None:
+                sent_files -= 1
+
+                await unzip_bot.send_message(
+                    chat_id=user_id,
+                    text=messages.get(
+                        file="callbacks",
+                        key="EXTRACT_ENTRY_FAILED",
+                        user_id=uid,
+                        extra_args=os.path.basename(entry.name),
+                    ),
+                )
+
+                await show_picker(unzip_bot=unzip_bot, query=query, index=index)
+
+                return
         else:
-            file = paths[int(spl_data[3])]
+            file = f"{file_path}/{entry.name}"
 
         fsize = await get_size(file)
         split = False
 
         if fsize <= Config.TG_MAX_SIZE:
-            await send_file(
-                unzip_bot=unzip_bot,
-                c_id=spl_data[2],
-                doc_f=file,
-                query=query,
-                full_path=f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}",
-                log_msg=log_msg,
-                split=False,
-            )
+            async with job_slot(
+                lane="transfer", user_id=user_id, message=query.message
+            ):
+                await send_file(
+                    unzip_bot=unzip_bot,
+                    c_id=spl_data[2],
+                    doc_f=file,
+                    query=query,
+                    full_path=f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}",
+                    log_msg=log_msg,
+                    split=False,
+                )
         else:
             split = True
 
@@ -1587,46 +1974,64 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             splitdir = f"{Config.DOWNLOAD_LOCATION}/split/{user_id}"
             os.makedirs(name=splitdir, exist_ok=True)
             ooutput = f"{splitdir}/{fname}"
-            splitfiles = await split_files(
-                iinput=file, ooutput=ooutput, size=Config.TG_MAX_SIZE
-            )
-            LOGGER.info(msg=splitfiles)
+            parts = 0
+
+            # Each part is uploaded (then deleted) while the next one is written
+            try:
+                async with job_slot(lane="split", user_id=user_id, message=smessage):
+                    async with job_slot(
+                        lane="transfer", user_id=user_id, message=smessage
+                    ):
+                        async with aclosing(
+                            stream_split_files(
+                                iinput=file,
+                                ooutput=ooutput,
+                                size=Config.TG_MAX_SIZE,
+                                user_id=user_id,
+                            )
+                        ) as splitfiles:
+                            async for s_file in splitfiles:
+                                if parts == 0:
+                                    await smessage.edit(
+                                        text=messages.get(
+                                            file="callbacks",
+                                            key="SEND_ALL_PARTS",
+                                            user_id=uid,
+                                            extra_args=fname,
+                                        )
+                                    )
 
-            if not splitfiles:
+                                parts += 1
+                                sent_files += 1
+                                await send_file(
+                                    unzip_bot=unzip_bot,
+                                    c_id=user_id,
+                                    doc_f=s_file,
+                                    query=query,
+                                    full_path=splitdir,
+                                    log_msg=log_msg,
+                                    split=True,
+                                )
+            except SplitFailed as e:
+                # The parts already sent lack the first one, useless by themselves
+                LOGGER.error(msg=e)
+                parts = 0
+
+            LOGGER.info(msg=f"{fname} : {parts} parts sent")
+
+            if not parts:
                 try:
                     shutil.rmtree(splitdir)
                 except:
                     pass
 
-                await del_ongoing_task(user_id)
+                await end_task(user_id)
                 await smessage.edit(
                     text=messages.get(file="callbacks", key="ERR_SPLIT", user_id=uid)
                 )
 
                 return
 
-            await smessage.edit(
-                text=messages.get(
-                    file="callbacks",
-                    key="SEND_ALL_PARTS",
-                    user_id=uid,
-                    extra_args=fname,
-                )
-            )
-            async_splitfiles = async_generator(splitfiles)
-
-            async for file in async_splitfiles:
-                sent_files += 1
-                await send_file(
-                    unzip_bot=unzip_bot,
-                    c_id=user_id,
-                    doc_f=file,
-                    query=query,
-                    full_path=splitdir,
-                    log_msg=log_msg,
-                    split=True,
-                )
-
             try:
                 shutil.rmtree(splitdir)
                 os.remove(path=file)
@@ -1634,7 +2039,17 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 pass
 
             try:
-                await smessage.delete()
+                if Config.SPLIT_RANGES:
+                    await smessage.edit(
+                        text=messages.get(
+                            file="callbacks",
+                            key="JOIN_PARTS",
+                            user_id=uid,
+                            extra_args=[fname, fname, fname],
+                        )
+                    )
+                else:
+                    await smessage.delete()
             except:
                 pass
 
@@ -1645,7 +2060,8 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         if urled:
             rpaths = paths.remove(paths[int(spl_data[3])])
         else:
-            rpaths = await get_files(path=file_path)
+            index.remove(entry.id)
+            rpaths = len(index)
 
         if not rpaths:
             try:
@@ -1653,7 +2069,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             except:
                 pass
 
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
             await query.message.edit(
                 text=messages.get(file="callbacks", key="NO_FILE_LEFT", user_id=uid),
                 reply_markup=Buttons.RATE_ME,
@@ -1690,29 +2106,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                     reply_markup=empty_buttons,
                 )
         else:
-            try:
-                i_e_buttons = await make_keyboard(
-                    paths=rpaths,
-                    user_id=query.from_user.id,
-                    chat_id=query.message.chat.id,
-                    unziphttp=False,
-                )
-                await query.message.edit(
-                    text=messages.get(
-                        file="callbacks", key="SELECT_FILES", user_id=uid
-                    ),
-                    reply_markup=i_e_buttons,
-                )
-            except ReplyMarkupTooLong:
-                empty_buttons = await make_keyboard_empty(
-                    user_id=user_id, chat_id=query.message.chat.id, unziphttp=False
-                )
-                await query.message.edit(
-                    text=messages.get(
-                        file="callbacks", key="UNABLE_GATHER_FILES", user_id=uid
-                    ),
-                    reply_markup=empty_buttons,
-                )
+            await show_picker(unzip_bot=unzip_bot, query=query, index=index)
 
         await update_uploaded(user_id=user_id, upload_count=sent_files)
 
@@ -1727,12 +2121,16 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         except:
             urled = False
 
+        task = task_table.get(user_id) or {}
+        index = None
+
         if urled:
             paths = spl_data[4].namelist()
         else:
-            paths = await get_files(path=file_path)
+            index = await task_index(user_id=user_id, path=file_path)
+            paths = [f"{file_path}/{entry.name}" for entry in index.values()]
 
-        LOGGER.info("ext_a paths : " + str(paths))
+        LOGGER.info(f"ext_a : {len(paths)} files")
 
         if not paths and not urled:
             try:
@@ -1740,7 +2138,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             except:
                 pass
 
-            await del_ongoing_task(user_id)
+            await end_task(user_id)
             await query.message.edit(
                 text=messages.get(file="callbacks", key="NO_FILE_LEFT", user_id=uid),
                 reply_markup=Buttons.RATE_ME,
@@ -1751,30 +2149,68 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
         await query.message.edit(
             text=messages.get(file="callbacks", key="SENDING_ALL_FILES", user_id=uid)
         )
-        async_paths = async_generator(paths)
+        split_failed = False
+        turnstile = Turnstile() if Config.UPLOAD_ORDERED else None
+        cache_key = None if urled else task.get("cache_key")
+        total_size = index.total_size() if index is not None else 0
+
+        # One progress message for all the files instead of one per big file
+        progress = UploadProgress(
+            message=query.message,
+            unzip_bot=unzip_bot,
+            total=total_size,
+            ud_type=messages.get(
+                file="callbacks", key="SENDING_ALL_FILES", user_id=uid
+            ),
+        )
+
+        # Files are handed to the uploaders as soon as they are available
+        async def upload(position, file):
+            nonlocal sent_files, split_failed
+
+            if cancel_registry.is_cancelled(user_id):
+                raise PipelineCancelled
 
-        async for file in async_paths:
             sent_files += 1
 
+            entry = None
+
             if urled:
                 file = spl_data[4].open(file)
                 # security as we can't always retrieve the file size from URL
                 fsize = Config.TG_MAX_SIZE + 1
             else:
-                fsize = await get_size(file)
+                entry = index.find(os.path.relpath(file, file_path))
+                fsize = entry.size if entry is not None else await get_size(file)
 
             split = False
 
             if fsize <= Config.TG_MAX_SIZE:
-                await send_file(
-                    unzip_bot=unzip_bot,
-                    c_id=spl_data[2],
-                    doc_f=file,
-                    query=query,
-                    full_path=f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}",
-                    log_msg=log_msg,
-                    split=False,
-                )
+                if turnstile is not None:
+                    await turnstile.wait(position)
+
+                async with job_slot(
+                    lane="transfer", user_id=user_id, message=query.message
+                ):
+                    sent = await send_file(
+                        unzip_bot=unzip_bot,
+                        c_id=spl_data[2],
+                        doc_f=file,
+                        query=query,
+                        full_path=f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}",
+                        log_msg=log_msg,
+                        split=False,
+                        progress=progress.update,
+                        progress_args=(file,),
+                    )
+
+                if cache_key and entry is not None and sent_file_id(sent):
+                    archive_cache.record(
+                        key=cache_key,
+                        path=entry.name,
+                        size=fsize,
+                        file_ids=[sent_file_id(sent)],
+                    )
             else:
                 split = True
 
@@ -1786,21 +2222,71 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                         file="callbacks", key="SPLITTING", user_id=uid, extra_args=fname
                     ),
                 )
-                splitdir = f"{Config.DOWNLOAD_LOCATION}/split/{user_id}"
+                # One directory per file, as several of them may be split at once
+                splitdir = f"{Config.DOWNLOAD_LOCATION}/split/{user_id}/{position}"
                 os.makedirs(name=splitdir, exist_ok=True)
                 ooutput = f"{splitdir}/{fname}"
-                splitfiles = await split_files(
-                    iinput=file, ooutput=ooutput, size=Config.TG_MAX_SIZE
-                )
-                LOGGER.info(msg=splitfiles)
+                file_ids = []
 
-                if not splitfiles:
+                # The parts are sent as they're written, so their turn comes first
+                if turnstile is not None:
+                    await turnstile.wait(position)
+
+                try:
+                    async with job_slot(
+                        lane="split", user_id=user_id, message=smessage
+                    ):
+                        async with job_slot(
+                            lane="transfer", user_id=user_id, message=smessage
+                        ):
+                            async with aclosing(
+                                stream_split_files(
+                                    iinput=file,
+                                    ooutput=ooutput,
+                                    size=Config.TG_MAX_SIZE,
+                                    user_id=user_id,
+                                )
+                            ) as splitfiles:
+                                async for s_file in splitfiles:
+                                    if cancel_registry.is_cancelled(user_id):
+                                        break
+
+                                    if not file_ids:
+                                        await smessage.edit(
+                                            text=messages.get(
+                                                file="callbacks",
+                                                key="SEND_ALL_PARTS",
+                                                user_id=uid,
+                                                extra_args=fname,
+                                            )
+                                        )
+
+                                    sent_files += 1
+                                    sent = await send_file(
+                                        unzip_bot=unzip_bot,
+                                        c_id=user_id,
+                                        doc_f=s_file,
+                                        query=query,
+                                        full_path=splitdir,
+                                        log_msg=log_msg,
+                                        split=True,
+                                        progress=progress.update,
+                                        progress_args=(s_file,),
+                                    )
+                                    file_ids.append(sent_file_id(sent))
+                except SplitFailed as e:
+                    LOGGER.error(msg=e)
+                    file_ids = []
+
+                LOGGER.info(msg=f"{fname} : {len(file_ids)} parts sent")
+
+                if not file_ids and not cancel_registry.is_cancelled(user_id):
                     try:
                         shutil.rmtree(splitdir)
                     except:
                         pass
 
-                    await del_ongoing_task(user_id)
+                    split_failed = True
                     await smessage.edit(
                         text=messages.get(
                             file="callbacks", key="ERR_SPLIT", user_id=uid
@@ -1809,38 +2295,105 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
 
                     return
 
-                await smessage.edit(
-                    text=messages.get(
-                        file="callbacks",
-                        key="SEND_ALL_PARTS",
-                        user_id=uid,
-                        extra_args=fname,
-                    )
-                )
-                async_splitfiles = async_generator(splitfiles)
-
-                async for s_file in async_splitfiles:
-                    sent_files += 1
-                    await send_file(
-                        unzip_bot=unzip_bot,
-                        c_id=user_id,
-                        doc_f=s_file,
-                        query=query,
-                        full_path=splitdir,
-                        log_msg=log_msg,
-                        split=True,
+                if cache_key and entry is not None and file_ids and all(file_ids):
+                    archive_cache.record(
+                        key=cache_key, path=entry.name, size=fsize, file_ids=file_ids
                     )
 
                 try:
                     shutil.rmtree(splitdir)
+
+                    if Config.SPLIT_RANGES:
+                        os.remove(path=file)
                 except:
                     pass
 
                 try:
-                    await smessage.delete()
+                    if Config.SPLIT_RANGES:
+                        await smessage.edit(
+                            text=messages.get(
+                                file="callbacks",
+                                key="JOIN_PARTS",
+                                user_id=uid,
+                                extra_args=[fname, fname, fname],
+                            )
+                        )
+                    else:
+                        await smessage.delete()
                 except:
                     pass
 
+            # What's left to send, if the upload is stopped halfway
+            if entry is not None:
+                index.remove(entry.id)
+
+        # Listed archives are extracted now, each file is uploaded as soon as it's out
+        async def extracted_entries():
+            # The extract slot is released once extracted, not after the uploads
+            extracted = asyncio.Queue()
+
+            async def extract():
+                try:
+                    async with job_slot(lane="extract", user_id=user_id):
+                        async for target in extract_remaining(
+                            path=file_path,
+                            archive_path=task["archive"],
+                            names=[entry.name for entry in index.values() if entry.ref],
+                            user_id=user_id,
+                        ):
+                            extracted.put_nowait(target)
+                finally:
+                    extracted.put_nowait(None)
+
+            extraction = asyncio.create_task(extract())
+
+            try:
+                while (target := await extracted.get()) is not None:
+                    yield target
+
+                await extraction
+            finally:
+                extraction.cancel()
+                await asyncio.gather(extraction, return_exceptions=True)
+
+        if index is not None and task.get("archive"):
+            source = extracted_entries()
+        else:
+            source = async_generator(paths)
+
+        try:
+            await run_pipeline(
+                source=source,
+                handler=upload,
+                workers=upload_workers(unzip_bot),
+                turnstile=turnstile,
+            )
+        except (PipelineCancelled, ExtractionCancelled):
+            stop_reporter(query.message)
+            await acknowledge_cancel(user_id)
+            await end_task(user_id)
+
+            try:
+                shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}")
+            except:
+                pass
+
+            await query.message.edit(
+                text=messages.get(file="callbacks", key="UPLOAD_STOPPED", user_id=uid)
+            )
+
+            return
+        finally:
+            stop_reporter(query.message)
+
+        if split_failed:
+            await end_task(user_id)
+
+            return
+
+        if cache_key:
+            archive_cache.complete(key=cache_key, count=task.get("cache_files"))
+
         try:
             await unzip_bot.send_message(
                 chat_id=user_id,
@@ -1860,7 +2413,7 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
             )
         )
         await update_uploaded(user_id=user_id, upload_count=sent_files)
-        await del_ongoing_task(user_id)
+        await end_task(user_id)
 
         try:
             shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}")
@@ -1874,9 +2427,36 @@ async def unzip_cb(unzip_bot: Client, query: CallbackQuery):
                 messages.get(file="callbacks", key="ERROR_TXT", extra_args=e)
             )
 
+    elif query.data.startswith(("ext_p", "ext_d", "ext_s")):
+        user_id = query.from_user.id
+        spl_data = query.data.split("|")
+        index = await task_index(
+            user_id=user_id, path=f"{Config.DOWNLOAD_LOCATION}/{spl_data[1]}/extracted"
+        )
+
+        if spl_data[0] == "ext_p":
+            index.page = int(spl_data[3])
+        elif spl_data[0] == "ext_d":
+            index.open(int(spl_data[3]))
+        else:
+            f_filter = await unzip_bot.ask(
+                chat_id=query.message.chat.id,
+                text=messages.get(file="callbacks", key="FILTER_ASK", user_id=uid),
+            )
+
+            if not f_filter.text or not index.set_filter(f_filter.text):
+                await unzip_bot.send_message(
+                    chat_id=query.message.chat.id,
+                    text=messages.get(
+                        file="callbacks", key="FILTER_INVALID", user_id=uid
+                    ),
+                )
+
+        await show_picker(unzip_bot=unzip_bot, query=query, index=index)
+
     elif query.data == "cancel_dis":
         uid = query.from_user.id
-        await del_ongoing_task(uid)
+        await end_task(uid)
         await del_merge_task(uid)
 
         try:
@@ -16,26 +16,26 @@ from pyrogram.types import Message
 
 from config import Config
 from unzipbot import LOGGER, boottime, unzipbot_client
+from unzipbot.helpers.archive_cache import archive_cache
 from unzipbot.helpers.database import (
     add_banned_user,
     add_merge_task,
     add_user,
     check_user,
     count_banned_users,
-    count_ongoing_tasks,
     count_users,
     del_banned_user,
-    del_ongoing_task,
     del_user,
     get_lang,
     get_maintenance,
     get_merge_task,
-    get_ongoing_tasks,
     get_upload_mode,
     get_uploaded,
-    get_users_list,
+    is_vip,
+    iter_user_ids,
     set_maintenance,
 )
+from unzipbot.helpers.tasks import clear_tasks, task_table
 from unzipbot.helpers.unzip_help import (
     calculate_memory_limit,
     humanbytes,
@@ -79,31 +79,29 @@ async def _(_, message: Message):
     if uid == Config.BOT_OWNER:
         return
 
-    if await count_ongoing_tasks() >= Config.MAX_CONCURRENT_TASKS:
-        ogtasks = await get_ongoing_tasks()
-
-        if not any(uid == task.get("user_id") for task in ogtasks):
-            try:
-                await message.reply(
-                    text=messages.get(
-                        file="commands",
-                        key="MAX_TASKS",
-                        user_id=uid,
-                        extra_args=Config.MAX_CONCURRENT_TASKS,
-                    )
-                )
-            except:
-                await unzipbot_client.send_message(
-                    chat_id=uid,
-                    text=messages.get(
-                        file="commands",
-                        key="MAX_TASKS",
-                        user_id=uid,
-                        extra_args=Config.MAX_CONCURRENT_TASKS,
-                    ),
+    # Not a rejection, the heavy steps of the task wait in the scheduler's lanes
+    if not task_table.may_start(uid) and not await is_vip(uid):
+        try:
+            await message.reply(
+                text=messages.get(
+                    file="commands",
+                    key="MAX_TASKS",
+                    user_id=uid,
+                    extra_args=Config.MAX_CONCURRENT_TASKS,
                 )
+            )
+        except:
+            await unzipbot_client.send_message(
+                chat_id=uid,
+                text=messages.get(
+                    file="commands",
+                    key="MAX_TASKS",
+                    user_id=uid,
+                    extra_args=Config.MAX_CONCURRENT_TASKS,
+                ),
+            )
 
-            return
+        return
 
 
 @unzipbot_client.on_message(filters=filters.command(commands="start"))
@@ -335,9 +333,10 @@ async def get_stats(id):
     uptime = timeformat_sec(time.time() - boottime)
     total_users = await count_users()
     total_banned_users = await count_banned_users()
-    ongoing_tasks = await count_ongoing_tasks()
+    ongoing_tasks = len(task_table)
 
     if id == Config.BOT_OWNER:
+        cache_stats = archive_cache.stats()
         stats_string = messages.get(
             file="commands",
             key="STATS_OWNER",
@@ -350,6 +349,8 @@ async def get_stats(id):
                 disk_usage,
                 free,
                 ongoing_tasks,
+                cache_stats["entries"],
+                cache_stats["hit_rate"],
                 sent,
                 recv,
                 cpu_usage,
@@ -422,7 +423,6 @@ async def broadcast_this(_, message: Message):
 
         return
 
-    users_list = await get_users_list()
     success_no = 0
     failed_no = 0
     done_no = 0
@@ -436,8 +436,8 @@ async def broadcast_this(_, message: Message):
         )
     )
 
-    for user in users_list:
-        b_cast = await __do_broadcast(message=r_msg, user=user.get("user_id"))
+    async for user_id in iter_user_ids():
+        b_cast = await __do_broadcast(message=r_msg, user=user_id)
 
         if b_cast == 200:
             success_no += 1
@@ -852,7 +852,7 @@ async def del_everything(_, message: Message):
     filters=filters.command(commands="cleantasks") & filters.user(Config.BOT_OWNER)
 )
 async def del_tasks(_, message: Message):
-    ongoing_tasks = await get_ongoing_tasks()
+    ongoing_tasks = task_table.values()
     number = len(ongoing_tasks)
     uid = message.from_user.id
     cleaner = await message.reply(
@@ -861,12 +861,11 @@ async def del_tasks(_, message: Message):
         )
     )
 
-    for task in ongoing_tasks:
-        user_id = task.get("user_id")
-        await del_ongoing_task(user_id)
+    await clear_tasks()
 
+    for task in ongoing_tasks:
         try:
-            shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{user_id}")
+            shutil.rmtree(f"{Config.DOWNLOAD_LOCATION}/{task.get('user_id')}")
         except:
             pass
 
@@ -0,0 +1,618 @@
+import asyncio
+import bisect
+import io
+import itertools
+import lzma
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import zipfile
+import zlib
+
+from unzipbot import LOGGER
+from unzipbot.helpers.tasks import cancel_registry
+
+try:
+    import libarchive  # Optional, pip install libarchive-c
+except ImportError:
+    libarchive = None
+
+COPY_BUFFER = 1024 * 1024  # 1 MB
+# Signature, version, flags, method, time, date, CRC, packed size, size, name length
+# and extra length of a zip local file header
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+class UnsupportedArchive(Exception):
+    # Something the in-process engines can't read, but 7z / unrar may
+    pass
+
+
+class ExtractionCancelled(Exception):
+    pass
+
+
+# What the in-process engines raise on archives they can't handle, in which case
+# extraction falls back to 7z / unrar. Anything else (a full disk, a bug) is a real
+# failure and must not be retried
+ENGINE_ERRORS = (
+    EOFError,
+    UnsupportedArchive,
+    lzma.LZMAError,
+    tarfile.TarError,
+    zipfile.BadZipFile,
+    zipfile.LargeZipFile,
+    zlib.error,
+)
+
+if libarchive is not None:
+    ENGINE_ERRORS += (libarchive.ArchiveError,)
+
+
+class ArchiveEntry:
+    __slots__ = ("name", "size", "packed", "is_dir", "ref", "encrypted")
+
+    def __init__(self, name, size, is_dir, ref=None, encrypted=False, packed=None):
+        """
+        A member of an archive, as listed by an engine
+
+        :param name: Path of the entry inside the archive
+        :param size: Uncompressed size (in bytes)
+        :param is_dir: Whether the entry is a directory
+        :param ref: Backend specific handle (ZipInfo, TarInfo…)
+        :param encrypted: Whether the entry needs a password
+        :param packed: Compressed size (in bytes), None if unknown
+        """
+        self.name = name
+        self.size = size
+        self.packed = packed
+        self.is_dir = is_dir
+        self.ref = ref
+        self.encrypted = encrypted
+
+
+class VolumeReader(io.RawIOBase):
+    def __init__(self, paths, spanned=False, sizes=None, timeout=None):
+        """
+        Read the volumes of a split archive as a single file, without joining them
+
+        :param paths: Paths of the volumes, in order
+        :param spanned: Whether it's a spanned zip (.z01, .z02, …, .zip), whose
+        offsets count from the start of each volume
+        :param sizes: Expected size of each volume when they're still downloading,
+        reads then wait for volume_ready() (or fail after abort())
+        :param timeout: Seconds a read waits for a volume before failing
+        """
+        super().__init__()
+        self.paths = paths
+        self.spanned = spanned
+        self.name = paths[0]
+        self.sizes = sizes or [os.stat(path).st_size for path in paths]
+        self.starts = list(itertools.accumulate([0] + self.sizes[:-1]))
+        self.size = sum(self.sizes)
+        self.position = 0
+        self.fds = {}
+        self.ready = [sizes is None] * len(paths)
+        self.aborted = False
+        self.timeout = timeout
+        self.condition = threading.Condition()
+
+    def volume_ready(self, volume):
+        with self.condition:
+            self.ready[volume] = True
+            self.condition.notify_all()
+
+    def abort(self):
+        # Wakes up the reads waiting for a volume that won't come
+        with self.condition:
+            self.aborted = True
+            self.condition.notify_all()
+
+    def __wait(self, volume):
+        if self.ready[volume]:
+            return
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.ready[volume] or self.aborted, timeout=self.timeout
+            )
+
+        if not self.ready[volume]:
+            raise EOFError(f"Volume {volume + 1} of {len(self.paths)} is missing")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        self.position = max(0, min(offset, self.size))
+
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        # Filled across volume boundaries, the engines expect full reads
+        done = 0
+
+        with memoryview(buffer) as view:
+            while done < len(view) and self.position < self.size:
+                volume = bisect.bisect_right(self.starts, self.position) - 1
+                offset = self.position - self.starts[volume]
+                length = min(len(view) - done, self.sizes[volume] - offset)
+                self.__wait(volume)
+
+                if volume not in self.fds:
+                    self.fds[volume] = os.open(self.paths[volume], os.O_RDONLY)
+
+                read = os.preadv(self.fds[volume], [view[done : done + length]], offset)
+
+                if read == 0:
+                    break
+
+                done += read
+                self.position += read
+
+        return done
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+
+        self.fds.clear()
+        super().close()
+
+
+class ZipEngine:
+    name = "zipfile"
+
+    def __init__(self, archive_path, password=None):
+        self.archive = zipfile.ZipFile(file=archive_path)
+
+        if password:
+            self.archive.setpassword(password.encode(encoding="utf-8"))
+
+        if getattr(archive_path, "spanned", False):
+            self.__rebase(starts=archive_path.starts)
+
+    def __rebase(self, starts):
+        # zipfile only knows single volume archives and shifted every offset by the
+        # start of the volume holding the central directory
+        cd_volume = bisect.bisect_right(starts, self.archive.start_dir) - 1
+
+        for info in self.archive.infolist():
+            info.header_offset += starts[info.volume] - starts[cd_volume]
+
+        # CPython 3.12+ (and the security releases of older branches, gh-109858)
+        # reject an entry running past the next header, using bounds computed from
+        # the offsets before they were rebased. The private _end_offset is the only
+        # way to update them, and is left alone if missing : the check then fails
+        # with BadZipFile and 7z takes over
+        end_offset = self.archive.start_dir
+
+        for info in sorted(
+            self.archive.infolist(), key=lambda info: info.header_offset, reverse=True
+        ):
+            if hasattr(info, "_end_offset"):
+                info._end_offset = end_offset
+
+            end_offset = info.header_offset
+
+    @staticmethod
+    def can_open(archive_path):
+        return zipfile.is_zipfile(archive_path)
+
+    def iter_entries(self):
+        for info in self.archive.infolist():
+            yield ArchiveEntry(
+                name=info.filename,
+                size=info.file_size,
+                is_dir=info.is_dir(),
+                ref=info,
+                encrypted=bool(info.flag_bits & 0x1),
+                packed=info.compress_size,
+            )
+
+    def open_entry(self, entry):
+        try:
+            return self.archive.open(entry.ref)
+        except (NotImplementedError, RuntimeError) as e:
+            # Unsupported compression (ex AES), or a missing / wrong password
+            raise UnsupportedArchive(e) from e
+
+    def stream(self):
+        for entry in self.iter_entries():
+            if entry.is_dir:
+                yield entry, None
+            else:
+                with self.open_entry(entry) as fileobj:
+                    yield entry, fileobj
+
+    def close(self):
+        self.archive.close()
+
+
+class ZipStreamEngine:
+    name = "zipfile (stream)"
+
+    def __init__(self, archive_path, password=None):
+        # Reads the local headers from start to end, the central directory (at the
+        # end of the archive) is never needed
+        self.archive_path = archive_path
+
+    @staticmethod
+    def can_open(archive_path):
+        if isinstance(archive_path, str):
+            return False
+
+        archive_path.seek(0)
+
+        # Spanned zips start with a data descriptor signature
+        return archive_path.read(4) in (b"PK\x03\x04", b"PK\x07\x08")
+
+    @staticmethod
+    def __zip64_sizes(extra, size, packed):
+        while len(extra) >= 4:
+            tag, length = struct.unpack("<HH", extra[:4])
+
+            if tag == 0x0001 and length >= 16:
+                return struct.unpack("<QQ", extra[4:20])
+
+            extra = extra[4 + length :]
+
+        return size, packed
+
+    def iter_entries(self):
+        for entry, _ in self.stream():
+            yield entry
+
+    def open_entry(self, entry):
+        raise UnsupportedArchive("Entries can only be read in order")
+
+    def stream(self):
+        fileobj = self.archive_path
+        fileobj.seek(0)
+
+        if fileobj.read(4) != b"PK\x07\x08":
+            fileobj.seek(0)
+
+        while True:
+            header = fileobj.read(ZIP_LOCAL_HEADER.size)
+
+            # The central directory (or the end of the archive) is reached
+            if len(header) < ZIP_LOCAL_HEADER.size or not header.startswith(
+                b"PK\x03\x04"
+            ):
+                return
+
+            _, _, flags, method, _, _, crc, packed, size, name_length, extra_length = (
+                ZIP_LOCAL_HEADER.unpack(header)
+            )
+            name = fileobj.read(name_length).decode(
+                encoding="utf-8" if flags & 0x800 else "cp437"
+            )
+            size, packed = self.__zip64_sizes(
+                extra=fileobj.read(extra_length), size=size, packed=packed
+            )
+
+            if flags & 0x1:
+                raise UnsupportedArchive(f"{name} is encrypted")
+
+            if flags & 0x8:
+                raise UnsupportedArchive(f"{name} has its sizes after its data")
+
+            info = zipfile.ZipInfo(filename=name)
+            info.flag_bits = flags
+            info.compress_type = method
+            info.CRC = crc
+            info.compress_size = packed
+            info.file_size = size
+            entry = ArchiveEntry(
+                name=name, size=size, is_dir=info.is_dir(), ref=info, packed=packed
+            )
+            start = fileobj.tell()
+
+            if entry.is_dir:
+                yield entry, None
+            else:
+                # Decompresses and checks the CRC, reading no further than the entry
+                try:
+                    member = zipfile.ZipExtFile(fileobj=fileobj, mode="r", zipinfo=info)
+                except NotImplementedError as e:
+                    raise UnsupportedArchive(e) from e
+
+                with member:
+                    yield entry, member
+
+            fileobj.seek(start + packed)
+
+    def close(self):
+        pass
+
+
+class TarEngine:
+    name = "tarfile"
+
+    def __init__(self, archive_path, password=None):
+        self.archive_path = archive_path
+        self.archive = None
+
+    @staticmethod
+    def can_open(archive_path):
+        try:
+            if not isinstance(archive_path, str):
+                archive_path.seek(0)
+
+            return tarfile.is_tarfile(archive_path)
+        except ENGINE_ERRORS:
+            return False
+
+    def __open(self, mode):
+        if isinstance(self.archive_path, str):
+            return tarfile.open(name=self.archive_path, mode=mode)
+
+        self.archive_path.seek(0)
+
+        return tarfile.open(fileobj=self.archive_path, mode=mode)
+
+    @staticmethod
+    def __entry(info):
+        return ArchiveEntry(
+            name=info.name, size=info.size, is_dir=info.isdir(), ref=info
+        )
+
+    def iter_entries(self):
+        # Streaming mode, compressed tarballs are read once from start to end
+        with self.__open(mode="r|*") as archive:
+            for info in archive:
+                if info.isfile() or info.isdir():
+                    yield self.__entry(info)
+
+    def open_entry(self, entry):
+        # Random access needs a seekable archive, only opened when asked for
+        if self.archive is None:
+            self.archive = self.__open(mode="r:*")
+
+        return self.archive.extractfile(entry.ref.name)
+
+    def stream(self):
+        with self.__open(mode="r|*") as archive:
+            for info in archive:
+                # Links and special files are skipped, like the "data" filter does
+                if info.isdir():
+                    yield self.__entry(info), None
+                elif info.isfile():
+                    yield self.__entry(info), archive.extractfile(info)
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+class LibarchiveEngine:
+    name = "libarchive"
+
+    def __init__(self, archive_path, password=None):
+        self.archive_path = archive_path
+        self.password = password
+
+    @staticmethod
+    def can_open(archive_path):
+        # unrar handles RAR archives better than libarchive does
+        return (
+            libarchive is not None
+            and isinstance(archive_path, str)
+            and not archive_path.endswith(".rar")
+        )
+
+    def __reader(self):
+        return libarchive.file_reader(self.archive_path, passphrase=self.password)
+
+    def iter_entries(self):
+        with self.__reader() as archive:
+            for entry in archive:
+                if entry.isfile or entry.isdir:
+                    yield ArchiveEntry(
+                        name=entry.pathname, size=entry.size, is_dir=entry.isdir
+                    )
+
+    def open_entry(self, entry):
+        # Sequential format, read up to the entry and buffer it
+        with self.__reader() as archive:
+            for member in archive:
+                if member.pathname == entry.name:
+                    return BlocksReader(list(member.get_blocks()))
+
+        raise UnsupportedArchive(f"{entry.name} isn't in the archive")
+
+    def stream(self):
+        with self.__reader() as archive:
+            for member in archive:
+                entry = ArchiveEntry(
+                    name=member.pathname, size=member.size, is_dir=member.isdir
+                )
+
+                if member.isdir:
+                    yield entry, None
+                elif member.isfile:
+                    yield entry, BlocksReader(member.get_blocks())
+
+    def close(self):
+        pass
+
+
+class BlocksReader:
+    # Minimal file object over an iterable of bytes blocks
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            block = next(self.blocks, None)
+
+            if block is None:
+                break
+
+            self.buffer += block
+
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+
+        return data
+
+    def close(self):
+        pass
+
+
+ENGINES = [ZipEngine, TarEngine, LibarchiveEngine]
+# Engines reading an archive in a single pass, before it's complete
+STREAM_ENGINES = [ZipStreamEngine, TarEngine]
+
+
+def open_archive(archive_path, password=None):
+    """
+    Pick the first in-process engine able to read an archive
+
+    :param archive_path: Path to the archive, or a VolumeReader of its volumes
+    :param password: Optional password
+    :return: An engine instance, or None if only 7z / unrar can read it
+    """
+    for engine in ENGINES:
+        if engine.can_open(archive_path):
+            try:
+                return engine(archive_path=archive_path, password=password)
+            except ENGINE_ERRORS as e:
+                LOGGER.info(msg=f"{engine.name} : {e}")
+
+    return None
+
+
+def open_stream(archive_path, password=None):
+    """
+    Pick an engine reading an archive from start to end only, that can extract the
+    first entries of a VolumeReader while its last volumes are still downloading
+
+    :param archive_path: A VolumeReader
+    :param password: Optional password
+    :return: An engine instance, or None if the archive needs random access
+    """
+    for engine in STREAM_ENGINES:
+        if engine.can_open(archive_path):
+            return engine(archive_path=archive_path, password=password)
+
+    return None
+
+
+def __safe_path(root, name):
+    # Drop absolute paths and anything escaping the extraction directory
+    target = os.path.realpath(os.path.join(root, name.lstrip("/\\")))
+
+    if target != root and not target.startswith(root + os.sep):
+        return None
+
+    return target
+
+
+def __write_entry(fileobj, target, user_id):
+    os.makedirs(name=os.path.dirname(target), exist_ok=True)
+
+    with open(file=target, mode="wb") as out:
+        while True:
+            if user_id is not None and cancel_registry.is_cancelled(user_id):
+                raise ExtractionCancelled
+
+            chunk = fileobj.read(COPY_BUFFER)
+
+            if not chunk:
+                break
+
+            out.write(chunk)
+
+
+async def __in_thread(executor, func, *args):
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def extract_entries(engine, path, user_id=None, names=None, executor=None):
+    """
+    Extract an archive entry by entry, without blocking the event loop
+
+    :param engine: An engine returned by open_archive()
+    :param path: Directory to extract to
+    :param user_id: The user's ID, checked for cancellation between chunks
+    :param names: Only extract the files with these names (all of them if None)
+    :param executor: Where the reads run, the default executor if None
+    :return: Async generator of the extracted file paths, in archive order
+    """
+    root = os.path.realpath(path)
+    stream = engine.stream()
+
+    try:
+        while True:
+            item = await __in_thread(executor, next, stream, None)
+
+            if item is None:
+                break
+
+            entry, fileobj = item
+            target = __safe_path(root, entry.name)
+
+            if target is None:
+                LOGGER.warning(msg=f"Skipped unsafe path : {entry.name}")
+            elif entry.is_dir:
+                os.makedirs(name=target, exist_ok=True)
+            elif names is None or entry.name in names:
+                await __in_thread(executor, __write_entry, fileobj, target, user_id)
+
+                yield target
+    finally:
+        stream.close()
+        engine.close()
+
+
+async def extract_member(engine, entry, path, user_id=None):
+    """
+    Extract a single entry of an archive
+
+    :param engine: An engine returned by open_archive()
+    :param entry: The ArchiveEntry to extract, as listed by the same kind of engine
+    :param path: Directory to extract to
+    :param user_id: The user's ID, checked for cancellation between chunks
+    :return: Path of the extracted file, None if the entry's path is unsafe
+    """
+    target = __safe_path(os.path.realpath(path), entry.name)
+
+    if target is None:
+        LOGGER.warning(msg=f"Skipped unsafe path : {entry.name}")
+
+        return None
+
+    fileobj = await asyncio.to_thread(engine.open_entry, entry)
+
+    try:
+        await asyncio.to_thread(__write_entry, fileobj, target, user_id)
+    finally:
+        fileobj.close()
+
+    return target
+
+
+def reset_directory(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(name=path, exist_ok=True)
@@ -0,0 +1,202 @@
+import asyncio
+import os
+
+from aiohttp import ClientError, ClientTimeout
+from pyrogram.errors import FloodPremiumWait, FloodWait
+
+from config import Config
+from unzipbot import LOGGER
+from unzipbot.helpers.database import get_lang
+from unzipbot.i18n.messages import Messages
+
+messages = Messages(lang_fetcher=get_lang)
+
+
+class RangesUnsupported(Exception):
+    pass
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class DownloadFailed(Exception):
+    pass
+
+
+# Split [0, total_size) into at most `connections` inclusive byte ranges
+def split_ranges(total_size, connections):
+    count = max(1, min(connections, total_size // Config.DL_RANGE_MIN_SIZE))
+    step = -(-total_size // count)
+
+    return [
+        (start, min(start + step, total_size) - 1)
+        for start in range(0, total_size, step)
+    ]
+
+
+async def __fetch_range(session, url, fd, start, end, state):
+    position = start
+    attempts = 0
+
+    while position <= end:
+        try:
+            async with session.get(
+                url=url,
+                headers={"Range": f"bytes={position}-{end}"},
+                timeout=ClientTimeout(
+                    total=None, sock_connect=30, sock_read=Config.DL_READ_TIMEOUT
+                ),
+                allow_redirects=True,
+            ) as resp:
+                if resp.status != 206:
+                    raise RangesUnsupported(resp.status)
+
+                async for chunk in resp.content.iter_chunked(Config.DL_RANGE_CHUNK):
+                    if state["is_cancelled"]():
+                        raise DownloadCancelled
+
+                    # Servers may send more than asked, never write past the range
+                    chunk = chunk[: end - position + 1]
+                    await asyncio.to_thread(os.pwrite, fd, chunk, position)
+                    position += len(chunk)
+                    state["current"] += len(chunk)
+                    attempts = 0
+
+                    if state["progress"] is not None:
+                        await state["progress"](state["current"], state["total"])
+
+                    if position > end:
+                        break
+
+            if position <= end:
+                raise ClientError("connection closed before the end of the range")
+        except (ClientError, asyncio.TimeoutError) as e:
+            attempts += 1
+
+            if attempts > Config.DL_RETRIES:
+                raise
+
+            LOGGER.warning(
+                msg=messages.get(
+                    file="dl_helper",
+                    key="RANGE_RETRY",
+                    extra_args=[start, end, url, e, position],
+                )
+            )
+            await asyncio.sleep(min(2 ** (attempts - 1), 30))
+
+
+async def download_ranges(
+    session,
+    url,
+    path,
+    total_size,
+    connections=Config.DL_CONNECTIONS,
+    progress=None,
+    is_cancelled=lambda: False,
+):
+    """
+    Download a file over several connections, each one fetching a byte range
+
+    :param session: The aiohttp ClientSession to use
+    :param url: URL of the file, the server must honor Range requests
+    :param path: Where to write the file
+    :param total_size: Size of the file, as reported by Content-Length
+    :param connections: Maximum number of simultaneous range requests
+    :param progress: Coroutine function awaited with (current, total)
+    :param is_cancelled: Callable checked before writing each chunk
+    :return: True once downloaded, False if cancelled
+    """
+    state = {
+        "current": 0,
+        "total": total_size,
+        "progress": progress,
+        "is_cancelled": is_cancelled,
+    }
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    try:
+        # Reserve the space upfront, every range then writes at its own offset
+        try:
+            os.posix_fallocate(fd, 0, total_size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total_size)
+
+        workers = [
+            asyncio.create_task(
+                __fetch_range(
+                    session=session, url=url, fd=fd, start=start, end=end, state=state
+                )
+            )
+            for start, end in split_ranges(
+                total_size=total_size, connections=connections
+            )
+        ]
+
+        try:
+            await asyncio.gather(*workers)
+        except DownloadCancelled:
+            return False
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+            await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        os.close(fd)
+
+    return True
+
+
+async def download_message(
+    message, path, progress=None, progress_args=(), is_cancelled=lambda: False
+):
+    """
+    Download the file of a Telegram message, trying again when it fails
+
+    :param message: The message holding the file
+    :param path: Where to write the file
+    :param progress: Progress callback given to Pyrogram
+    :param progress_args: Extra arguments of the progress callback
+    :param is_cancelled: Callable checked before each try
+    :return: True once downloaded, False if cancelled
+    """
+    attempts = 0
+
+    while not is_cancelled():
+        try:
+            # Pyrogram returns None instead of raising on most errors
+            if await message.download(
+                file_name=path, progress=progress, progress_args=progress_args
+            ):
+                return True
+
+            error = "nothing was downloaded"
+        except (FloodWait, FloodPremiumWait) as f:
+            await asyncio.sleep(f.value)
+
+            continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+
+        if is_cancelled():
+            break
+
+        attempts += 1
+
+        if attempts > Config.DL_RETRIES:
+            raise DownloadFailed(f"{os.path.basename(path)} : {error}")
+
+        LOGGER.warning(
+            msg=messages.get(
+                file="dl_helper",
+                key="DOWNLOAD_RETRY",
+                extra_args=[os.path.basename(path), error, attempts],
+            )
+        )
+        await asyncio.sleep(min(2 ** (attempts - 1), 30))
+
+    return False
@@ -1,5 +1,8 @@
+import asyncio
+import concurrent.futures
 import os
 import shutil
+import signal
 from asyncio import create_subprocess_shell, subprocess
 from shlex import quote
 
@@ -9,12 +12,45 @@ from pyrogram.types import InlineKeyboardButton
 from config import Config
 from unzipbot import LOGGER
 from unzipbot.helpers.database import get_lang
-from unzipbot.helpers.unzip_help import calculate_memory_limit, tarball_extensions
+from unzipbot.helpers.tasks import acknowledge_cancel, cancel_registry
+from unzipbot.helpers.unzip_help import (
+    ENCRYPTED_HEADERS_MSGS,
+    ERROR_MSGS,
+    NOT_A_TAR_MSGS,
+    calculate_memory_limit,
+    tarball_extensions,
+    zstd_extensions,
+)
 from unzipbot.i18n.messages import Messages
+from unzipbot.modules.ext_script.archive_engine import (
+    ENGINE_ERRORS,
+    ArchiveEntry,
+    ExtractionCancelled,
+    UnsupportedArchive,
+    VolumeReader,
+    ZipEngine,
+    extract_entries,
+    extract_member,
+    open_archive,
+    open_stream,
+    reset_directory,
+)
+from unzipbot.modules.ext_script.file_range import split_ranges
 
 messages = Messages(lang_fetcher=get_lang)
 
 
+class SplitFailed(Exception):
+    pass
+
+
+# Reads of volumes still downloading block for a long time, they get their own
+# threads instead of starving the default executor
+volume_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=Config.MERGE_STREAM_THREADS, thread_name_prefix="volumes"
+)
+
+
 # Get files in directory as a list
 async def get_files(path):
     path_list = [
@@ -38,28 +74,51 @@ async def cleanup_macos_artifacts(extraction_path):
                 shutil.rmtree(os.path.join(root, name))
 
 
-async def run_shell_cmds(command):
+# Run a command within the RAM and CPU limits
+def __limited(command, cpu=True):
     memlimit = calculate_memory_limit()
     cpulimit = Config.MAX_CPU_CORES_COUNT * Config.MAX_CPU_USAGE
-    ulimit_cmd = [
-        "ulimit",
-        "-v",
-        str(memlimit),
-        "&&",
-        "cpulimit",
-        "-l",
-        str(cpulimit),
-        "--",
-        command,
-    ]
-    ulimit_command = " ".join(ulimit_cmd)
+    ulimit_cmd = ["ulimit", "-v", str(memlimit), "&&"]
+
+    if cpu:
+        ulimit_cmd += ["cpulimit", "-l", str(cpulimit), "--", command]
+    else:
+        # The shell is replaced, the process is the command itself
+        ulimit_cmd += ["exec", command]
+
+    return " ".join(ulimit_cmd)
+
+
+async def run_shell_cmds(command, user_id=None):
     process = await create_subprocess_shell(
-        cmd=ulimit_command,
+        cmd=__limited(command),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         executable="/bin/bash",
+        start_new_session=True,
     )
-    stdout, stderr = await process.communicate()
+    communicate = asyncio.ensure_future(process.communicate())
+    cancelled = False
+
+    if user_id is not None:
+        # Kill the whole process group (bash, cpulimit, 7z…) if the user cancels
+        cancel_wait = asyncio.ensure_future(cancel_registry.wait(user_id))
+        await asyncio.wait(
+            [communicate, cancel_wait], return_when=asyncio.FIRST_COMPLETED
+        )
+        cancel_wait.cancel()
+
+        if not communicate.done():
+            cancelled = True
+
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+            await acknowledge_cancel(user_id)
+
+    stdout, stderr = await communicate
 
     e = stderr.decode(encoding="utf-8", errors="replace")
     o = stdout.decode(encoding="utf-8", errors="replace")
@@ -67,11 +126,15 @@ async def run_shell_cmds(command):
     LOGGER.info(msg=f"stdout : {o}")
     LOGGER.info(msg=f"stderr : {e}")
 
+    if cancelled:
+        # Picked up by the ERROR_MSGS check of the callers
+        e += "\nError : cancelled by the user"
+
     return o + "\n" + e
 
 
 # Extract with 7z
-async def __extract_with_7z_helper(path, archive_path, password=None):
+async def __extract_with_7z_helper(path, archive_path, password=None, user_id=None):
     LOGGER.info(msg="7z : " + archive_path + " : " + path)
 
     if password:
@@ -86,7 +149,7 @@ async def __extract_with_7z_helper(path, archive_path, password=None):
     else:
         cmd = ["7z", "x", f"-o{quote(path)}", quote(archive_path), "-y"]
 
-    result = await run_shell_cmds(" ".join(cmd))
+    result = await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
 
     return result
 
@@ -100,7 +163,7 @@ async def test_with_7z_helper(archive_path):
     return "Everything is Ok" in result
 
 
-async def __extract_with_unrar_helper(path, archive_path, password=None):
+async def __extract_with_unrar_helper(path, archive_path, password=None, user_id=None):
     LOGGER.info(msg="unrar : " + archive_path + " : " + path)
 
     if password:
@@ -115,7 +178,7 @@ async def __extract_with_unrar_helper(path, archive_path, password=None):
     else:
         cmd = ["unrar", "x", quote(archive_path), quote(path), "-y"]
 
-    result = await run_shell_cmds(" ".join(cmd))
+    result = await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
 
     return result
 
@@ -129,60 +192,378 @@ async def test_with_unrar_helper(archive_path):
     return "All OK" in result
 
 
-# Extract with zstd (for .tar.zst files)
-async def __extract_with_zstd(path, archive_path):
-    cmd = ["zstd", "-f", "--output-dir-flat", quote(path), "-d", quote(archive_path)]
+def __zip_encryption(archive_path):
+    engine = ZipEngine(archive_path=archive_path)
+
+    try:
+        return any(entry.encrypted for entry in engine.iter_entries())
+    finally:
+        engine.close()
+
+
+async def probe_encryption(archive_path, file_type=None):
+    """
+    Read only the headers of an archive to know if it needs a password, instead of
+    decompressing all of it with a test
+
+    :param archive_path: Path to the archive
+    :param file_type: "rar" to ask unrar instead of 7z
+    :return: True if a password is needed, False if not, None if the headers can't tell
+    """
+    if ZipEngine.can_open(archive_path):
+        try:
+            return await asyncio.to_thread(__zip_encryption, archive_path)
+        except ENGINE_ERRORS:
+            pass
+
+    # skipcq: PTC-W1006, SCT-A000
+    password = "dont care + didnt ask + cry about it + stay mad + get real + L"
+
+    if file_type == "rar":
+        cmd = ["unrar", "lt", f"-p{quote(password)}", quote(archive_path), "-y"]
+        result = await run_shell_cmds(" ".join(cmd))
+        lines = [line.strip() for line in result.splitlines()]
+
+        if any(msg in result for msg in ENCRYPTED_HEADERS_MSGS) or any(
+            line.startswith("Flags:") and "encrypted" in line for line in lines
+        ):
+            return True
+
+        if any(line.startswith("Name:") for line in lines):
+            return False
+
+        return None
+
+    cmd = ["7z", "l", "-slt", f"-p{quote(password)}", quote(archive_path), "-y"]
     result = await run_shell_cmds(" ".join(cmd))
 
+    if "Encrypted = +" in result or any(
+        msg in result for msg in ENCRYPTED_HEADERS_MSGS
+    ):
+        return True
+
+    if "Encrypted = -" in result:
+        return False
+
+    return None
+
+
+# Extract with zstd (for single .zst files)
+async def __extract_with_zstd(path, archive_path, user_id=None):
+    cmd = ["zstd", "-f", "--output-dir-flat", quote(path), "-d", quote(archive_path)]
+    result = await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
+
     return result
 
 
-# Main function to extract files
-async def extr_files(path, archive_path, password=None):
-    os.makedirs(name=path, exist_ok=True)
+# Pipe the decompressor straight into tar, the .tar itself never touches the disk
+async def __extract_tar_stream(path, archive_path, user_id=None):
+    if archive_path.endswith(zstd_extensions):
+        decompress = ["zstd", "-dc", quote(archive_path)]
+    else:
+        decompress = ["7z", "x", "-so", quote(archive_path)]
+
+    untar = ["tar", "-xvf", "-", "-C", quote(path)]
+    pipeline = " ".join(decompress) + " | " + " ".join(untar)
+    cmd = ["bash", "-o", "pipefail", "-c", quote(pipeline)]
+    result = await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
+
+    return result
+
+
+# Extract in-process (zipfile, tarfile, libarchive), None if 7z / unrar is needed
+async def __extract_with_engine(path, archive_path, password=None, user_id=None):
+    engine = open_archive(archive_path=archive_path, password=password)
+
+    if engine is None:
+        return None
 
-    if archive_path.endswith(tarball_extensions):
+    LOGGER.info(
+        msg=f"{engine.name} : {getattr(archive_path, 'name', archive_path)} : {path}"
+    )
+    count = 0
+
+    try:
+        async for _ in extract_entries(engine=engine, path=path, user_id=user_id):
+            count += 1
+    except ExtractionCancelled:
+        await acknowledge_cancel(user_id)
+
+        return "Error : cancelled by the user"
+    except ENGINE_ERRORS as e:
+        LOGGER.info(msg=f"{engine.name} failed ({e}), falling back")
+        reset_directory(path)
+
+        return None
+
+    return f"{engine.name} : {count} files extracted"
+
+
+# Extract with 7z / unrar / zstd subprocesses
+async def __extract_with_shell(path, archive_path, password=None, user_id=None):
+    if archive_path.endswith(tarball_extensions + zstd_extensions):
         LOGGER.info(msg="tar")
-        temp_path = path.rsplit("/", 1)[0] + "/tar_temp"
-        os.makedirs(name=temp_path, exist_ok=True)
-        result = await __extract_with_7z_helper(
-            path=temp_path, archive_path=archive_path
+        result = await __extract_tar_stream(
+            path=path, archive_path=archive_path, user_id=user_id
         )
-        filename = await get_files(temp_path)
-        filename = filename[0]
-        cmd = ["tar", "-xvf", quote(filename), "-C", quote(path)]
-        result2 = await run_shell_cmds(" ".join(cmd))
-        result += result2
-        shutil.rmtree(temp_path)
-    elif archive_path.endswith((".tar.zst", ".zst", ".tzst")):
-        LOGGER.info(msg="zstd")
-        os.mkdir(path=path)
-        result = await __extract_with_zstd(path=path, archive_path=archive_path)
+
+        # Plain compressed file (ex a .gz that isn't a tarball), just decompress it
+        if any(err in result for err in NOT_A_TAR_MSGS):
+            LOGGER.info(msg="not a tarball")
+
+            if archive_path.endswith(zstd_extensions):
+                result = await __extract_with_zstd(
+                    path=path, archive_path=archive_path, user_id=user_id
+                )
+            else:
+                result = await __extract_with_7z_helper(
+                    path=path, archive_path=archive_path, user_id=user_id
+                )
     elif archive_path.endswith(".rar"):
         LOGGER.info(msg="rar")
 
         if password:
             result = await __extract_with_unrar_helper(
-                path=path, archive_path=archive_path, password=password
+                path=path, archive_path=archive_path, password=password, user_id=user_id
             )
         else:
             result = await __extract_with_unrar_helper(
-                path=path, archive_path=archive_path
+                path=path, archive_path=archive_path, user_id=user_id
             )
     else:
         LOGGER.info(msg="normal archive")
         result = await __extract_with_7z_helper(
-            path=path, archive_path=archive_path, password=password
+            path=path, archive_path=archive_path, password=password, user_id=user_id
+        )
+
+    return result
+
+
+# Main function to extract files
+async def extr_files(path, archive_path, password=None, user_id=None):
+    os.makedirs(name=path, exist_ok=True)
+    result = None
+
+    if Config.IN_PROCESS_EXTRACTION and not archive_path.endswith(zstd_extensions):
+        result = await __extract_with_engine(
+            path=path, archive_path=archive_path, password=password, user_id=user_id
+        )
+
+    if result is None:
+        result = await __extract_with_shell(
+            path=path, archive_path=archive_path, password=password, user_id=user_id
         )
 
-    LOGGER.info(msg=await get_files(path))
     await cleanup_macos_artifacts(path)
 
     return result
 
 
+def __parse_7z_listing(result):
+    # `7z l -slt` : the archive's own block, then one "Key = Value" block per entry
+    entries = []
+    _, _, body = result.partition("\n----------\n")
+
+    for block in body.split("\n\n"):
+        fields = dict(
+            line.split(" = ", maxsplit=1)
+            for line in block.splitlines()
+            if " = " in line
+        )
+
+        if "Path" in fields:
+            entries.append(
+                ArchiveEntry(
+                    name=fields["Path"],
+                    size=int(fields.get("Size") or 0),
+                    packed=int(fields["Packed Size"])
+                    if fields.get("Packed Size")
+                    else None,
+                    is_dir=fields.get("Folder") == "+"
+                    or "D" in fields.get("Attributes", ""),
+                )
+            )
+
+    return entries
+
+
+def __parse_unrar_listing(result):
+    # `unrar lt` : one "Key: Value" block per entry
+    entries = []
+
+    for block in result.split("\n\n"):
+        fields = dict(
+            (key.strip(), value.strip())
+            for key, _, value in (
+                line.partition(": ") for line in block.splitlines() if ": " in line
+            )
+        )
+
+        if "Name" in fields and "Type" in fields:
+            entries.append(
+                ArchiveEntry(
+                    name=fields["Name"],
+                    size=int(fields.get("Size") or 0),
+                    packed=int(fields["Packed size"])
+                    if fields.get("Packed size", "").isdigit()
+                    else None,
+                    is_dir=fields["Type"] == "Directory",
+                )
+            )
+
+    return entries
+
+
+def __is_junk(name):
+    return "__MACOSX/" in name or os.path.basename(name) == ".DS_Store"
+
+
+async def list_archive(archive_path, password=None):
+    """
+    List the files of an archive without extracting anything
+
+    :param archive_path: Path to the archive
+    :param password: Optional password
+    :return: ArchiveEntry list sorted by name, None if it can only be fully extracted
+    """
+    # Every file picked in a compressed tarball would decompress it from the start
+    if archive_path.endswith(zstd_extensions + tarball_extensions):
+        return None
+
+    entries = None
+    engine = (
+        open_archive(archive_path=archive_path, password=password)
+        if Config.IN_PROCESS_EXTRACTION
+        else None
+    )
+
+    if engine is not None:
+        try:
+            entries = await asyncio.to_thread(list, engine.iter_entries())
+        except ENGINE_ERRORS as e:
+            LOGGER.info(msg=f"{engine.name} can't list {archive_path} ({e})")
+        finally:
+            engine.close()
+
+    if entries is None:
+        pass_arg = [f"-p{quote(password)}"] if password else []
+
+        if archive_path.endswith(".rar"):
+            cmd = ["unrar", "lt", *pass_arg, quote(archive_path), "-y"]
+            entries = __parse_unrar_listing(await run_shell_cmds(" ".join(cmd)))
+        else:
+            cmd = ["7z", "l", "-slt", *pass_arg, quote(archive_path), "-y"]
+            entries = __parse_7z_listing(await run_shell_cmds(" ".join(cmd)))
+
+    if not entries:
+        return None
+
+    return sorted(
+        (entry for entry in entries if not entry.is_dir and not __is_junk(entry.name)),
+        key=lambda entry: entry.name,
+    )
+
+
+async def extract_entry(path, archive_path, entry, password=None, user_id=None):
+    """
+    Extract a single file of an archive listed by list_archive()
+
+    :param path: Directory to extract to
+    :param archive_path: Path to the archive
+    :param entry: The ArchiveEntry to extract
+    :param password: Optional password
+    :param user_id: The user's ID, checked for cancellation
+    :return: Path of the extracted file, None if it was cancelled or failed
+    """
+    target = os.path.join(path, entry.name)
+    os.makedirs(name=path, exist_ok=True)
+
+    # Entries listed in-process carry their engine's handle
+    if entry.ref is not None:
+        engine = open_archive(archive_path=archive_path, password=password)
+
+        try:
+            await extract_member(engine=engine, entry=entry, path=path, user_id=user_id)
+
+            return target
+        except ExtractionCancelled:
+            await acknowledge_cancel(user_id)
+
+            return None
+        except ENGINE_ERRORS as e:
+            LOGGER.info(msg=f"{engine.name} failed ({e}), falling back")
+        finally:
+            engine.close()
+
+    pass_arg = [f"-p{quote(password)}"] if password else []
+
+    if archive_path.endswith(".rar"):
+        cmd = ["unrar", "x", "-y", *pass_arg, quote(archive_path), quote(entry.name)]
+        cmd.append(quote(path + "/"))
+    else:
+        # -spd : the name is a path, not a wildcard
+        cmd = ["7z", "x", f"-o{quote(path)}", "-spd", "-y", *pass_arg, "--"]
+        cmd += [quote(archive_path), quote(entry.name)]
+
+    output = await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
+
+    if any(err in output for err in ERROR_MSGS) or not os.path.isfile(target):
+        # Don't send what a failed extraction left behind
+        if os.path.isfile(target):
+            os.remove(path=target)
+
+        return None
+
+    return target
+
+
+async def extract_remaining(path, archive_path, names, password=None, user_id=None):
+    """
+    Extract the listed files not sent yet, yielding each one as soon as it's written
+
+    :param names: Names (inside the archive) of the files to extract
+    :return: Async generator of the extracted file paths
+    """
+    engine = None
+
+    if Config.IN_PROCESS_EXTRACTION and not archive_path.endswith(zstd_extensions):
+        engine = open_archive(archive_path=archive_path, password=password)
+
+    root = os.path.realpath(path)
+    names = set(names)
+
+    if engine is not None:
+        LOGGER.info(msg=f"{engine.name} : " + archive_path + " : " + path)
+
+        try:
+            async for target in extract_entries(
+                engine=engine, path=path, user_id=user_id, names=names
+            ):
+                names.discard(os.path.relpath(target, root))
+
+                yield target
+
+            return
+        except ENGINE_ERRORS as e:
+            LOGGER.info(msg=f"{engine.name} failed ({e}), falling back")
+
+    await __extract_with_shell(
+        path=path, archive_path=archive_path, password=password, user_id=user_id
+    )
+
+    for target in await get_files(path):
+        if os.path.relpath(os.path.realpath(target), root) in names:
+            yield target
+        else:
+            os.remove(path=target)
+
+
 # Split files
-async def split_files(iinput, ooutput, size):
+async def split_files(iinput, ooutput, size, user_id=None):
+    if Config.SPLIT_RANGES:
+        # The parts are read straight from the file when they're uploaded
+        return split_ranges(path=iinput, size=size)
+
     temp_location = iinput + "_temp"
     shutil.move(src=iinput, dst=temp_location)
     cmd = [
@@ -194,27 +575,218 @@ async def split_files(iinput, ooutput, size):
         quote(temp_location),
         f"-v{size}b",
     ]
-    await run_shell_cmds(" ".join(cmd))
+    await run_shell_cmds(command=" ".join(cmd), user_id=user_id)
     spdir = ooutput.replace("/" + ooutput.split("/")[-1], "")
     files = await get_files(spdir)
 
     return files
 
 
+# Split files, each part is handed over as soon as it's written
+async def stream_split_files(iinput, ooutput, size, user_id=None):
+    """
+    Like split_files, but the parts are uploaded while 7z writes the next ones
+
+    7z is paused while Config.SPLIT_AHEAD parts are waiting on the disk, the caller
+    deletes each part once it's uploaded (send_file does). The first part comes last,
+    7z writes the sizes and CRC in its header once everything else is done
+
+    :return: Async generator of the parts, in order
+    :raises SplitFailed: If 7z fails, iinput is put back so the split can be retried
+    """
+    if Config.SPLIT_RANGES:
+        for part in split_ranges(path=iinput, size=size):
+            yield part
+
+        return
+
+    temp_location = iinput + "_temp"
+    shutil.move(src=iinput, dst=temp_location)
+    spdir = os.path.dirname(ooutput)
+    cmd = [
+        "7z",
+        "a",
+        "-tzip",
+        "-mx=0",
+        quote(ooutput),
+        quote(temp_location),
+        f"-v{size}b",
+    ]
+    # Storing costs little CPU, and cpulimit would resume a 7z paused by throttle()
+    process = await create_subprocess_shell(
+        cmd=__limited(" ".join(cmd), cpu=False),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        executable="/bin/bash",
+        start_new_session=True,
+    )
+    LOGGER.info(msg=f"command : {' '.join(cmd)}")
+    first = f"{os.path.basename(ooutput)}.001"
+    handed = set()
+
+    def signal_7z(sig):
+        try:
+            os.kill(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    # Runs while the parts are uploaded, when the generator itself is suspended
+    async def throttle():
+        paused = False
+
+        while process.returncode is None:
+            waiting = len([name for name in os.listdir(spdir) if name != first])
+
+            if not paused and waiting > Config.SPLIT_AHEAD:
+                signal_7z(signal.SIGSTOP)
+                paused = True
+            elif paused and waiting <= Config.SPLIT_AHEAD:
+                signal_7z(signal.SIGCONT)
+                paused = False
+
+            await asyncio.sleep(0.5)
+
+    throttler = asyncio.ensure_future(throttle())
+
+    try:
+        while True:
+            finished = process.returncode is not None
+            volumes = sorted(name for name in os.listdir(spdir) if name not in handed)
+            # The last volume is still being written until 7z exits, and the first
+            # one is patched at the end
+            ready = volumes if finished else volumes[:-1]
+
+            if not finished:
+                ready = [name for name in ready if name != first]
+
+            if finished and process.returncode != 0:
+                shutil.move(src=temp_location, dst=iinput)
+
+                raise SplitFailed(f"7z exited with {process.returncode} : {ooutput}")
+
+            for name in ready:
+                handed.add(name)
+
+                yield f"{spdir}/{name}"
+
+            if finished:
+                return
+
+            if user_id is not None and cancel_registry.is_cancelled(user_id):
+                return
+
+            await asyncio.sleep(0.5)
+    finally:
+        throttler.cancel()
+
+        if process.returncode is None:
+            signal_7z(signal.SIGKILL)
+            await process.wait()
+
+        try:
+            os.remove(path=temp_location)
+        except FileNotFoundError:
+            pass
+
+
 # Merge files
-async def merge_files(iinput, ooutput, file_type, password=None):
+async def merge_files(
+    iinput, ooutput, file_type, password=None, user_id=None, volumes=None
+):
+    """
+    :param volumes: Every volume of the set in order, the in-process engines read
+    them as one file, without a merged copy (7z / unrar find them by themselves)
+    """
+    if Config.IN_PROCESS_EXTRACTION and volumes and file_type in ("volume", "zip"):
+        reader = VolumeReader(paths=volumes, spanned=file_type == "zip")
+
+        try:
+            result = await __extract_with_engine(
+                path=ooutput, archive_path=reader, password=password, user_id=user_id
+            )
+        finally:
+            reader.close()
+
+        if result is not None:
+            return result
+
     if file_type == "volume":
         result = await __extract_with_7z_helper(
-            path=ooutput, archive_path=iinput, password=password
+            path=ooutput, archive_path=iinput, password=password, user_id=user_id
+        )
+    elif file_type == "zip":
+        # 7z opens spanned zips from their last volume, the .zip
+        result = await __extract_with_7z_helper(
+            path=ooutput,
+            archive_path=volumes[-1] if volumes else iinput,
+            password=password,
+            user_id=user_id,
         )
     elif file_type == "rar":
         result = await __extract_with_unrar_helper(
-            path=ooutput, archive_path=iinput, password=password
+            path=ooutput, archive_path=iinput, password=password, user_id=user_id
         )
 
     return result
 
 
+async def stream_merge(volumes, sizes, download, ooutput, file_type, user_id=None):
+    """
+    Extract a split zip / tar while its volumes are downloading, each file coming
+    out as soon as the volumes holding it are complete
+
+    :param volumes: Paths the volumes are downloaded to, in order
+    :param sizes: Size of each volume (in bytes)
+    :param download: Coroutine function downloading the volumes (in order), awaited
+    with a callback to call with the index of each volume that is complete
+    :param file_type: "volume" or "zip", as found by find_lowest_sequence_file()
+    :return: Async generator of the extracted file paths, raising one of
+    ENGINE_ERRORS (once every volume is there) if only merge_files() can extract it
+    """
+    reader = VolumeReader(
+        paths=volumes,
+        spanned=file_type == "zip",
+        sizes=sizes,
+        timeout=Config.MERGE_STREAM_TIMEOUT,
+    )
+
+    async def fetch():
+        try:
+            await download(reader.volume_ready)
+        finally:
+            # Nothing else is coming, a failed download must not leave reads waiting
+            reader.abort()
+
+    downloads = asyncio.create_task(fetch())
+
+    try:
+        loop = asyncio.get_running_loop()
+        engine = await loop.run_in_executor(volume_executor, open_stream, reader)
+
+        if engine is None:
+            raise UnsupportedArchive("The archive needs random access")
+
+        LOGGER.info(msg=f"{engine.name} : " + volumes[0] + " : " + ooutput)
+
+        async for target in extract_entries(
+            engine=engine, path=ooutput, user_id=user_id, executor=volume_executor
+        ):
+            yield target
+
+        await downloads
+    except ENGINE_ERRORS:
+        # A failed download is the real cause, else the volumes are kept for 7z
+        await downloads
+
+        raise
+    finally:
+        if not downloads.done():
+            downloads.cancel()
+            await asyncio.gather(downloads, return_exceptions=True)
+
+        reader.close()
+
+
 # Make keyboard
 async def make_keyboard(paths, user_id, chat_id, unziphttp, rzfile=None):
     num = 0
@@ -0,0 +1,89 @@
+import io
+import os
+
+
+class FileRange(io.RawIOBase):
+    def __init__(self, source, offset, size, path):
+        """
+        Read-only view of a part of a file, uploaded without being copied
+
+        :param source: The file it is read from
+        :param offset: Where the part starts in it (in bytes)
+        :param size: Size of the part (in bytes)
+        :param path: Name it's uploaded as, ex "/…/video.mkv.001"
+        """
+        super().__init__()
+        self.source = source
+        self.offset = offset
+        self.size = size
+        self.path = path
+        self.name = os.path.basename(path)  # Pyrogram uses it as the file name
+        self.position = 0
+        self.fd = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        self.position = max(0, min(offset, self.size))
+
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+
+        if length <= 0:
+            return 0
+
+        # Opened on the first read, so that parts waiting their turn hold nothing
+        if self.fd is None:
+            self.fd = os.open(self.source, os.O_RDONLY)
+
+        with memoryview(buffer) as view:
+            read = os.preadv(self.fd, [view[:length]], self.offset + self.position)
+
+        self.position += read
+
+        return read
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+        super().close()
+
+
+def split_ranges(path, size):
+    """
+    Cut a file in parts of at most `size` bytes, without writing anything
+
+    The parts are named like 7-Zip's split volumes (.001, .002, …), they can be
+    joined with `cat file.* > file` or by opening the .001 with 7-Zip
+
+    :param path: The file to split
+    :param size: Maximum size of a part (in bytes)
+    :return: List of FileRange, in order
+    """
+    total = os.stat(path).st_size
+
+    return [
+        FileRange(
+            source=path,
+            offset=offset,
+            size=min(size, total - offset),
+            path=f"{path}.{number:03d}",
+        )
+        for number, offset in enumerate(range(0, total, size), start=1)
+    ]
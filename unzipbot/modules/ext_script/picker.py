@@ -0,0 +1,342 @@
+import os
+import re
+import sys
+
+from pykeyboard import InlineKeyboard
+from pyrogram.types import InlineKeyboardButton
+
+from config import Config
+from unzipbot.helpers.database import get_lang
+from unzipbot.helpers.unzip_help import humanbytes
+from unzipbot.i18n.messages import Messages
+
+messages = Messages(lang_fetcher=get_lang)
+
+size_filter_pattern = r"^([<>])(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?$"
+size_units = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+class IndexEntry:
+    __slots__ = ("id", "name", "size", "parent", "ref")
+
+    def __init__(self, id, name, size, parent, ref=None):
+        """
+        A file of a task, as shown in the picker
+
+        :param id: Stable ID, used in the callback data
+        :param name: Path relative to the extraction directory (interned)
+        :param size: Size (in bytes)
+        :param parent: ID of the directory holding it
+        :param ref: ArchiveEntry to extract it from, None if already on disk
+        """
+        self.id = id
+        self.name = name
+        self.size = size
+        self.parent = parent
+        self.ref = ref
+
+
+class FileIndex:
+    def __init__(self):
+        """
+        Files of a task grouped by directory, updated as they are sent
+        """
+        self.entries = {}
+        self.names = {}  # path relative to the extraction directory → ID
+        self.next_id = 0  # IDs aren't reused, old buttons must not point elsewhere
+        self.dirs = [""]  # directory ID → path, 0 is the root
+        self.dir_ids = {"": 0}
+        self.dir_parents = [None]
+        self.subdirs = [[]]
+        self.files = [[]]
+        self.counts = [0]  # files left under each directory, recursively
+        self.directory = 0
+        self.page = 0
+        self.extensions = None
+        self.min_size = None
+        self.max_size = None
+        self.view = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __dir_id(self, path):
+        if path in self.dir_ids:
+            return self.dir_ids[path]
+
+        path = sys.intern(path)
+        parent = self.__dir_id(os.path.dirname(path))
+        dir_id = len(self.dirs)
+        self.dirs.append(path)
+        self.dir_ids[path] = dir_id
+        self.dir_parents.append(parent)
+        self.subdirs.append([])
+        self.files.append([])
+        self.counts.append(0)
+        self.subdirs[parent].append(dir_id)
+
+        return dir_id
+
+    def add(self, name, size, ref=None):
+        name = sys.intern(name)
+        parent = self.__dir_id(os.path.dirname(name))
+        entry = IndexEntry(
+            id=self.next_id, name=name, size=size, parent=parent, ref=ref
+        )
+        self.next_id += 1
+        self.entries[entry.id] = entry
+        self.names[name] = entry.id
+        self.files[parent].append(entry.id)
+        dir_id = parent
+
+        while dir_id is not None:
+            self.counts[dir_id] += 1
+            dir_id = self.dir_parents[dir_id]
+
+        self.view = None
+
+        return entry
+
+    def get(self, entry_id):
+        return self.entries.get(int(entry_id))
+
+    def find(self, name):
+        entry_id = self.names.get(name)
+
+        return self.entries.get(entry_id) if entry_id is not None else None
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(int(entry_id), None)
+
+        if entry is None:
+            return None
+
+        del self.names[entry.name]
+        self.files[entry.parent].remove(entry.id)
+        dir_id = entry.parent
+
+        while dir_id is not None:
+            self.counts[dir_id] -= 1
+            dir_id = self.dir_parents[dir_id]
+
+        self.view = None
+
+        return entry
+
+    def values(self):
+        return list(self.entries.values())
+
+    def total_size(self):
+        return sum(entry.size for entry in self.entries.values())
+
+    def filtered(self):
+        return self.extensions is not None or self.min_size or self.max_size
+
+    def __matches(self, entry):
+        if self.extensions is not None:
+            extension = os.path.splitext(entry.name)[1].lstrip(".").casefold()
+
+            if extension not in self.extensions:
+                return False
+
+        if self.min_size and entry.size < self.min_size:
+            return False
+
+        return not self.max_size or entry.size <= self.max_size
+
+    def items(self):
+        """
+        What the picker currently shows, rebuilt only after a change
+
+        :return: List of ("dir", directory ID) and ("file", IndexEntry)
+        """
+        if self.view is None:
+            if self.filtered():
+                # A filter searches the whole archive, folders don't matter anymore
+                self.view = [
+                    ("file", entry)
+                    for entry in self.entries.values()
+                    if self.__matches(entry)
+                ]
+            else:
+                self.view = [
+                    ("dir", dir_id)
+                    for dir_id in self.subdirs[self.directory]
+                    if self.counts[dir_id]
+                ] + [
+                    ("file", self.entries[entry_id])
+                    for entry_id in self.files[self.directory]
+                ]
+
+        return self.view
+
+    def pages(self):
+        return max(1, -(-len(self.items()) // Config.PICKER_PAGE_SIZE))
+
+    def open(self, dir_id):
+        self.directory = dir_id if 0 <= dir_id < len(self.dirs) else 0
+        self.page = 0
+        self.view = None
+
+    def set_filter(self, text):
+        """
+        Only show some files, ex "mp4 mkv", ">100MB", "pdf <2MB", "all" shows everything
+
+        :param text: What the user sent
+        :return: False if nothing in it could be understood
+        """
+        extensions = set()
+        min_size = max_size = None
+
+        for token in text.casefold().split():
+            match = re.match(pattern=size_filter_pattern, string=token)
+
+            if token in ("all", "*"):
+                extensions, min_size, max_size = set(), None, None
+            elif match:
+                size = int(float(match.group(2)) * size_units[match.group(3)])
+
+                if match.group(1) == ">":
+                    min_size = size
+                else:
+                    max_size = size
+            elif re.match(pattern=r"^\.?[\w-]+$", string=token):
+                extensions.add(token.lstrip("."))
+            else:
+                return False
+
+        self.extensions = extensions or None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.page = 0
+        self.view = None
+
+        return True
+
+
+def build_index(names_sizes, refs=None):
+    """
+    :param names_sizes: Iterable of (path relative to the extraction dir, size)
+    :param refs: ArchiveEntry of each file, when they're still in the archive
+    :return: A FileIndex holding all of them
+    """
+    index = FileIndex()
+
+    for position, (name, size) in enumerate(names_sizes):
+        index.add(name=name, size=size, ref=refs[position] if refs else None)
+
+    return index
+
+
+def __scan(path, prefix=""):
+    with os.scandir(path) as it:
+        for item in sorted(it, key=lambda item: item.name):
+            name = f"{prefix}{item.name}"
+
+            if item.is_dir(follow_symlinks=False):
+                yield from __scan(path=item.path, prefix=f"{name}/")
+            elif item.is_file():
+                yield name, item.stat().st_size
+
+
+def index_directory(path):
+    """
+    Index what was extracted, in a single walk of the tree
+
+    :param path: The extraction directory
+    :return: A FileIndex of the files under it (empty if it doesn't exist)
+    """
+    if not os.path.isdir(path):
+        return FileIndex()
+
+    return build_index(__scan(path=path))
+
+
+# Names that aren't valid UTF-8 would make Telegram refuse the whole keyboard
+def __label(text):
+    return text.encode(encoding="utf-8", errors="surrogateescape").decode(
+        encoding="utf-8", errors="replace"
+    )
+
+
+# Only the current page is rendered, whatever the size of the archive
+async def make_picker(index, user_id, chat_id):
+    i_kbd = InlineKeyboard(row_width=1)
+    pages = index.pages()
+    index.page = min(index.page, pages - 1)
+    start = index.page * Config.PICKER_PAGE_SIZE
+    data = [
+        InlineKeyboardButton(
+            text=messages.get(file="ext_helper", key="UP_ALL", user_id=user_id),
+            callback_data=f"ext_a|{user_id}|{chat_id}|False",
+        ),
+        InlineKeyboardButton(
+            text=messages.get(file="ext_helper", key="CANCEL_IT", user_id=user_id),
+            callback_data="cancel_dis",
+        ),
+    ]
+
+    for kind, item in index.items()[start : start + Config.PICKER_PAGE_SIZE]:
+        if kind == "dir":
+            dir_name = os.path.basename(index.dirs[item])
+            data.append(
+                InlineKeyboardButton(
+                    text=__label(f"📁 {dir_name} ({index.counts[item]})"),
+                    callback_data=f"ext_d|{user_id}|{chat_id}|{item}",
+                )
+            )
+        else:
+            data.append(
+                InlineKeyboardButton(
+                    text=__label(
+                        f"{os.path.basename(item.name)} ({humanbytes(item.size)})"
+                    ),
+                    callback_data=f"ext_f|{user_id}|{chat_id}|{item.id}|False",
+                )
+            )
+
+    i_kbd.add(*data)
+    navigation = []
+
+    if index.page > 0:
+        navigation.append(
+            InlineKeyboardButton(
+                text="◀️", callback_data=f"ext_p|{user_id}|{chat_id}|{index.page - 1}"
+            )
+        )
+
+    navigation.append(
+        InlineKeyboardButton(
+            text=f"{index.page + 1}/{pages}",
+            callback_data=f"ext_p|{user_id}|{chat_id}|{index.page}",
+        )
+    )
+
+    if index.page < pages - 1:
+        navigation.append(
+            InlineKeyboardButton(
+                text="▶️", callback_data=f"ext_p|{user_id}|{chat_id}|{index.page + 1}"
+            )
+        )
+
+    i_kbd.row(*navigation)
+    tools = [
+        InlineKeyboardButton(
+            text=messages.get(file="ext_helper", key="FILTER", user_id=user_id),
+            callback_data=f"ext_s|{user_id}|{chat_id}",
+        )
+    ]
+
+    if index.directory != 0 and not index.filtered():
+        tools.insert(
+            0,
+            InlineKeyboardButton(
+                text=messages.get(file="ext_helper", key="PARENT_DIR", user_id=user_id),
+                callback_data=f"ext_d|{user_id}|{chat_id}|"
+                f"{index.dir_parents[index.directory]}",
+            ),
+        )
+
+    i_kbd.row(*tools)
+
+    return i_kbd
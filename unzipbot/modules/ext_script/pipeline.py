@@ -0,0 +1,99 @@
+import asyncio
+
+from config import Config
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+# Lets the items of a pipeline through one at a time, in the order they were produced
+class Turnstile:
+    def __init__(self):
+        self.next = 0
+        self.finished = set()
+        self.condition = asyncio.Condition()
+
+    async def wait(self, index):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.next == index)
+
+    async def done(self, index):
+        async with self.condition:
+            self.finished.add(index)
+
+            while self.next in self.finished:
+                self.finished.remove(self.next)
+                self.next += 1
+
+            self.condition.notify_all()
+
+
+def upload_workers(client):
+    # More workers than the client allows transmissions would only queue in pyrogram
+    limit = getattr(client, "max_concurrent_transmissions", None) or 1
+
+    return max(1, min(Config.UPLOAD_WORKERS, limit))
+
+
+def download_workers(client):
+    limit = getattr(client, "max_concurrent_transmissions", None) or 1
+
+    return max(1, min(Config.MERGE_DL_WORKERS, limit))
+
+
+async def run_pipeline(source, handler, workers=1, queue_size=None, turnstile=None):
+    """
+    Feed the items of an async iterable to concurrent workers through a bounded queue
+
+    :param source: Async iterable producing the items (ex extract_entries())
+    :param handler: Coroutine function awaited with (index, item) for each item
+    :param workers: Number of items handled at the same time
+    :param queue_size: Items the source may produce ahead of the workers
+    :param turnstile: Turnstile told about every handled item, so that handlers can
+    wait for their turn before delivering anything
+    :return: Number of items produced
+    """
+    queue = asyncio.Queue(maxsize=queue_size or Config.UPLOAD_QUEUE_SIZE)
+    produced = 0
+
+    async def produce():
+        nonlocal produced
+
+        async for item in source:
+            await queue.put((produced, item))
+            produced += 1
+
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume():
+        while True:
+            job = await queue.get()
+
+            if job is None:
+                return
+
+            try:
+                await handler(*job)
+            finally:
+                if turnstile is not None:
+                    await turnstile.done(job[0])
+
+    tasks = [asyncio.create_task(produce())] + [
+        asyncio.create_task(consume()) for _ in range(workers)
+    ]
+
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return produced
@@ -12,6 +12,7 @@ from pyrogram.errors import (
     FloodWait,
     PhotoExtInvalid,
     PhotoSaveFileInvalid,
+    RPCError,
 )
 
 from config import Config
@@ -25,6 +26,7 @@ from unzipbot.helpers.unzip_help import (
 from unzipbot.i18n.messages import Messages
 from unzipbot.modules.ext_script.custom_thumbnail import thumb_exists
 from unzipbot.modules.ext_script.ext_helper import run_shell_cmds
+from unzipbot.modules.ext_script.file_range import FileRange
 from unzipbot.modules.ext_script.metadata_helper import get_audio_metadata
 
 messages = Messages(lang_fetcher=get_lang)
@@ -41,8 +43,34 @@ async def get_size(doc_f):
 
 
 # Send file to a user
-async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
-    fsize = await get_size(doc_f)
+async def send_file(
+    unzip_bot,
+    c_id,
+    doc_f,
+    query,
+    full_path,
+    log_msg,
+    split,
+    progress=None,
+    progress_args=(),
+    attempt=1,
+):
+    """
+    Upload a file to a user, then delete it
+
+    :param doc_f: Path of the file, or a FileRange of a bigger one (kept on disk)
+    :param progress: Shared progress callback (ex UploadProgress.update), the file
+    gets its own progress message when omitted
+    :param progress_args: Extra arguments given to the progress callback
+    :param attempt: Number of the current try, up to Config.UPLOAD_RETRIES
+    """
+    part = doc_f if isinstance(doc_f, FileRange) else None
+
+    if part is not None:
+        doc_f = part.path
+        fsize = part.size
+    else:
+        fsize = await get_size(doc_f)
 
     if fsize in (-1, 0):  # File not found or empty
         try:
@@ -60,27 +88,40 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
 
         return
 
+    upmsg = None
+
     try:
         ul_mode = await get_upload_mode(c_id)
         fname = os.sep.join(os.path.abspath(doc_f).split(os.sep)[5:])
         fext = (pathlib.Path(os.path.abspath(doc_f)).suffix).casefold().replace(".", "")
         thumbornot = await thumb_exists(c_id)
 
-        if fsize > Config.MIN_SIZE_PROGRESS:
-            upmsg = await unzipbot_client.send_message(
-                chat_id=c_id,
-                text=messages.get(file="up_helper", key="PROCESSING2", user_id=c_id),
-                disable_notification=True,
+        if progress is None:
+            if fsize > Config.MIN_SIZE_PROGRESS:
+                upmsg = await unzipbot_client.send_message(
+                    chat_id=c_id,
+                    text=messages.get(
+                        file="up_helper", key="PROCESSING2", user_id=c_id
+                    ),
+                    disable_notification=True,
+                )
+
+            progress = progress_for_pyrogram
+            progress_args = (
+                messages.get(
+                    file="up_helper", key="TRY_UP", user_id=c_id, extra_args=fname
+                ),
+                upmsg,
+                time(),
+                unzip_bot,
             )
-        else:
-            upmsg = None
 
         if ul_mode == "media" and fext in extentions_list["audio"]:
             metadata = await get_audio_metadata(doc_f)
 
             if thumbornot:
                 thumb_image = Config.THUMB_LOCATION + "/" + str(c_id) + ".jpg"
-                await unzip_bot.send_audio(
+                sent = await unzip_bot.send_audio(
                     chat_id=c_id,
                     audio=doc_f,
                     caption=messages.get(
@@ -94,21 +135,11 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     title=metadata["title"],
                     thumb=thumb_image,
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
             else:
-                await unzip_bot.send_audio(
+                sent = await unzip_bot.send_audio(
                     chat_id=c_id,
                     audio=doc_f,
                     caption=messages.get(
@@ -121,24 +152,14 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     performer=metadata["performer"],
                     title=metadata["title"],
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
 
         elif ul_mode == "media" and fext in extentions_list["photo"]:
             # impossible to use a thumb here :(
             try:
-                await unzip_bot.send_photo(
+                sent = await unzip_bot.send_photo(
                     chat_id=c_id,
                     photo=doc_f,
                     caption=messages.get(
@@ -148,23 +169,13 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                         extra_args=fname,
                     ),
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
             except (PhotoExtInvalid, PhotoSaveFileInvalid):
                 if thumbornot:
                     thumb_image = Config.THUMB_LOCATION + "/" + str(c_id) + ".jpg"
-                    await unzip_bot.send_document(
+                    sent = await unzip_bot.send_document(
                         chat_id=c_id,
                         document=doc_f,
                         thumb=thumb_image,
@@ -176,21 +187,11 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                         ),
                         force_document=True,
                         disable_notification=True,
-                        progress=progress_for_pyrogram,
-                        progress_args=(
-                            messages.get(
-                                file="up_helper",
-                                key="TRY_UP",
-                                user_id=c_id,
-                                extra_args=fname,
-                            ),
-                            upmsg,
-                            time(),
-                            unzip_bot,
-                        ),
+                        progress=progress,
+                        progress_args=progress_args,
                     )
                 else:
-                    await unzip_bot.send_document(
+                    sent = await unzip_bot.send_document(
                         chat_id=c_id,
                         document=doc_f,
                         caption=messages.get(
@@ -201,18 +202,8 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                         ),
                         force_document=True,
                         disable_notification=True,
-                        progress=progress_for_pyrogram,
-                        progress_args=(
-                            messages.get(
-                                file="up_helper",
-                                key="TRY_UP",
-                                user_id=c_id,
-                                extra_args=fname,
-                            ),
-                            upmsg,
-                            time(),
-                            unzip_bot,
-                        ),
+                        progress=progress,
+                        progress_args=progress_args,
                     )
 
         elif ul_mode == "media" and fext in extentions_list["video"]:
@@ -231,7 +222,7 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
 
             if thumbornot:
                 thumb_image = Config.THUMB_LOCATION + "/" + str(c_id) + ".jpg"
-                await unzip_bot.send_video(
+                sent = await unzip_bot.send_video(
                     chat_id=c_id,
                     video=doc_f,
                     caption=messages.get(
@@ -243,18 +234,8 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     duration=vid_duration,
                     thumb=thumb_image,
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
             else:
                 thmb_pth = (
@@ -294,7 +275,7 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                 if not os.path.exists(thmb_pth):
                     shutil.copy(src=Config.BOT_THUMB, dst=thmb_pth)
 
-                await unzip_bot.send_video(
+                sent = await unzip_bot.send_video(
                     chat_id=c_id,
                     video=doc_f,
                     caption=messages.get(
@@ -306,18 +287,8 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     duration=vid_duration,
                     thumb=thmb_pth,
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
 
                 try:
@@ -328,9 +299,9 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
         else:
             if thumbornot:
                 thumb_image = Config.THUMB_LOCATION + "/" + str(c_id) + ".jpg"
-                await unzip_bot.send_document(
+                sent = await unzip_bot.send_document(
                     chat_id=c_id,
-                    document=doc_f,
+                    document=doc_f if part is None else part,
                     thumb=thumb_image,
                     caption=messages.get(
                         file="up_helper",
@@ -340,23 +311,13 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     ),
                     force_document=True,
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
             else:
-                await unzip_bot.send_document(
+                sent = await unzip_bot.send_document(
                     chat_id=c_id,
-                    document=doc_f,
+                    document=doc_f if part is None else part,
                     caption=messages.get(
                         file="up_helper",
                         key="EXT_CAPTION",
@@ -365,34 +326,33 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
                     ),
                     force_document=True,
                     disable_notification=True,
-                    progress=progress_for_pyrogram,
-                    progress_args=(
-                        messages.get(
-                            file="up_helper",
-                            key="TRY_UP",
-                            user_id=c_id,
-                            extra_args=fname,
-                        ),
-                        upmsg,
-                        time(),
-                        unzip_bot,
-                    ),
+                    progress=progress,
+                    progress_args=progress_args,
                 )
 
         if upmsg:
             await upmsg.delete()
 
-        os.remove(path=doc_f)
+        if part is None:
+            os.remove(path=doc_f)
+        else:
+            part.close()
+
+        return sent
     except (FloodWait, FloodPremiumWait) as f:
         await asyncio.sleep(f.value)
-        await send_file(
+
+        return await send_file(
             unzip_bot=unzip_bot,
             c_id=c_id,
-            doc_f=doc_f,
+            doc_f=doc_f if part is None else part,
             query=query,
             full_path=full_path,
             log_msg=log_msg,
             split=split,
+            progress=None if upmsg else progress,
+            progress_args=() if upmsg else progress_args,
+            attempt=attempt,
         )
     except FileNotFoundError:
         try:
@@ -409,9 +369,89 @@ async def send_file(unzip_bot, c_id, doc_f, query, full_path, log_msg, split):
             pass
 
         return
+    except asyncio.CancelledError:
+        raise
     except BaseException as e:
+        if upmsg:
+            try:
+                await upmsg.delete()
+            except RPCError:
+                pass
+
+        if attempt < Config.UPLOAD_RETRIES:
+            LOGGER.warning(msg=f"Upload of {doc_f} failed ({e}), retrying")
+            await asyncio.sleep(min(2 ** (attempt - 1), 30))
+
+            return await send_file(
+                unzip_bot=unzip_bot,
+                c_id=c_id,
+                doc_f=doc_f if part is None else part,
+                query=query,
+                full_path=full_path,
+                log_msg=log_msg,
+                split=split,
+                progress=None if upmsg else progress,
+                progress_args=() if upmsg else progress_args,
+                attempt=attempt + 1,
+            )
+
+        # Only this file is given up on, the others of the task may still be uploading
         LOGGER.error(msg=e)
-        shutil.rmtree(full_path)
+
+        try:
+            if part is None:
+                os.remove(path=doc_f)
+            else:
+                part.close()
+
+            await unzipbot_client.send_message(
+                chat_id=c_id,
+                text=messages.get(
+                    file="up_helper",
+                    key="UPLOAD_FAILED",
+                    user_id=c_id,
+                    extra_args=[os.path.basename(doc_f), attempt],
+                ),
+            )
+        except RPCError as e:
+            LOGGER.warning(msg=e)
+
+
+# Send again the files of an archive from their Telegram file IDs, nothing is uploaded
+async def send_cached_files(unzip_bot, c_id, cached):
+    """
+    :param cached: A CachedArchive of the archive cache
+    :return: Number of files sent, or None if a file ID can't be used anymore
+    """
+    sent = 0
+
+    for path, (_, file_ids) in cached.files.items():
+        for file_id in file_ids:
+            while True:
+                try:
+                    await unzip_bot.send_cached_media(
+                        chat_id=c_id,
+                        file_id=file_id,
+                        caption=messages.get(
+                            file="up_helper",
+                            key="EXT_CAPTION",
+                            user_id=c_id,
+                            extra_args=path,
+                        ),
+                        disable_notification=True,
+                    )
+
+                    break
+                except (FloodWait, FloodPremiumWait) as f:
+                    await asyncio.sleep(f.value)
+                except Exception as e:
+                    LOGGER.error(msg=e)
+
+                    return None
+
+            sent += 1
+
+    return sent
 
 
 async def forward_file(message, cid):
@@ -472,11 +512,6 @@ async def send_url_logs(unzip_bot, c_id, doc_f, source, message):
         pass
 
 
-async def merge_split_archives(user_id, path):
-    cmd = f'cd "{path}" && cat * > MERGED_{user_id}.zip'
-    await run_shell_cmds(cmd)
-
-
 # Function to remove basic markdown characters from a string
 async def rm_mark_chars(text: str):
     return re.sub(pattern="[*`_]", repl="", string=text)